@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import os, sys, shutil, subprocess, pathlib, signal, shlex, threading, webbrowser, csv
+import os, sys, shutil, subprocess, pathlib, shlex, threading, webbrowser, csv
+import json, hashlib, time, fnmatch, tarfile, gzip, re, random, mmap
+from collections import deque
+from collections.abc import MutableMapping
+from queue import Queue, Empty
+from array import array
+from itertools import islice, chain, zip_longest
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from NB_PIPELINE_COMMON import (output_mux, watchdog, verify_inputs, RunTimer,
+                                ledger_record, show_ledger_window, RuntimePredictor, fmt_duration,
+                                exec_policy, show_policy_window, PAIR_REGEX, raw_tell, process_pool)
+try:
+    import numpy as np
+except ImportError:  # numpy vem do env (installer); sem ele as estatísticas usam listas puras
+    np = None
 
 ENV_NAME = "NB_HCPA_Workflow"
 
@@ -43,6 +57,1296 @@ BASE_DIR = Path(__file__).resolve().parent
 ASSEMBLY_DIR = BASE_DIR / "assembly_output"
 ASSEMBLY_DIR.mkdir(parents=True, exist_ok=True)
 
+# ---------------------------
+# Manifesto / cache de montagens
+# ---------------------------
+# Cada assembly_output/<sample>[_vN] recebe um nb_manifest.json com a impressão
+# digital (fingerprint) das entradas + parâmetros normalizados do job.
+#    - Mesmo fingerprint com status "ok" e saída final presente -> cache (não remonta).
+#    - Parâmetros/entradas diferentes -> nova pasta versionada (<sample>_v2, _v3, ...),
+#      sem sobrescrever a montagem anterior.
+#    - Pastas antigas sem manifesto são preservadas (também geram nova versão).
+MANIFEST_NAME = "nb_manifest.json"
+MANIFEST_VERSION = 1
+
+# Campos que não alteram o resultado da montagem (não entram no fingerprint)
+_FINGERPRINT_IGNORE = ("sample", "threads", "resume", "compact", "priority",
+                       "spades_memory", "max_retries", "attempt", "max_runtime_min", "idle_timeout_min")
+_INPUT_FIELDS = ("r1", "r2", "se", "long")
+_SAMPLE_BYTES = 1 << 20   # 1 MiB do início e do fim de cada entrada
+
+
+def _file_fingerprint(path: str) -> dict:
+    """Fingerprint barato de um arquivo: caminho, tamanho, mtime e SHA1 de início/fim."""
+    p = Path(path).expanduser().resolve()
+    st = p.stat()
+    h = hashlib.sha1()
+    with open(p, "rb") as fh:
+        h.update(fh.read(_SAMPLE_BYTES))
+        if st.st_size > 2 * _SAMPLE_BYTES:
+            fh.seek(-_SAMPLE_BYTES, os.SEEK_END)
+            h.update(fh.read(_SAMPLE_BYTES))
+    return {"path": str(p), "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1_edges": h.hexdigest()}
+
+
+def _normalize_job(job: dict) -> dict:
+    """Remove campos irrelevantes e campos que não se aplicam à ferramenta escolhida."""
+    norm = {k: v for k, v in job.items() if k not in _FINGERPRINT_IGNORE and k not in _INPUT_FIELDS}
+    if norm.get("tool") != "race":
+        norm.pop("race", None)
+    if norm.get("tool") == "spades":
+        for k in ("uc_mode", "keep", "min_fasta_length", "linear_seqs"):
+            norm.pop(k, None)
+    else:
+        for k in ("spades_careful", "spades_kmers"):
+            norm.pop(k, None)
+    return norm
+
+
+def _job_fingerprint(job: dict) -> tuple:
+    """Retorna (chave_hex, dict_inputs) para o job. Levanta OSError se alguma entrada não existir."""
+    inputs = {k: _file_fingerprint(job[k]) for k in _INPUT_FIELDS if job.get(k)}
+    payload = {"params": _normalize_job(job), "inputs": inputs, "v": MANIFEST_VERSION}
+    blob = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(blob).hexdigest(), inputs
+
+
+def _read_manifest(outdir: Path):
+    try:
+        with open(outdir / MANIFEST_NAME) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(outdir: Path, data: dict):
+    tmp = outdir / (MANIFEST_NAME + ".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(data, fh, indent=2, sort_keys=True)
+    os.replace(tmp, outdir / MANIFEST_NAME)
+
+
+def _final_outputs(outdir: Path, tool: str):
+    """Arquivos finais esperados de uma montagem concluída."""
+    if tool == "spades":
+        names = ("contigs.fasta", "scaffolds.fasta")
+    else:
+        names = ("assembly.fasta", "assembly.gfa")
+    return [outdir / n for n in names if (outdir / n).exists()]
+
+
+def _assembler_parts(job, outdir: Path) -> list:
+    """Linha de comando de uma execução nova do SPAdes/Unicycler para o job."""
+    r1, r2, se, longr = job["r1"], job["r2"], job["se"], job["long"]
+    if job["tool"] == "spades":
+        parts = ["spades.py", "-t", str(job["threads"]), "-o", str(outdir)]
+        if job.get("spades_memory"):
+            parts += ["-m", str(job["spades_memory"])]
+        if job["spades_careful"]:
+            parts += ["--careful"]
+        if job["spades_kmers"]:
+            parts += ["--kmers", job["spades_kmers"]]
+        if job["mode"] == "PE":
+            parts += ["-1", r1, "-2", r2]
+        else:
+            parts += ["-s", se]
+        return parts
+    parts = ["unicycler", "-o", str(outdir), "-t", str(job["threads"]),
+             "--mode", job["uc_mode"],
+             "--keep", str(job["keep"]),
+             "--min_fasta_length", str(job["min_fasta_length"]),
+             "--linear_seqs", str(job["linear_seqs"])]
+    if r1 and r2:
+        parts += ["-1", r1, "-2", r2]
+    if se:
+        parts += ["-s", se]
+    if longr:
+        parts += ["-l", longr]
+    return parts
+
+
+def _spades_checkpoint(outdir: Path):
+    """
+    Último checkpoint SPAdes encontrado em outdir (nome do estágio) ou None.
+    SPAdes >= 3.14 grava pipeline_state/stage_<n>_<nome>; versões antigas só deixam
+    corrected/ e K<k>/ — nesse caso usamos a última pasta como indicação.
+    """
+    if not (outdir / "params.txt").exists():
+        return None
+    state = outdir / "pipeline_state"
+    stages = []
+    if state.is_dir():
+        for f in state.glob("stage_*"):
+            try:
+                stages.append((int(f.name.split("_")[1]), f.name))
+            except (IndexError, ValueError):
+                continue
+    if stages:
+        return max(stages)[1]
+    ks = sorted((int(d.name[1:]), d.name) for d in outdir.glob("K*") if d.is_dir() and d.name[1:].isdigit())
+    if ks:
+        return ks[-1][1]
+    if (outdir / "corrected").is_dir():
+        return "corrected"
+    return None
+
+
+def _resolve_outdir(sample: str, key: str):
+    """
+    Decide a pasta de saída para (sample, key).
+    Retorna (outdir, cached): cached=True quando há montagem concluída com a mesma chave.
+    Pastas com a mesma chave mas não concluídas (interrompidas/falhas) são reaproveitadas.
+    """
+    n = 1
+    while True:
+        outdir = (ASSEMBLY_DIR / (sample if n == 1 else f"{sample}_v{n}")).resolve()
+        if not outdir.exists() or not any(outdir.iterdir()):
+            return outdir, False
+        man = _read_manifest(outdir)
+        if man and man.get("key") == key:
+            done = man.get("status") == "ok" and _final_outputs(outdir, man.get("tool", ""))
+            return outdir, bool(done)
+        n += 1
+
+# ---------------------------
+# Compactação pós-montagem
+# ---------------------------
+# Mantém FASTA/GFA/paths finais, logs, params.txt e o manifesto; o resto
+# (K21..K127/, corrected/, misc/, tmp/, intermediários numerados do Unicycler,
+# SAM/BAM do --keep 2/3 ...) é empacotado em intermediates.tar.gz ou removido.
+COMPACT_MODES = ("off", "compress", "delete")
+COMPACT_ARCHIVE = "intermediates.tar.gz"
+COMPACT_REPORT = ASSEMBLY_DIR / "compaction_report.tsv"
+_COMPACT_REPORT_LOCK = threading.Lock()   # compact_pool grava linhas em paralelo
+COMPACT_KEEP = (
+    "assembly.fasta", "assembly.gfa",
+    "contigs.fasta", "scaffolds.fasta", "contigs.paths", "scaffolds.paths",
+    "assembly_graph*.gfa", "*.log", "params.txt",
+    MANIFEST_NAME, "nb_*", "*.tar.gz", "*.nbidx",
+)
+
+
+def _path_size(p: Path) -> int:
+    if p.is_symlink() or p.is_file():
+        return p.lstat().st_size
+    total = 0
+    for root, _dirs, files in os.walk(p):
+        for f in files:
+            try:
+                total += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def _compact_outdir(outdir: Path, mode: str) -> tuple:
+    """
+    Compacta intermediários de uma pasta de montagem. Retorna (bytes_antes, bytes_depois, n_itens).
+    O tar.gz é escrito em arquivo temporário e só então os originais são removidos.
+    """
+    before = _path_size(outdir)
+    victims = [p for p in sorted(outdir.iterdir())
+               if not any(fnmatch.fnmatch(p.name, pat) for pat in COMPACT_KEEP)]
+    if not victims or mode not in ("compress", "delete"):
+        return before, before, 0
+    if mode == "compress":
+        archive = outdir / COMPACT_ARCHIVE
+        n = 2
+        while archive.exists():
+            archive = outdir / f"intermediates_{n}.tar.gz"
+            n += 1
+        tmp = archive.with_name(archive.name + ".part")
+        with tarfile.open(tmp, "w:gz", compresslevel=6) as tar:
+            for p in victims:
+                tar.add(p, arcname=p.name)
+        os.replace(tmp, archive)
+    for p in victims:
+        if p.is_dir() and not p.is_symlink():
+            shutil.rmtree(p, ignore_errors=True)
+        else:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+    return before, _path_size(outdir), len(victims)
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024:
+            return f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+# ---------------------------
+# Estatísticas de montagem (N50/L50/GC)
+# ---------------------------
+# Leitura em passada única do FASTA (texto ou .gz); só os comprimentos ficam em
+# memória (array NumPy int64). Cabeçalhos do Unicycler trazem "circular=true".
+STATS_TSV = ASSEMBLY_DIR / "assembly_stats.tsv"
+STATS_FIELDS = ["sample", "file", "contigs", "total_length", "largest", "n50", "l50",
+                "gc_percent", "circular", "circular_length"]
+STATS_FASTA_NAMES = ("assembly.fasta", "contigs.fasta")
+
+
+def _fasta_stats(path: str) -> dict:
+    """Estatísticas de contiguidade de um FASTA. Função de módulo (picklável p/ ProcessPool)."""
+    opener = gzip.open if path.endswith(".gz") else open
+    lengths = []
+    circ_len = []
+    gc = acgt = 0
+    cur = 0
+    cur_circ = False
+    in_rec = False
+    with opener(path, "rb") as fh:
+        for line in fh:
+            if line.startswith(b">"):
+                if in_rec:
+                    lengths.append(cur)
+                    if cur_circ:
+                        circ_len.append(cur)
+                in_rec = True
+                cur = 0
+                cur_circ = b"circular=true" in line
+                continue
+            seq = line.rstrip()
+            cur += len(seq)
+            g = seq.count(b"G") + seq.count(b"C") + seq.count(b"g") + seq.count(b"c")
+            gc += g
+            acgt += g + seq.count(b"A") + seq.count(b"T") + seq.count(b"a") + seq.count(b"t")
+    if in_rec:
+        lengths.append(cur)
+        if cur_circ:
+            circ_len.append(cur)
+
+    if np is not None:
+        arr = np.sort(np.asarray(lengths, dtype=np.int64))[::-1]
+        total = int(arr.sum())
+        if total:
+            l50 = int(np.searchsorted(np.cumsum(arr), (total + 1) // 2)) + 1
+            n50 = int(arr[l50 - 1])
+        else:
+            l50 = n50 = 0
+        largest = int(arr[0]) if arr.size else 0
+    else:
+        arr = sorted(lengths, reverse=True)
+        total = sum(arr)
+        acc = l50 = n50 = 0
+        for i, ln in enumerate(arr, 1):
+            acc += ln
+            if acc * 2 >= total:
+                l50, n50 = i, ln
+                break
+        largest = arr[0] if arr else 0
+
+    p = Path(path)
+    return {
+        "sample": p.parent.name, "file": str(p), "contigs": len(lengths), "total_length": total,
+        "largest": largest, "n50": n50, "l50": l50,
+        "gc_percent": round(100.0 * gc / acgt, 2) if acgt else 0.0,
+        "circular": len(circ_len), "circular_length": sum(circ_len),
+    }
+
+
+def _final_fasta(outdir: Path):
+    """FASTA final de uma pasta de montagem (assembly.fasta do Unicycler ou contigs.fasta do SPAdes)."""
+    return next((outdir / n for n in STATS_FASTA_NAMES if (outdir / n).exists()), None)
+
+
+def _find_assembly_fastas():
+    """FASTA final de cada pasta de montagem."""
+    found = []
+    for d in sorted(p for p in ASSEMBLY_DIR.iterdir() if p.is_dir()):
+        fasta = _final_fasta(d)
+        if fasta:
+            found.append(str(fasta))
+    return found
+
+# ---------------------------
+# Visualizador de FASTA/GFA grandes (mmap + índice)
+# ---------------------------
+# Na 1ª abertura o arquivo é varrido via mmap (nada é carregado inteiro) e gera
+# um índice dos registros — contigs do FASTA ou segmentos S do GFA: início da
+# linha, início/fim da sequência, fim do registro e comprimento (arrays int64) +
+# nomes. O índice fica em <arquivo>.nbidx e vale enquanto tamanho/mtime do
+# arquivo não mudarem. O visualizador pagina a lista e lê do mmap só o trecho
+# exibido: memória constante qualquer que seja o tamanho do arquivo.
+INDEX_SUFFIX = ".nbidx"
+INDEX_VERSION = 1
+VIEW_PAGE = 200            # registros por página
+VIEW_CHUNK = 64 * 1024     # bytes de sequência/texto exibidos por vez
+VIEW_SUFFIXES = (".fasta", ".fa", ".fna", ".gfa")
+_SCAN_BLOCK = 1 << 20
+
+
+def _count_residues(mm, a: int, b: int) -> int:
+    """Bases em mm[a:b] (sem quebras de linha), lidas em blocos."""
+    n = 0
+    for i in range(a, b, _SCAN_BLOCK):
+        blk = mm[i:min(b, i + _SCAN_BLOCK)]
+        n += len(blk) - blk.count(b"\n") - blk.count(b"\r")
+    return n
+
+
+class SeqIndex:
+    """Índice de registros de um FASTA/GFA (ver SeqIndex.open)."""
+    __slots__ = ("path", "kind", "meta", "starts", "seqs", "seq_ends", "ends", "lengths", "names")
+    _ARRAYS = ("starts", "seqs", "seq_ends", "ends", "lengths")
+
+    def __init__(self, path: str, kind: str):
+        self.path, self.kind, self.meta, self.names = path, kind, {}, []
+        for a in self._ARRAYS:
+            setattr(self, a, array("q"))
+
+    @classmethod
+    def open(cls, path: str, scan: bool = True) -> "SeqIndex":
+        """
+        Índice em cache (<arquivo>.nbidx) ou construído agora (e gravado, se a pasta permitir).
+        scan=False: sem índice válido devolve um vazio (meta sem "n") para quem já vai ler o
+        arquivo preencher com _add() e fechar com _finish() (ver _gfa_summary_cached).
+        """
+        st = os.stat(path)
+        kind = "gfa" if path.lower().endswith(".gfa") else "fasta"
+        idx = cls(path, kind)
+        sig = {"v": INDEX_VERSION, "kind": kind, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        if idx._load(sig):
+            return idx
+        idx.meta = dict(sig)
+        if not scan:
+            return idx
+        if st.st_size:   # mmap não aceita arquivo vazio
+            with open(path, "rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                idx._scan_gfa(mm) if kind == "gfa" else idx._scan_fasta(mm)
+        idx._finish()
+        return idx
+
+    def _finish(self):
+        self.meta.update(n=len(self.names), total=sum(self.lengths))
+        try:
+            self._save()
+        except OSError:
+            pass   # pasta só de leitura: o índice vale só para esta sessão
+
+    def _scan_fasta(self, mm):
+        size = len(mm)
+        pos = 0 if mm[0:1] == b">" else mm.find(b"\n>")
+        while pos != -1 and pos < size:
+            if mm[pos:pos + 1] == b"\n":
+                pos += 1
+            eol = mm.find(b"\n", pos)
+            seq = size if eol == -1 else eol + 1
+            nxt = mm.find(b"\n>", seq - 1)
+            end = size if nxt == -1 else nxt + 1
+            head = mm[pos + 1:min(seq, pos + 4096)].split(None, 1)
+            self._add(pos, seq, end, end, _count_residues(mm, seq, end), head[0] if head else b"")
+            pos = nxt
+
+    def _scan_gfa(self, mm):
+        size = len(mm)
+        pos = 0 if mm[0:2] == b"S\t" else mm.find(b"\nS\t")
+        while pos != -1 and pos < size:
+            if mm[pos:pos + 1] == b"\n":
+                pos += 1
+            eol = mm.find(b"\n", pos)
+            end = size if eol == -1 else eol
+            t1 = mm.find(b"\t", pos + 2, end)
+            t1 = end if t1 == -1 else t1
+            t2 = mm.find(b"\t", t1 + 1, end)
+            t2 = end if t2 == -1 else t2
+            if mm[t1 + 1:t2] == b"*":
+                m = re.search(rb"\tLN:i:(\d+)", mm[t2:min(end, t2 + 4096)])
+                length = int(m.group(1)) if m else 0
+            else:
+                length = t2 - t1 - 1
+            self._add(pos, t1 + 1, t2, end, length, mm[pos + 2:t1])
+            pos = mm.find(b"\nS\t", end)
+
+    def _add(self, start, seq, seq_end, end, length, name):
+        for a, v in zip(self._ARRAYS, (start, seq, seq_end, end, length)):
+            getattr(self, a).append(v)
+        self.names.append(name.replace(b"\n", b" "))
+
+    def _index_path(self) -> str:
+        return self.path + INDEX_SUFFIX
+
+    def _save(self):
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(json.dumps(self.meta).encode() + b"\n")
+            for a in self._ARRAYS:
+                getattr(self, a).tofile(fh)
+            fh.write(b"\n".join(self.names))
+        os.replace(tmp, self._index_path())
+
+    def _load(self, sig: dict) -> bool:
+        try:
+            with open(self._index_path(), "rb") as fh:
+                meta = json.loads(fh.readline())
+                if any(meta.get(k) != v for k, v in sig.items()):
+                    return False
+                for a in self._ARRAYS:
+                    getattr(self, a).fromfile(fh, meta["n"])
+                self.names = fh.read().split(b"\n") if meta["n"] else []
+        except (OSError, ValueError, EOFError, KeyError):
+            meta = None
+        if meta is None or len(self.names) != meta["n"]:
+            # índice truncado/corrompido: descarta o que foi lido pela metade
+            for a in self._ARRAYS:
+                setattr(self, a, array("q"))
+            self.names = []
+            return False
+        self.meta = meta
+        return True
+
+    def __len__(self):
+        return len(self.names)
+
+    def select(self, text: str = "", min_len: int = 0, max_len: int = 0, by_length: bool = False) -> list:
+        """Índices dos registros cujo nome contém text e com comprimento no intervalo."""
+        t = text.strip().lower().encode()
+        L, names = self.lengths, self.names
+        hits = [i for i in range(len(names))
+                if L[i] >= min_len and (not max_len or L[i] <= max_len) and (not t or t in names[i].lower())]
+        if by_length:
+            hits.sort(key=L.__getitem__, reverse=True)
+        return hits
+
+    def header(self, mm, i: int) -> str:
+        """Cabeçalho do FASTA ou campos/tags da linha S (sem a sequência)."""
+        if self.kind == "fasta":
+            return mm[self.starts[i]:min(self.seqs[i], self.starts[i] + 4096)].decode(errors="replace").rstrip()
+        tags = mm[self.seq_ends[i]:min(self.ends[i], self.seq_ends[i] + 4096)].decode(errors="replace")
+        return f"S\t{self.names[i].decode(errors='replace')}\t<sequência>{tags}"
+
+    def chunk(self, mm, i: int, offset: int = 0, size: int = VIEW_CHUNK) -> bytes:
+        """Trecho bruto da sequência do registro i (offset em bytes dentro da sequência)."""
+        a = self.seqs[i] + offset
+        return mm[a:min(self.seq_ends[i], a + size)]
+
+    def seq_bytes(self, i: int) -> int:
+        return self.seq_ends[i] - self.seqs[i]
+
+# ---------------------------
+# Resumo do grafo de montagem (GFA do Unicycler)
+# ---------------------------
+# Uma passada pelo GFA, sem guardar sequências (e que também monta o índice .nbidx
+# quando ele ainda não existe): segmentos (comprimento pelo campo
+# de sequência ou LN:i, profundidade dp:f do Unicycler), links L -> componentes
+# conexos (union-find) e grau de cada ponta de segmento. Ponta sem link = ponta
+# solta; componente sem pontas soltas = circular (cromossomo se >= CHROMOSOME_MIN,
+# senão plasmídeo provável). O resultado fica no índice do arquivo (.nbidx, ver
+# SeqIndex) e só é recalculado se o GFA mudar.
+GFA_TSV = ASSEMBLY_DIR / "gfa_summary.tsv"
+GFA_FIELDS = ["sample", "file", "segments", "links", "total_length", "components", "circular_components",
+              "dead_ends", "circular_lengths", "largest_component"]
+GFA_SUMMARY_VERSION = 1
+GFA_MAX_COMPONENTS = 50
+CHROMOSOME_MIN = 1_000_000
+
+
+def _gfa_summary(path: str, idx: "SeqIndex" = None) -> dict:
+    """
+    Resumo do grafo (streaming, uma passada). Com idx (vazio), registra nele cada linha S
+    com os mesmos offsets de SeqIndex._scan_gfa. Função de módulo (picklável p/ ProcessPool).
+    """
+    ids, lengths, depths, parent, deg = {}, array("q"), array("d"), array("q"), array("q")
+    n_links = 0
+    pos = 0
+
+    def sid(name):
+        i = ids.get(name)
+        if i is None:   # L pode vir antes do S do segmento
+            i = ids[name] = len(parent)
+            parent.append(i)
+            lengths.append(0)
+            depths.append(-1.0)
+            deg.extend((0, 0))
+        return i
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    with open(path, "rb") as fh:
+        for line in fh:
+            tag = line[:2]
+            if tag == b"S\t" and idx is not None:
+                body = line[:-1] if line.endswith(b"\n") else line
+                t1 = body.find(b"\t", 2)
+                t1 = len(body) if t1 == -1 else t1
+                t2 = body.find(b"\t", t1 + 1)
+                t2 = len(body) if t2 == -1 else t2
+                if body[t1 + 1:t2] == b"*":
+                    m = re.search(rb"\tLN:i:(\d+)", body[t2:t2 + 4096])
+                    ln = int(m.group(1)) if m else 0
+                else:
+                    ln = t2 - t1 - 1
+                idx._add(pos, pos + t1 + 1, pos + t2, pos + len(body), ln, body[2:t1])
+            pos += len(line)
+            if tag == b"S\t":
+                f = line.rstrip(b"\r\n").split(b"\t")
+                i = sid(f[1])
+                ln = len(f[2]) if len(f) > 2 and f[2] != b"*" else 0
+                for t in f[3:]:
+                    if t.startswith(b"LN:i:") and not ln:
+                        ln = int(t[5:])
+                    elif t[:5] in (b"dp:f:", b"DP:f:"):
+                        depths[i] = float(t[5:])
+                lengths[i] = ln
+            elif tag == b"L\t":
+                f = line.split(b"\t", 5)
+                a, b = sid(f[1]), sid(f[3])
+                n_links += 1
+                # pontas: 2*i = esquerda, 2*i+1 = direita; "a +" sai pela direita, "b +" entra pela esquerda
+                deg[2 * a + (f[2] == b"+")] += 1
+                deg[2 * b + (f[4] == b"-")] += 1
+                ra, rb = find(a), find(b)
+                if ra != rb:
+                    parent[ra] = rb
+
+    comps = {}
+    for i in range(len(parent)):
+        c = comps.setdefault(find(i), [0, 0, 0, 0.0, 0])   # segmentos, bp, pontas soltas, dp×bp, bp c/ dp
+        c[0] += 1
+        c[1] += lengths[i]
+        c[2] += (deg[2 * i] == 0) + (deg[2 * i + 1] == 0)
+        if depths[i] >= 0:
+            c[3] += depths[i] * lengths[i]
+            c[4] += lengths[i]
+    detail = sorted(({"segments": c[0], "length": c[1], "dead_ends": c[2], "circular": c[2] == 0,
+                      "depth": round(c[3] / c[4], 2) if c[4] else None} for c in comps.values()),
+                    key=lambda d: d["length"], reverse=True)
+    for d in detail:
+        d["kind"] = ("cromossomo" if d["length"] >= CHROMOSOME_MIN else "plasmídeo") if d["circular"] else "linear"
+    circ = [d["length"] for d in detail if d["circular"]]
+    p = Path(path)
+    return {
+        "v": GFA_SUMMARY_VERSION, "sample": p.parent.name, "file": str(p),
+        "segments": len(parent), "links": n_links, "total_length": sum(lengths),
+        "components": len(detail), "circular_components": len(circ),
+        "dead_ends": sum(d["dead_ends"] for d in detail),
+        "circular_lengths": ";".join(map(str, circ)),
+        "largest_component": detail[0]["length"] if detail else 0,
+        "detail": detail[:GFA_MAX_COMPONENTS],
+    }
+
+
+def _gfa_summary_cached(path: str) -> dict:
+    """
+    Resumo guardado no índice do arquivo (<arquivo>.nbidx); recalculado só se o GFA mudou.
+    Sem índice válido, índice e resumo saem da mesma leitura do arquivo.
+    """
+    idx = SeqIndex.open(path, scan=False)
+    graph = idx.meta.get("graph")
+    if not graph or graph.get("v") != GFA_SUMMARY_VERSION:
+        if "n" not in idx.meta:
+            graph = idx.meta["graph"] = _gfa_summary(path, idx)
+            idx._finish()
+        else:
+            graph = idx.meta["graph"] = _gfa_summary(path)
+            try:
+                idx._save()
+            except OSError:
+                pass
+    return dict(graph, file=str(Path(path)), sample=Path(path).parent.name)
+
+
+def _fmt_graph(g: dict) -> str:
+    circ = [d for d in g["detail"] if d["circular"]]
+    txt = (f"{g['segments']} segmentos, {g['links']} links, {g['components']} componente(s), "
+           f"{g['dead_ends']} ponta(s) solta(s)")
+    if circ:
+        txt += "; circulares: " + ", ".join(
+            f"{d['kind']} {_fmt_bp(d['length'])}" + (f" (dp {d['depth']}×)" if d["depth"] is not None else "")
+            for d in circ)
+    return txt
+
+
+def _fmt_bp(n: int) -> str:
+    return f"{n / 1e6:.2f} Mb" if n >= 1_000_000 else (f"{n / 1e3:.1f} kb" if n >= 1000 else f"{n} bp")
+
+# ---------------------------
+# Subamostragem por cobertura (pré-montagem)
+# ---------------------------
+# Passada única: os primeiros registros medem bases/byte do arquivo (comprimido)
+# para estimar as bases totais -> fração = alvo / total. Cada par R1/R2 é mantido
+# ou descartado pela MESMA decisão (RNG com semente fixa => reprodutível).
+# Saída em scratch/<sample>/, reaproveitada se fonte e parâmetros não mudaram.
+SCRATCH_DIR = BASE_DIR / "scratch"
+DEFAULT_GENOME_SIZE = 5_000_000   # bactéria típica, quando não há outra estimativa
+SUBSAMPLE_SEED = 11
+_PROBE_RECORDS = 20000
+
+
+def _parse_genome_size(text) -> int:
+    """'5m', '5.2 Mb', '4800k', '4800000' -> bp (0 se vazio/ inválido)."""
+    t = str(text or "").strip().lower().replace(" ", "").rstrip("bp").rstrip("b")
+    if not t:
+        return 0
+    mult = {"k": 1_000, "m": 1_000_000, "g": 1_000_000_000}.get(t[-1], 1)
+    try:
+        return int(float(t[:-1] if mult != 1 else t) * mult)
+    except ValueError:
+        return 0
+
+
+def _open_fastq(path: str, mode: str = "rb"):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode, compresslevel=1) if "w" in mode else gzip.open(path, mode)
+    return open(path, mode)
+
+
+def _fastq_records(fh, strict: bool = False):
+    """Registros de 4 linhas; strict: registro incompleto no fim (arquivo truncado) é erro."""
+    while True:
+        rec = list(islice(fh, 4))
+        if len(rec) < 4:
+            if strict and rec:
+                raise ValueError(f"registro incompleto no fim de {os.path.basename(getattr(fh, 'name', '') or '?')}")
+            return
+        yield rec
+
+
+def _lockstep(readers):
+    """Tuplas com um registro de cada leitor; erro se um acabar antes dos outros (R1/R2 fora de par)."""
+    for recs in zip_longest(*readers):
+        if None in recs:
+            raise ValueError("R1/R2 com número de registros diferente")
+        yield recs
+
+
+_BASES_CACHE = {}
+_BASES_LOCK = threading.Lock()
+
+
+def _estimate_fastq_bases(path: str) -> int:
+    """Bases totais estimadas de um FASTQ(.gz) pelos primeiros registros (cache por tamanho/mtime)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _BASES_LOCK:
+        if key in _BASES_CACHE:
+            return _BASES_CACHE[key]
+    bases = n = 0
+    try:
+        with _open_fastq(path) as fh:
+            for rec in islice(_fastq_records(fh), _PROBE_RECORDS):
+                bases += len(rec[1]) - 1
+                n += 1
+            used = raw_tell(fh)
+    except (OSError, EOFError, gzip.BadGzipFile):
+        return 0
+    est = int(bases * st.st_size / used) if (n >= _PROBE_RECORDS and used) else bases
+    with _BASES_LOCK:
+        _BASES_CACHE[key] = est
+    return est
+
+
+def _job_input_bases(job):
+    """Bases de entrada estimadas (lê/stat dos arquivos: fora do thread da GUI)."""
+    return sum(_estimate_fastq_bases(job[k]) for k in _INPUT_FIELDS if job.get(k))
+
+
+def _subsample_reads(inputs, outputs, target_bases: int, seed: int = SUBSAMPLE_SEED, log=None) -> dict:
+    """
+    Subamostra 1 (SE) ou 2 (PE, em lockstep) FASTQs até ~target_bases.
+    Retorna {"fraction", "est_bases", "kept_bases", "subsampled"}; se a estimativa
+    já estiver abaixo do alvo, nada é escrito (subsampled=False). R1/R2 com nº de registros
+    diferente ou registro truncado no fim levantam ValueError (e nenhum .part_* fica para trás).
+    """
+    fins = [_open_fastq(p) for p in inputs]
+    sizes = [os.path.getsize(p) for p in inputs]
+    fouts, tmp_outs = [], []
+    try:
+        records = _lockstep([_fastq_records(f, strict=True) for f in fins])
+        probe = list(islice(records, _PROBE_RECORDS))
+        probe_bases = [sum(len(recs[i][1]) - 1 for recs in probe) for i in range(len(inputs))]
+        est = 0
+        for i, f in enumerate(fins):
+            used = raw_tell(f)
+            if len(probe) < _PROBE_RECORDS or not used:
+                est += probe_bases[i]           # arquivo inteiro já lido
+            else:
+                est += int(probe_bases[i] * sizes[i] / used)
+        fraction = target_bases / est if est else 1.0
+        info = {"fraction": round(fraction, 4), "est_bases": est, "kept_bases": est, "subsampled": False}
+        if fraction >= 1.0:
+            return info
+        if log:
+            log(f"bases estimadas ≈ {est:,}; mantendo fração {fraction:.3f}\n")
+        rng = random.Random(seed)
+        tmp_outs = [str(Path(o).with_name(".part_" + Path(o).name)) for o in outputs]  # mantém o sufixo .gz
+        fouts = [_open_fastq(o, "wb") for o in tmp_outs]
+        kept = 0
+        for recs in chain(probe, records):
+            if rng.random() < fraction:
+                for fo, rec in zip(fouts, recs):
+                    fo.writelines(rec)
+                    kept += len(rec[1]) - 1
+        for fo in fouts:
+            fo.close()
+        fouts = []
+        for tmp, out in zip(tmp_outs, outputs):
+            os.replace(tmp, out)
+        tmp_outs = []
+        info.update(kept_bases=kept, subsampled=True)
+        return info
+    finally:
+        for f in fins + fouts:
+            f.close()
+        for tmp in tmp_outs:    # erro no meio da escrita: não deixa .part_* no scratch
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+# Probabilidade de erro por caractere de qualidade (Phred+33). A acurácia de uma leitura é
+# 1 - média das probabilidades; a média dos Q (escala log) superestima a qualidade.
+_PHRED_ERR = [10 ** (-max(0, c - 33) / 10) for c in range(256)]
+_PHRED_ERR_NP = np.array(_PHRED_ERR) if np is not None else None
+
+
+def _mean_error(qual: bytes) -> float:
+    """Probabilidade média de erro por base de uma linha de qualidade (vazia = 1.0)."""
+    if not qual:
+        return 1.0
+    if _PHRED_ERR_NP is not None:
+        return float(_PHRED_ERR_NP[np.frombuffer(qual, dtype=np.uint8)].mean())
+    return sum(map(_PHRED_ERR.__getitem__, qual)) / len(qual)
+
+
+def _filter_long_reads(src: str, out: str, target_bases: int, min_len: int = 1000) -> dict:
+    """
+    Filtro de long reads em duas passadas com memória limitada (~17 bytes/leitura):
+      1) pontua cada leitura: comprimento × (1 - erro médio, com erro = 10^(-Q/10) por base)
+         = bases corretas esperadas; guarda só (pontuação, comprimento);
+      2) escolhe as melhores até target_bases e regrava só essas, na ordem original.
+    Retorna {"reads", "bases", "kept_reads", "kept_bases", "filtered"}; nada é escrito
+    (filtered=False) se todas ou nenhuma das leituras passarem (kept_reads 0 = todas < min_len).
+    """
+    scores = array("d")
+    lengths = array("q")
+    with _open_fastq(src) as fh:
+        for rec in _fastq_records(fh):
+            n = len(rec[1]) - 1
+            lengths.append(n)
+            if n < min_len:
+                scores.append(-1.0)
+                continue
+            scores.append(n * (1.0 - _mean_error(rec[3].rstrip())))
+    total = sum(lengths)
+    info = {"reads": len(lengths), "bases": total, "kept_reads": 0, "kept_bases": 0, "filtered": False}
+    keep = bytearray(len(lengths))
+    kept_bases = kept_reads = 0
+    if np is not None and len(scores):
+        sc = np.frombuffer(scores, dtype=np.float64)
+        ln = np.frombuffer(lengths, dtype=np.int64)
+        order = np.argsort(-sc, kind="stable")
+        order = order[sc[order] >= 0]
+        # mesma regra do laço abaixo: entra enquanto o acumulado ANTES da leitura < alvo
+        before = np.cumsum(ln[order]) - ln[order]
+        n = int((before < target_bases).sum())
+        sel = order[:n]
+        keep = np.zeros(len(lengths), dtype=np.uint8)
+        keep[sel] = 1
+        kept_bases, kept_reads = int(ln[sel].sum()), int(n)
+    else:
+        for i in sorted(range(len(scores)), key=scores.__getitem__, reverse=True):
+            if scores[i] < 0 or kept_bases >= target_bases:
+                break
+            keep[i] = 1
+            kept_bases += lengths[i]
+            kept_reads += 1
+    info.update(kept_reads=kept_reads, kept_bases=kept_bases)
+    if kept_reads == 0 or kept_reads == len(lengths):
+        return info
+
+    tmp = str(Path(out).with_name(".part_" + Path(out).name))
+    with _open_fastq(src) as fin, _open_fastq(tmp, "wb") as fout:
+        for i, rec in enumerate(_fastq_records(fin)):
+            if keep[i]:
+                fout.writelines(rec)
+    os.replace(tmp, out)
+    info["filtered"] = True
+    return info
+
+# ---------------------------
+# Espectro de k-mers (tamanho do genoma / cobertura)
+# ---------------------------
+# Conta k-mers canônicos (k=21, 2 bits/base em uint64) de um subconjunto de
+# leituras numa tabela de tamanho fixo (2^KMER_TABLE_BITS contadores uint16,
+# índice = hash multiplicativo). Colisões só inflam levemente o histograma.
+# Do histograma: vale de erros -> pico (cobertura de k-mer) -> genoma = k-mers
+# sólidos / pico. A cobertura do subconjunto é escalada para o arquivo inteiro.
+KMER_DIR = BASE_DIR / "kmer_profiles"
+KMER_K = 21
+KMER_TABLE_BITS = 26              # 64 Mi contadores uint16 = 128 MB
+KMER_MAX_READS = 2_000_000        # por arquivo
+KMER_HIST_MAX = 1000
+_KMER_BATCH = 50_000
+_HASH_MUL = 0x9E3779B97F4A7C15
+
+
+def _kmer_count_batch(seqs, table, k: int, bits: int) -> int:
+    """Conta os k-mers canônicos de uma lista de sequências (bytes) na tabela. Retorna nº de k-mers."""
+    lut = np.full(256, 4, dtype=np.uint8)
+    for i, b in enumerate(b"ACGT"):
+        lut[b] = i
+        lut[ord(chr(b).lower())] = i
+    buf = np.frombuffer(b"N".join(seqs) + b"N", dtype=np.uint8)
+    codes = lut[buf]
+    bad = codes == 4
+    n = codes.size - k + 1
+    if n <= 0:
+        return 0
+    # janela inválida se contém N/separador
+    cbad = np.concatenate(([0], np.cumsum(bad, dtype=np.int64)))
+    ok = (cbad[k:k + n] - cbad[:n]) == 0
+    c = codes.astype(np.uint64)
+    c[bad] = 0
+    fw = np.zeros(n, dtype=np.uint64)
+    rc = np.zeros(n, dtype=np.uint64)
+    for j in range(k):
+        win = c[j:j + n]
+        fw = (fw << np.uint64(2)) | win
+        rc |= (np.uint64(3) - win) << np.uint64(2 * j)
+    canon = np.minimum(fw, rc)[ok]
+    idx = ((canon * np.uint64(_HASH_MUL)) >> np.uint64(64 - bits)).astype(np.int64)
+    uniq, cnt = np.unique(idx, return_counts=True)
+    table[uniq] = np.minimum(table[uniq].astype(np.int64) + cnt, 65535).astype(np.uint16)
+    return int(canon.size)
+
+
+def _kmer_profile(paths, k: int = KMER_K, max_reads: int = KMER_MAX_READS) -> dict:
+    """Histograma de k-mers + estimativas (genoma, cobertura, fração de k-mers de erro)."""
+    if np is None:
+        raise RuntimeError("numpy indisponível no ambiente (necessário p/ o espectro de k-mers)")
+    table = np.zeros(1 << KMER_TABLE_BITS, dtype=np.uint16)
+    bases = reads = 0
+    est_total = 0
+    read_len = 0
+    for path in paths:
+        n_here = b_here = 0
+        with _open_fastq(path) as fh:
+            batch = []
+            for rec in islice(_fastq_records(fh), max_reads):
+                seq = rec[1].rstrip()
+                batch.append(seq)
+                b_here += len(seq)
+                n_here += 1
+                if len(batch) >= _KMER_BATCH:
+                    _kmer_count_batch(batch, table, k, KMER_TABLE_BITS)
+                    batch = []
+            if batch:
+                _kmer_count_batch(batch, table, k, KMER_TABLE_BITS)
+            used = raw_tell(fh)
+        size = os.path.getsize(path)
+        est_total += int(b_here * size / used) if (n_here >= max_reads and used) else b_here
+        bases += b_here
+        reads += n_here
+    read_len = bases / reads if reads else 0
+    hist = np.bincount(np.minimum(table[table > 0], KMER_HIST_MAX), minlength=KMER_HIST_MAX + 1)
+    del table
+
+    # vale de erros: primeiro mínimo local (suavizado em 3; a partir de 2, pois hist[0] = 0)
+    sm = np.convolve(hist.astype(np.float64), np.ones(3) / 3, mode="same")
+    trough = 2
+    while trough < KMER_HIST_MAX - 1 and sm[trough + 1] < sm[trough]:
+        trough += 1
+    peak = trough + int(np.argmax(hist[trough:KMER_HIST_MAX]))
+    cov = np.arange(hist.size, dtype=np.float64)
+    total_kmers = float((cov * hist).sum())
+    solid = float((cov[trough:] * hist[trough:]).sum())
+    genome = int(solid / peak) if peak else 0
+    # cobertura de bases = pico / (fração de posições com k-mer) / (fração de k-mers sem erro)
+    eff = (read_len - k + 1) / read_len if read_len > k else 0
+    eff *= solid / total_kmers if total_kmers else 0
+    sub_cov = peak / eff if eff else 0.0
+    full_cov = sub_cov * est_total / bases if bases else 0.0
+    half = peak // 2
+    het = bool(half > trough and hist[half] > 0.25 * hist[peak])
+    distinct_full = float(hist[1:].sum()) * (est_total / bases if bases else 1.0)
+    return {
+        "k": k, "reads_used": reads, "bases_used": bases, "read_len": round(read_len, 1),
+        "est_total_bases": est_total, "error_trough": trough, "kmer_peak": peak,
+        "genome_size": genome, "coverage": round(full_cov, 1),
+        "error_kmer_fraction": round(1 - solid / total_kmers, 4) if total_kmers else 0.0,
+        "secondary_peak_half": het, "distinct_kmers_est": int(distinct_full),
+        "hist": hist.tolist(),
+    }
+
+
+def _read_kmer_profile(sample: str):
+    try:
+        with open(KMER_DIR / f"{sample}.json") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+# ---------------------------
+# QUAST
+# ---------------------------
+# A referência (opcional) é preparada uma única vez por conteúdo: descompactada e
+# medida em quast_reports/_references/. Relatórios por amostra usam só
+# --est-ref-size (sem realinhar a referência a cada amostra); o relatório
+# comparativo da fila roda com -r uma vez para todas as montagens.
+QUAST_DIR = BASE_DIR / "quast_reports"
+QUAST_REF_DIR = QUAST_DIR / "_references"
+
+
+def _prepare_reference(ref: str) -> tuple:
+    """Retorna (caminho_fasta_preparado, tamanho_total_bp), reaproveitando preparo anterior."""
+    src = Path(ref).expanduser().resolve()
+    fp = _file_fingerprint(str(src))
+    tag = hashlib.sha1(json.dumps(fp, sort_keys=True).encode()).hexdigest()[:12]
+    base = re.sub(r"\.gz$", "", src.name)
+    dest = QUAST_REF_DIR / f"{tag}_{base}"
+    meta = dest.with_name(dest.name + ".json")
+    if dest.exists() and meta.exists():
+        with open(meta) as fh:
+            return str(dest), int(json.load(fh)["length"])
+    QUAST_REF_DIR.mkdir(parents=True, exist_ok=True)
+    opener = gzip.open if src.name.endswith(".gz") else open
+    tmp = dest.with_name(dest.name + ".part")
+    total = 0
+    with opener(src, "rb") as fin, open(tmp, "wb") as fout:
+        for line in fin:
+            if not line.startswith(b">"):
+                total += len(line.rstrip())
+            fout.write(line)
+    os.replace(tmp, dest)
+    with open(meta, "w") as fh:
+        json.dump({"source": fp, "length": total}, fh)
+    return str(dest), total
+
+# ---------------------------
+# Falhas e novas tentativas
+# ---------------------------
+# Classifica a falha pelo código de saída + fim do log. oom/killed/unknown são
+# re-enfileirados com recursos reduzidos (até max_retries); disk/input/stopped não.
+# Encerramentos do watchdog vêm com o motivo: stalled (sem saída; retentável, retoma
+# do checkpoint), timeout (tempo máximo; não) e skipped (pulado pelo usuário; não).
+FAILURE_PATTERNS = (
+    ("disk", re.compile(r"No space left on device|Disk quota exceeded", re.I)),
+    ("oom", re.compile(r"bad_alloc|Cannot allocate memory|MemoryError|out of memory|lack of memory", re.I)),
+    ("input", re.compile(r"No such file|does not exist|not a valid|invalid (?:fastq|input|file)|corrupt"
+                         r"|unexpected end of|truncated|BadGzipFile|not in fastq format", re.I)),
+)
+RETRYABLE_FAILURES = ("oom", "killed", "unknown", "stalled")
+TAIL_LINES = 200
+SAFE_SPADES_KMERS = "21,33,55"
+
+
+def _classify_failure(ret, tail, stopped: bool, watchdog_reason=None) -> str:
+    if stopped:
+        return "stopped"
+    if watchdog_reason:
+        return watchdog_reason
+    text = "".join(tail)
+    for cls, rx in FAILURE_PATTERNS:
+        if rx.search(text):
+            return cls
+    if ret in (137, -9):      # SIGKILL sem pedido do usuário: quase sempre o OOM killer
+        return "oom"
+    if ret in (143, -15, 130, -2):
+        return "killed"
+    return "unknown"
+
+
+def _total_mem_gb() -> int:
+    try:
+        return int(os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def _degrade_job(job: dict, failure: str):
+    """Cópia do job para nova tentativa (ou None se não houver). Retorna (job, descrição)."""
+    attempt = int(job.get("attempt") or 0) + 1
+    if failure not in RETRYABLE_FAILURES or attempt > int(job.get("max_retries") or 0):
+        return None, ""
+    new = dict(job, attempt=attempt)
+    notes = []
+    if failure == "oom":
+        # 1ª: menos threads e -m menor (mesmo fingerprint => SPAdes retoma do checkpoint);
+        # 2ª+: também sem --careful e k-mers menores (nova pasta versionada).
+        if job["threads"] > 1:
+            new["threads"] = max(1, job["threads"] // 2)
+            notes.append(f"threads {job['threads']}->{new['threads']}")
+        if job["tool"] == "spades":
+            mem = int(job.get("spades_memory") or 0) or _total_mem_gb()
+            if mem:
+                new["spades_memory"] = max(4, int(mem * 0.75))
+                notes.append(f"-m {new['spades_memory']} GB")
+            if attempt >= 2:
+                if job["spades_careful"]:
+                    new["spades_careful"] = False
+                    notes.append("sem --careful")
+                if job["spades_kmers"] != SAFE_SPADES_KMERS:
+                    new["spades_kmers"] = SAFE_SPADES_KMERS
+                    notes.append(f"--kmers {SAFE_SPADES_KMERS}")
+    else:
+        notes.append("mesmos parâmetros")
+    return new, ", ".join(notes) or "mesmos parâmetros"
+
+# ---------------------------
+# Pipeline fastp -> montagem -> QC
+# ---------------------------
+# Cada amostra é um pequeno DAG (fastp -> montagem -> QUAST/estatísticas); o fastp
+# da amostra B roda enquanto a amostra A monta. Um orçamento único de threads é
+# dividido entre os estágios. Parâmetros do fastp: preset salvo pelo app de
+# pré-processamento (fastp_output/fastp_pipeline_preset.json) ou os padrões dele.
+FASTP_DIR = BASE_DIR / "fastp_output"
+FASTP_PRESET = FASTP_DIR / "fastp_pipeline_preset.json"
+DEFAULT_FASTP_ARGS = ["-q", "15", "-u", "40", "-n", "5", "-l", "50",
+                      "-5", "-3", "-W", "4", "-M", "20", "-a", "auto"]
+
+
+def _detect_pairs(files):
+    """[(r1, r2, chave)] + lista de arquivos sem par/irreconhecíveis."""
+    bucket, unpaired = {}, []
+    for f in files:
+        m = PAIR_REGEX.search(os.path.basename(f))
+        if not m:
+            unpaired.append(f)
+            continue
+        bucket.setdefault(m.group(1), {})[int(m.group(2))] = f
+    pairs = []
+    for key, d in sorted(bucket.items()):
+        if 1 in d and 2 in d:
+            pairs.append((d[1], d[2], key))
+        else:
+            unpaired.extend(d.values())
+    return pairs, unpaired
+
+
+def _fastp_preset_args(threads: int, report_html: str, report_json: str):
+    """Argumentos do fastp: preset salvo (placeholders {threads}/{html}/{json}) ou padrão."""
+    try:
+        with open(FASTP_PRESET) as fh:
+            args = json.load(fh)["args"]
+    except (OSError, ValueError, KeyError):
+        args = ["fastp", "-w", "{threads}", "-j", "{json}", "-h", "{html}"] + DEFAULT_FASTP_ARGS
+    fill = {"{threads}": str(threads), "{html}": report_html, "{json}": report_json}
+    return [fill.get(a, a) for a in args]
+
+
+class _ThreadBudget:
+    """Orçamento de threads compartilhado pelos estágios do pipeline."""
+
+    def __init__(self, total: int):
+        self.total = max(1, total)
+        self.free = self.total
+        self.cv = threading.Condition()
+
+    def acquire(self, n: int, stop=lambda: False) -> int:
+        n = max(1, min(n, self.total))
+        with self.cv:
+            while self.free < n and not stop():
+                self.cv.wait(0.5)
+            if stop():
+                return 0
+            self.free -= n
+            return n
+
+    def release(self, n: int):
+        with self.cv:
+            self.free = min(self.total, self.free + n)
+            self.cv.notify_all()
+
+# Ordem da fila: chegada, coluna priority (maior primeiro) ou menor entrada primeiro
+QUEUE_POLICIES = ("fifo", "priority", "sjf")
+
+# ---------------------------
+# Planilhas grandes (milhares de jobs)
+# ---------------------------
+# Cada linha do CSV vira um JobRecord (__slots__, sem dict por instância) que se
+# comporta como o dict de job usado no resto do app (job["tool"], job.get, dict(job, ...)).
+# Caminhos/pares são validados antes de começar (em paralelo: stat em disco de rede
+# é limitado por I/O) e os erros saem linha a linha. A lista da fila só desenha as
+# linhas visíveis.
+def _as_bool(v, default):
+    return default if v in (None, "") else str(v).strip().lower() in ("1", "true", "yes", "y")
+
+
+def _as_int(v, default):
+    return default if v in (None, "") else int(str(v).strip())
+
+
+def _as_str(v, default, upper=False, lower=False):
+    t = str(v).strip() if v not in (None, "") else default
+    return t.upper() if upper else (t.lower() if lower else t)
+
+
+# (campo, conversor, padrão no CSV)
+JOB_SPEC = (
+    ("sample", _as_str, "sample1"), ("tool", _as_str, "unicycler"),
+    ("mode", lambda v, d: _as_str(v, d, upper=True), "PE"),
+    ("r1", _as_str, ""), ("r2", _as_str, ""), ("se", _as_str, ""), ("long", _as_str, ""),
+    ("threads", _as_int, 16), ("uc_mode", _as_str, "normal"), ("keep", _as_int, 1),
+    ("min_fasta_length", _as_int, 100), ("linear_seqs", _as_int, 0),
+    ("spades_careful", _as_bool, True), ("spades_kmers", _as_str, ""), ("resume", _as_bool, True),
+    ("compact", lambda v, d: _as_str(v, d, lower=True), "off"),
+    ("target_cov", _as_int, 0), ("genome_size", _as_str, ""),
+    ("long_target_cov", _as_int, 0), ("long_min_len", _as_int, 1000),
+    ("priority", _as_int, 0), ("spades_memory", _as_int, 0), ("max_retries", _as_int, 2),
+    ("attempt", _as_int, 0), ("max_runtime_min", _as_int, 0), ("idle_timeout_min", _as_int, 0),
+    ("race", _as_str, ""),
+)
+JOB_FIELDS = tuple(f for f, _, _ in JOB_SPEC)
+UC_MODES = ("conservative", "normal", "bold")
+
+
+class JobRecord(MutableMapping):
+    __slots__ = JOB_FIELDS
+
+    def __init__(self, values=(), **kw):
+        for f, _, d in JOB_SPEC:
+            setattr(self, f, d)
+        for k, v in dict(values, **kw).items():
+            self[k] = v
+
+    @classmethod
+    def from_row(cls, row: dict):
+        """(JobRecord, [erros]) a partir de uma linha do CSV."""
+        rec, errs = cls(), []
+        for f, conv, d in JOB_SPEC:
+            try:
+                setattr(rec, f, conv(row.get(f), d))
+            except ValueError:
+                errs.append(f"{f}={row.get(f)!r} inválido")
+        return rec, errs
+
+    def __getitem__(self, k):
+        try:
+            return getattr(self, k)
+        except (AttributeError, TypeError):
+            raise KeyError(k) from None
+
+    def __setitem__(self, k, v):
+        if k not in JOB_FIELDS:
+            raise KeyError(k)
+        setattr(self, k, v)
+
+    def __delitem__(self, k):
+        raise KeyError(k)
+
+    def __iter__(self):
+        return iter(JOB_FIELDS)
+
+    def __len__(self):
+        return len(JOB_FIELDS)
+
+    def __repr__(self):
+        return f"JobRecord({dict(self)!r})"
+
+
+def _validate_job(job) -> list:
+    """Erros de um job (parâmetros, entradas exigidas pela ferramenta/modo, arquivos e pares)."""
+    errs = []
+    tool, mode = job["tool"], job["mode"]
+    r1, r2, se, longr = job["r1"], job["r2"], job["se"], job["long"]
+    if tool == "race":
+        try:
+            cands = _race_candidates(job)
+        except ValueError as e:
+            return errs + [str(e)]
+        for spec, cand in cands:
+            errs += [e if e.startswith(tuple(_INPUT_FIELDS)) else f"{spec}: {e}"
+                     for e in _validate_job(cand) if e not in errs and f"{spec}: {e}" not in errs]
+        return errs
+    if tool not in ("spades", "unicycler"):
+        errs.append(f"tool '{tool}' (use spades|unicycler|race)")
+    if mode not in ("PE", "SE"):
+        errs.append(f"mode '{mode}' (use PE|SE)")
+    if job["compact"] not in COMPACT_MODES:
+        errs.append(f"compact '{job['compact']}' (use {'|'.join(COMPACT_MODES)})")
+    if tool == "unicycler" and job["uc_mode"] not in UC_MODES:
+        errs.append(f"uc_mode '{job['uc_mode']}'")
+    if job["threads"] < 1:
+        errs.append("threads < 1")
+    if tool == "spades":
+        if mode == "PE" and (not r1 or not r2):
+            errs.append("SPAdes (PE) requer r1 e r2")
+        if mode == "SE" and not se:
+            errs.append("SPAdes (SE) requer se")
+    elif tool == "unicycler":
+        if mode == "PE" and (not r1 or not r2) and not se and not longr:
+            errs.append("Unicycler requer r1+r2 e/ou se")
+        if mode == "SE" and not se and not longr:
+            errs.append("Unicycler (SE) requer se ou long")
+    for k in _INPUT_FIELDS:
+        p = job[k]
+        if not p:
+            continue
+        try:
+            if not os.path.isfile(p):
+                errs.append(f"{k}: não encontrado ({p})")
+            elif not os.access(p, os.R_OK):
+                errs.append(f"{k}: sem permissão de leitura ({p})")
+        except OSError as e:
+            errs.append(f"{k}: {e}")
+    if r1 and r2:
+        if os.path.abspath(r1) == os.path.abspath(r2):
+            errs.append("r1 e r2 são o mesmo arquivo")
+        else:
+            m1, m2 = PAIR_REGEX.search(os.path.basename(r1)), PAIR_REGEX.search(os.path.basename(r2))
+            if m1 and m2 and (m1.group(1) != m2.group(1) or (m1.group(2), m2.group(2)) != ("1", "2")):
+                errs.append(f"par r1/r2 inconsistente ({os.path.basename(r1)} / {os.path.basename(r2)})")
+    return errs
+
+# ---------------------------
+# Corrida de montadores (job "race")
+# ---------------------------
+# Um job tool="race" roda ao mesmo tempo os candidatos da coluna race — "spades",
+# "unicycler" ou "spades:21,33,55" (conjunto de k-mers) — dividindo entre eles as
+# threads e o -m do job. Cada montagem concluída é pontuada por contiguidade
+# (N50, maior contig, menos contigs). Quando uma candidata domina (maior contig
+# >= RACE_DOMINANCE do genoma esperado: não há o que melhorar) ou o tempo máximo
+# do job acaba, as demais são canceladas. A vencedora vira a pasta normal da
+# amostra (mesmo fingerprint de um job comum com esses parâmetros => cache);
+# as perdedoras são removidas.
+RACE_DEFAULT = "spades;unicycler"
+RACE_DOMINANCE = 0.9
+RACE_SUMMARY = "nb_race.json"
+
+
+def _race_candidates(job) -> list:
+    """[(rótulo, job comum)] de um job race. ValueError se a lista de candidatos for inválida."""
+    specs = [s.strip() for s in (job.get("race") or RACE_DEFAULT).split(";") if s.strip()]
+    if len(specs) < 2:
+        raise ValueError("race requer ao menos 2 candidatos (ex.: spades;unicycler;spades:21,33,55)")
+    if len(set(specs)) < len(specs):
+        raise ValueError("race: candidatos repetidos")
+    threads = max(1, int(job["threads"]) // len(specs))
+    memory = int(job.get("spades_memory") or 0) // len(specs)
+    out = []
+    for spec in specs:
+        tool, _, kmers = (t.strip() for t in spec.partition(":"))
+        if tool not in ("spades", "unicycler"):
+            raise ValueError(f"race: candidato '{spec}' (use spades, unicycler ou spades:k1,k2,...)")
+        if kmers and (tool != "spades" or not re.fullmatch(r"\d+(,\d+)*", kmers)):
+            raise ValueError(f"race: k-mers inválidos em '{spec}'")
+        cand = dict(job, tool=tool, race="", threads=threads, spades_memory=memory)
+        if kmers:
+            cand["spades_kmers"] = kmers
+        out.append((spec, cand))
+    return out
+
+
+def _race_score(st: dict) -> tuple:
+    return (st["n50"], st["largest"], -st["contigs"])
+
+
+def _race_dominates(st: dict, genome_size: int) -> bool:
+    """Montagem praticamente fechada: o maior contig cobre quase todo o genoma esperado."""
+    return st["largest"] >= RACE_DOMINANCE * (genome_size or st["total_length"])
+
 # ---------------------------
 # App
 # ---------------------------
@@ -57,12 +1361,42 @@ class AssemblyApp(tk.Tk):
 
         self.env_name = ENV_NAME
         self.asm_current_proc = None
+        self.asm_watch = None         # ProcWatch do processo atual (NB_PIPELINE_COMMON.watchdog)
+        self.asm_timer = None         # RunTimer da última execução (tempo/CPU/memória p/ o ledger)
+        self.asm_policy = None        # ExecPolicy da última execução (CPUs/nice/ionice/cgroup aplicados)
+        self.predictor = RuntimePredictor()   # reajustado com o histórico local (_refit_predictor)
+        self._eta_after = None
         self.asm_stop_requested = False
+        self.asm_tail = deque(maxlen=TAIL_LINES)
+        self.asm_last_failure = None
+        self.asm_last_quast = None
+        self.race_watches = []        # watches dos candidatos de um job race em execução
+        self.race_skip = False
 
         # Batch state
-        self.batch_queue = []         # lista de dicionários (jobs)
+        self.batch_queue = []         # jobs (JobRecord ou dict), na ordem de execução
+        self.batch_sel = set()        # id(job) selecionados (a lista só desenha as linhas visíveis)
+        self.batch_top = 0            # 1ª linha visível da fila
+        self.batch_rows = 10
+        self.estimate_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="estimate")
         self.batch_running = False
         self.batch_thread = None
+        self.batch_meta = {}          # id(job) -> {"seq": ordem de entrada, "state": pending|running|done|failed}
+        self.batch_seq = 0
+
+        # Pipeline fastp -> montagem -> QC
+        self.pipe_running = False
+        self.pipe_fastp_proc = None
+        self.pipe_fastp_watch = None
+        self.pipe_win = None
+
+        # Compactação pós-job em segundo plano
+        self.compact_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="compact")
+
+        # QUAST pós-job (sobrepõe com a próxima montagem)
+        self.quast_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="quast")
+        self.quast_futures = []
+        self.quast_lock = threading.Lock()     # quast_futures é usado pelos threads de fila/pipeline
 
         self._build_ui()
         self._check_environment()
@@ -122,6 +1456,7 @@ class AssemblyApp(tk.Tk):
         ttk.Label(top, text="Montagem de genomas — SPAdes / Unicycler").pack(side="left")
         ttk.Button(top, text="Abrir pasta de saídas", command=lambda: webbrowser.open_new_tab(f"file://{ASSEMBLY_DIR.resolve()}")).pack(side="right", padx=6)
         ttk.Button(top, text="?", width=3, command=self._show_help).pack(side="right")
+        ttk.Button(top, text="Pipeline fastp → montagem…", command=self._pipeline_window).pack(side="right", padx=6)
 
         # Form
         form = ttk.LabelFrame(main, text="Entradas & Parâmetros (job atual)")
@@ -132,7 +1467,7 @@ class AssemblyApp(tk.Tk):
         self.var_tool = tk.StringVar(value="unicycler")   # unicycler|spades
         ttk.Label(form, text="Ferramenta").grid(row=0, column=0, sticky="w", padx=4, pady=4)
         ttk.Combobox(form, textvariable=self.var_tool, state="readonly",
-                     values=["unicycler", "spades"], width=14).grid(row=0, column=1, sticky="w")
+                     values=["unicycler", "spades", "race"], width=14).grid(row=0, column=1, sticky="w")
 
         self.var_mode = tk.StringVar(value="PE")          # PE|SE
         ttk.Label(form, text="Modo (curtas)").grid(row=0, column=2, sticky="e")
@@ -167,6 +1502,29 @@ class AssemblyApp(tk.Tk):
         ttk.Entry(form, textvariable=self.var_long).grid(row=4, column=1, columnspan=5, sticky="ew", padx=4)
         ttk.Button(form, text="Escolher…", command=lambda: self._pick(self.var_long)).grid(row=4, column=6, sticky="w")
 
+        self.var_target_cov = tk.IntVar(value=0)
+        ttk.Label(form, text="Cobertura alvo (×, 0 = não subamostrar)").grid(row=5, column=0, sticky="w")
+        ttk.Spinbox(form, from_=0, to=1000, increment=10, textvariable=self.var_target_cov,
+                    width=6).grid(row=5, column=1, sticky="w")
+        self.var_genome_size = tk.StringVar(value="")
+        ttk.Label(form, text="Tamanho do genoma (ex. 5m; vazio = estimar)").grid(row=5, column=2, columnspan=2, sticky="e")
+        ttk.Entry(form, textvariable=self.var_genome_size, width=10).grid(row=5, column=4, sticky="w")
+        ttk.Button(form, text="Estimar (k-mers)", command=self._kmer_thread).grid(row=5, column=5, sticky="w")
+        self.var_kmer_info = tk.StringVar(value="")
+        ttk.Label(form, textvariable=self.var_kmer_info, foreground="gray30").grid(row=5, column=6, columnspan=2, sticky="w")
+
+        self.var_long_target_cov = tk.IntVar(value=0)
+        ttk.Label(form, text="Long reads: cobertura alvo (×, 0 = todas)").grid(row=6, column=0, sticky="w")
+        ttk.Spinbox(form, from_=0, to=1000, increment=10, textvariable=self.var_long_target_cov,
+                    width=6).grid(row=6, column=1, sticky="w")
+        self.var_long_min_len = tk.IntVar(value=1000)
+        ttk.Label(form, text="Comprimento mínimo (bp)").grid(row=6, column=2, columnspan=2, sticky="e")
+        ttk.Spinbox(form, from_=0, to=100000, increment=500, textvariable=self.var_long_min_len,
+                    width=8).grid(row=6, column=4, sticky="w")
+        self.var_race = tk.StringVar(value=RACE_DEFAULT)
+        ttk.Label(form, text="Candidatos (race)").grid(row=6, column=5, sticky="e")
+        ttk.Entry(form, textvariable=self.var_race, width=28).grid(row=6, column=6, columnspan=2, sticky="w")
+
         # Unicycler opts
         ucf = ttk.LabelFrame(main, text="Opções — Unicycler")
         ucf.pack(fill="x", padx=8, pady=6)
@@ -198,15 +1556,52 @@ class AssemblyApp(tk.Tk):
         self.var_sp_careful = tk.BooleanVar(value=True)
         ttk.Checkbutton(spf, text="--careful (reduz erros estruturais; mais lento)",
                         variable=self.var_sp_careful).grid(row=0, column=0, columnspan=3, sticky="w")
+        self.var_resume = tk.BooleanVar(value=True)
+        ttk.Checkbutton(spf, text="Retomar execução interrompida (--continue / --restart-from)",
+                        variable=self.var_resume).grid(row=1, column=0, columnspan=4, sticky="w")
         self.var_sp_kmers = tk.StringVar(value="")
         ttk.Label(spf, text="--kmers (vazio = automático)").grid(row=0, column=3, sticky="e")
         ttk.Entry(spf, textvariable=self.var_sp_kmers, width=24).grid(row=0, column=4, sticky="w")
+        self.var_sp_memory = tk.IntVar(value=0)
+        ttk.Label(spf, text="-m GB (0 = padrão)").grid(row=0, column=5, sticky="e")
+        ttk.Spinbox(spf, from_=0, to=4096, textvariable=self.var_sp_memory, width=6).grid(row=0, column=6, sticky="w")
+        self.var_max_retries = tk.IntVar(value=2)
+        ttk.Label(spf, text="Novas tentativas (OOM/falhas transitórias)").grid(row=1, column=5, sticky="e")
+        ttk.Spinbox(spf, from_=0, to=5, textvariable=self.var_max_retries, width=6).grid(row=1, column=6, sticky="w")
+
+        # QUAST
+        qf = ttk.LabelFrame(main, text="QC — QUAST (pós-montagem)")
+        qf.pack(fill="x", padx=8, pady=6)
+        for c in range(8): qf.columnconfigure(c, weight=1)
+        self.var_quast = tk.BooleanVar(value=False)
+        ttk.Checkbutton(qf, text="Rodar QUAST ao fim de cada job (+ comparativo da fila)",
+                        variable=self.var_quast).grid(row=0, column=0, columnspan=2, sticky="w")
+        self.var_quast_threads = tk.IntVar(value=4)
+        ttk.Label(qf, text="Threads QUAST").grid(row=0, column=2, sticky="e")
+        ttk.Spinbox(qf, from_=1, to=64, textvariable=self.var_quast_threads, width=6).grid(row=0, column=3, sticky="w")
+        ttk.Label(qf, text="Referência (opcional)").grid(row=1, column=0, sticky="w")
+        self.var_quast_ref = tk.StringVar(value="")
+        ttk.Entry(qf, textvariable=self.var_quast_ref).grid(row=1, column=1, columnspan=5, sticky="ew", padx=4)
+        ttk.Button(qf, text="Escolher…", command=lambda: self._pick(self.var_quast_ref)).grid(row=1, column=6, sticky="w")
 
         # Ações single
         btns = ttk.Frame(main)
         btns.pack(fill="x", padx=8, pady=4)
         ttk.Button(btns, text="Rodar montagem (job atual)", command=self._run_assembly_thread).pack(side="left")
         ttk.Button(btns, text="Interromper", command=self._stop_assembly).pack(side="left", padx=6)
+        self.var_use_cache = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btns, text="Usar cache (pular jobs idênticos já concluídos)",
+                        variable=self.var_use_cache).pack(side="left", padx=12)
+        self.var_compact = tk.StringVar(value="off")
+        ttk.Label(btns, text="Compactação pós-job").pack(side="left")
+        ttk.Combobox(btns, textvariable=self.var_compact, state="readonly",
+                     values=list(COMPACT_MODES), width=10).pack(side="left", padx=4)
+        self.var_max_runtime = tk.IntVar(value=0)
+        ttk.Label(btns, text="Tempo máx. (min, 0 = sem)").pack(side="left", padx=(12, 4))
+        ttk.Spinbox(btns, from_=0, to=10080, textvariable=self.var_max_runtime, width=6).pack(side="left")
+        self.var_idle_timeout = tk.IntVar(value=0)
+        ttk.Label(btns, text="Sem saída por (min, 0 = sem)").pack(side="left", padx=(12, 4))
+        ttk.Spinbox(btns, from_=0, to=1440, textvariable=self.var_idle_timeout, width=6).pack(side="left")
 
         # --------- Fila (batch) ----------
         batch = ttk.LabelFrame(main, text="Fila de Montagens (batch)")
@@ -214,14 +1609,35 @@ class AssemblyApp(tk.Tk):
         batch.columnconfigure(0, weight=1)
         batch.rowconfigure(0, weight=1)
 
-        self.batch_list = tk.Listbox(batch, height=8, selectmode="extended")
+        # Lista virtual: só as batch_rows linhas visíveis existem no Listbox; a barra de
+        # rolagem e a seleção (self.batch_sel) referem-se à fila inteira.
+        self.batch_list = tk.Listbox(batch, height=self.batch_rows, selectmode="extended")
         self.batch_list.grid(row=0, column=0, sticky="nsew")
-        sbatch = ttk.Scrollbar(batch, orient="vertical", command=self.batch_list.yview)
-        sbatch.grid(row=0, column=1, sticky="ns")
-        self.batch_list.configure(yscrollcommand=sbatch.set)
+        self.batch_scroll = ttk.Scrollbar(batch, orient="vertical", command=self._batch_yview)
+        self.batch_scroll.grid(row=0, column=1, sticky="ns")
+        self.batch_list.bind("<<ListboxSelect>>", self._batch_on_select)
+        for seq in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.batch_list.bind(seq, self._batch_on_wheel)
+        self.batch_eta = ttk.Label(batch, text="")
+        self.batch_eta.grid(row=3, column=0, columnspan=2, sticky="w")
 
         bbtns = ttk.Frame(batch)
-        bbtns.grid(row=1, column=0, columnspan=2, sticky="ew", pady=6)
+        bbtns.grid(row=2, column=0, columnspan=2, sticky="ew", pady=6)
+
+        pbtns = ttk.Frame(batch)
+        pbtns.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(6, 0))
+        self.var_queue_policy = tk.StringVar(value="fifo")
+        ttk.Label(pbtns, text="Ordem").pack(side="left")
+        pol = ttk.Combobox(pbtns, textvariable=self.var_queue_policy, state="readonly",
+                           values=list(QUEUE_POLICIES), width=10)
+        pol.pack(side="left", padx=4)
+        pol.bind("<<ComboboxSelected>>", self._batch_refresh)
+        ttk.Label(pbtns, text="(fifo = chegada; priority = maior prioridade; sjf = menor tempo previsto primeiro)").pack(side="left", padx=6)
+        ttk.Button(pbtns, text="Prioridade +1", command=lambda: self._batch_bump(1)).pack(side="left", padx=6)
+        ttk.Button(pbtns, text="Prioridade −1", command=lambda: self._batch_bump(-1)).pack(side="left")
+        self.var_priority = tk.IntVar(value=0)
+        ttk.Label(pbtns, text="Prioridade do job atual").pack(side="left", padx=(12, 4))
+        ttk.Spinbox(pbtns, from_=-100, to=100, textvariable=self.var_priority, width=5).pack(side="left")
         ttk.Button(bbtns, text="Adicionar job atual à fila", command=self._batch_add_current).pack(side="left")
         ttk.Button(bbtns, text="Remover selecionado(s)", command=self._batch_remove_selected).pack(side="left", padx=6)
         ttk.Button(bbtns, text="Carregar CSV…", command=self._batch_load_csv).pack(side="left", padx=6)
@@ -229,6 +1645,12 @@ class AssemblyApp(tk.Tk):
         ttk.Button(bbtns, text="Limpar fila", command=self._batch_clear).pack(side="left", padx=6)
         ttk.Button(bbtns, text="Executar fila", command=self._batch_run_thread).pack(side="left", padx=6)
         ttk.Button(bbtns, text="Parar fila", command=self._batch_stop).pack(side="left", padx=6)
+        ttk.Button(bbtns, text="Pular job atual", command=self._skip_current_job).pack(side="left", padx=6)
+        ttk.Button(bbtns, text="Verificar entradas", command=lambda: threading.Thread(
+            target=self._batch_verify, daemon=True).start()).pack(side="left", padx=6)
+        self.var_verify_inputs = tk.BooleanVar(value=True)
+        ttk.Checkbutton(bbtns, text="Verificar gzip/pares antes da fila",
+                        variable=self.var_verify_inputs).pack(side="left", padx=6)
 
         # Log
         self.txt = tk.Text(main, wrap="word", height=16)
@@ -250,8 +1672,14 @@ class AssemblyApp(tk.Tk):
         btns2.grid(row=1, column=0, columnspan=2, sticky="ew", pady=6)
         ttk.Button(btns2, text="Abrir selecionado(s)", command=self._open_selected).pack(side="left")
         ttk.Button(btns2, text="Abrir pasta de saídas", command=lambda: webbrowser.open_new_tab(f"file://{ASSEMBLY_DIR.resolve()}")).pack(side="left", padx=6)
+        ttk.Button(btns2, text="Compactar montagens concluídas", command=self._compact_existing).pack(side="left", padx=6)
+        ttk.Button(btns2, text="Estatísticas (N50/GC)", command=self._stats_thread).pack(side="left", padx=6)
+        ttk.Button(btns2, text="Grafos (GFA)", command=self._gfa_thread).pack(side="left", padx=6)
+        ttk.Button(btns2, text="Histórico de execuções", command=lambda: show_ledger_window(self)).pack(side="left", padx=6)
+        ttk.Button(btns2, text="Políticas de execução", command=lambda: show_policy_window(self)).pack(side="left", padx=6)
 
         self._update_outputs()
+        threading.Thread(target=self._refit_predictor, daemon=True).start()
 
     # ---------- Helpers UI ----------
     def _pick(self, var: tk.StringVar):
@@ -266,11 +1694,14 @@ class AssemblyApp(tk.Tk):
 
     # ---------- Single run ----------
     def _run_assembly_thread(self):
+        self.asm_stop_requested = False
+
         def target():
-            try:
-                self._run_job(self._collect_current_job())
-            finally:
-                pass
+            job = self._collect_current_job()
+            while job is not None:
+                if self._run_job(job) or self.asm_stop_requested:
+                    break
+                job = self._retry_job(job)
         threading.Thread(target=target, daemon=True).start()
 
     def _collect_current_job(self):
@@ -290,9 +1721,30 @@ class AssemblyApp(tk.Tk):
             "linear_seqs": int(self.var_linear.get()),
             "spades_careful": bool(self.var_sp_careful.get()),
             "spades_kmers": self.var_sp_kmers.get().strip(),
+            "resume": bool(self.var_resume.get()),
+            "compact": self.var_compact.get(),
+            "target_cov": int(self.var_target_cov.get()),
+            "genome_size": self.var_genome_size.get().strip(),
+            "long_target_cov": int(self.var_long_target_cov.get()),
+            "long_min_len": int(self.var_long_min_len.get()),
+            "priority": int(self.var_priority.get()),
+            "spades_memory": int(self.var_sp_memory.get()),
+            "max_retries": int(self.var_max_retries.get()),
+            "attempt": 0,
+            "max_runtime_min": int(self.var_max_runtime.get()),
+            "idle_timeout_min": int(self.var_idle_timeout.get()),
+            "race": self.var_race.get().strip() if self.var_tool.get() == "race" else "",
         }
 
     def _run_job(self, job):
+        """
+        Executa um job; retorna a pasta de saída se concluído (ou em cache), senão None.
+        A classe da falha fica em self.asm_last_failure (ver _classify_failure).
+        """
+        self.asm_last_failure = "input"
+        self.asm_last_quast = None
+        if job["tool"] == "race":
+            return self._run_race(job)
         # Validações
         tool = job["tool"]
         mode = job["mode"]
@@ -313,139 +1765,934 @@ class AssemblyApp(tk.Tk):
                 self._append_log(f"[{job['sample']}] ERRO: Unicycler (SE) requer SE ou long reads.\n")
                 return
 
-        outdir = (ASSEMBLY_DIR / job["sample"]).resolve()
+        # Cache: fingerprint de entradas + parâmetros
+        try:
+            key, inputs = _job_fingerprint(job)
+        except OSError as e:
+            self._append_log(f"[{job['sample']}] ERRO: entrada inacessível: {e}\n")
+            return
+        outdir, cached = _resolve_outdir(job["sample"], key)
+        if cached and self.var_use_cache.get():
+            self._append_log(f"[{job['sample']}] Cache: montagem idêntica já concluída em {outdir} (nada a fazer).\n")
+            self._update_outputs()
+            return outdir
+        prev = _read_manifest(outdir) if outdir.exists() else None
+        checkpoint = None
+        if tool == "spades" and job.get("resume", True) and prev and prev.get("status") != "ok":
+            checkpoint = _spades_checkpoint(outdir)
         outdir.mkdir(parents=True, exist_ok=True)
+        if outdir.name != job["sample"]:
+            self._append_log(f"[{job['sample']}] Parâmetros/entradas diferentes da montagem anterior -> nova pasta {outdir.name}\n")
+        manifest = {
+            "key": key, "tool": tool, "sample": job["sample"], "job": dict(job), "inputs": inputs,
+            "status": "running", "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        _write_manifest(outdir, manifest)
+
+        # Subamostragem por cobertura (curtas). Numa retomada o SPAdes reaproveita
+        # os caminhos gravados no params.txt, então o scratch anterior é mantido.
+        scratch = None
+        steps = []
+        if job.get("target_cov") and not checkpoint:
+            steps.append(self._subsample_job)
+        if tool == "unicycler" and longr and job.get("long_target_cov"):
+            steps.append(self._filter_long_job)
+        for step in steps:
+            job, used = step(job)
+            if job is None:
+                manifest["status"] = "failed"
+                _write_manifest(outdir, manifest)
+                return None
+            scratch = scratch or used
+        if self.asm_stop_requested:
+            # Parar durante a subamostragem/filtragem: não inicia a montagem
+            self._append_log(f"[{job['sample']}] [Interrompido pelo usuário]\n")
+            self.asm_last_failure = "stopped"
+            manifest["status"] = "stopped"
+            _write_manifest(outdir, manifest)
+            return None
 
         # Monta comando
-        if tool == "spades":
-            parts = ["spades.py", "-t", str(job["threads"]), "-o", str(outdir)]
-            if job["spades_careful"]:
-                parts += ["--careful"]
-            if job["spades_kmers"]:
-                parts += ["--kmers", job["spades_kmers"]]
-            if mode == "PE":
-                parts += ["-1", r1, "-2", r2]
+        if tool == "spades" and checkpoint:
+            # Mesmo fingerprint => mesmos parâmetros; só threads podem ter mudado.
+            # --continue não aceita outras opções; --restart-from last aceita -t/-m.
+            prev_job = prev.get("job") or {}
+            if (prev_job.get("threads"), prev_job.get("spades_memory") or 0) == \
+                    (job["threads"], job.get("spades_memory") or 0):
+                parts = ["spades.py", "--continue", "-o", str(outdir)]
             else:
-                parts += ["-s", se]
+                parts = ["spades.py", "--restart-from", "last", "-t", str(job["threads"]), "-o", str(outdir)]
+                if job.get("spades_memory"):
+                    parts += ["-m", str(job["spades_memory"])]
             cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
+            self._append_log(f"[{job['sample']}] [SPAdes] Retomando do checkpoint '{checkpoint}' em {outdir}\n")
             self._append_log(f"[{job['sample']}] [SPAdes] {cmd}\n")
         else:
-            parts = ["unicycler", "-o", str(outdir), "-t", str(job["threads"]),
-                     "--mode", job["uc_mode"],
-                     "--keep", str(job["keep"]),
-                     "--min_fasta_length", str(job["min_fasta_length"]),
-                     "--linear_seqs", str(job["linear_seqs"])]
-            if r1 and r2:
-                parts += ["-1", r1, "-2", r2]
-            if se:
-                parts += ["-s", se]
-            if longr:
-                parts += ["-l", longr]
-            cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
-            self._append_log(f"[{job['sample']}] [Unicycler] {cmd}\n")
+            cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in _assembler_parts(job, outdir)))
+            self._append_log(f"[{job['sample']}] [{'SPAdes' if tool == 'spades' else 'Unicycler'}] {cmd}\n")
 
         # Executa & streama
-        ret = self._run_and_stream(cmd, prefix=f"[{job['sample']}] ")
+        pred = self._job_prediction(job)
+        if pred:
+            self._append_log(f"[{job['sample']}] [previsão] ~{fmt_duration(pred['wall_s'])}"
+                             + (f", pico ~{pred['peak_mb'] / 1024:.1f} GB" if pred["peak_mb"] else "")
+                             + f" ({pred['n']} execução(ões) no histórico, nível {pred['level']}).\n")
+        ret = self._run_and_stream(cmd, prefix=f"[{job['sample']}] ",
+                                   max_runtime=60 * int(job.get("max_runtime_min") or 0),
+                                   idle_timeout=60 * int(job.get("idle_timeout_min") or 0),
+                                   expected=pred, policy=exec_policy(tool, job["threads"]))
+        if ret == 0:
+            manifest["status"] = "ok"
+        else:
+            manifest["status"] = "stopped" if self.asm_stop_requested else "failed"
+        if checkpoint:
+            manifest["resumed_from"] = checkpoint
+        if ret != 0:
+            self.asm_last_failure = _classify_failure(ret, self.asm_tail, self.asm_stop_requested,
+                                                      self.asm_watch.reason if self.asm_watch else None)
+            manifest["failure"] = self.asm_last_failure
+        manifest["attempt"] = int(job.get("attempt") or 0)
+        manifest["returncode"] = ret
+        manifest["resources"] = self.asm_timer.row()
+        manifest["policy"] = self.asm_policy.describe()
+        self._ledger_job(job, cmd, manifest)
+        threading.Thread(target=self._refit_predictor, daemon=True).start()
+        manifest["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        manifest["outputs"] = [p.name for p in _final_outputs(outdir, tool)]
+        _write_manifest(outdir, manifest)
         if ret == 0:
-            self._append_log(f"[{job['sample']}] Montagem concluída.\n")
+            self._assembly_done(job, outdir, scratch)
         else:
-            self._append_log(f"[{job['sample']}] Montagem finalizada com código {ret}.\n")
+            self._append_log(f"[{job['sample']}] Montagem finalizada com código {ret} ({self.asm_last_failure}).\n")
         self._update_outputs()
-
-    def _run_and_stream(self, cmd: str, prefix: str = "") -> int:
-        self.asm_stop_requested = False
+        return outdir if ret == 0 else None
+
+    def _assembly_done(self, job, outdir: Path, scratch):
+        """Pós-montagem bem-sucedida: QUAST, estatísticas no log, limpeza do scratch e compactação."""
+        self._append_log(f"[{job['sample']}] Montagem concluída.\n")
+        fasta = _final_fasta(outdir)
+        if fasta:
+            self.asm_last_quast = self._quast_submit(job["sample"], fasta)
+            try:
+                st = _fasta_stats(str(fasta))
+                self._append_log(
+                    f"[{job['sample']}] {st['contigs']} contigs, {st['total_length']} bp, "
+                    f"N50={st['n50']} L50={st['l50']} GC={st['gc_percent']}% circulares={st['circular']}\n"
+                )
+            except OSError as e:
+                self._append_log(f"[{job['sample']}] Estatísticas indisponíveis: {e}\n")
+        gfa = outdir / "assembly.gfa"
+        if gfa.exists():
+            try:
+                self._append_log(f"[{job['sample']}] Grafo: {_fmt_graph(_gfa_summary_cached(str(gfa)))}\n")
+            except (OSError, ValueError, IndexError) as e:
+                self._append_log(f"[{job['sample']}] Resumo do grafo indisponível: {e}\n")
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+        if job.get("compact", "off") in ("compress", "delete"):
+            self.compact_pool.submit(self._compact_job, job["sample"], outdir, job["compact"])
+
+    # ---------- Corrida de montadores ----------
+    def _run_race(self, job):
+        """
+        Roda os candidatos do job race em paralelo e mantém a melhor montagem (mesmo contrato
+        de _run_job: pasta da vencedora ou None, classe da falha em self.asm_last_failure).
+        """
+        sample = job["sample"]
+        try:
+            cands = _race_candidates(job)
+            errs = _validate_job(job)
+            if errs:
+                raise ValueError("; ".join(errs))
+            cands = [(spec, cand) + _job_fingerprint(cand) for spec, cand in cands]
+        except (ValueError, OSError) as e:
+            self._append_log(f"[{sample}] [race] ERRO: {e}\n")
+            return None
+        self.race_skip = False
+        self.race_watches = []
+        race_dir = (ASSEMBLY_DIR / f"{sample}_race").resolve()
+        genome = _parse_genome_size(job.get("genome_size"))
+        results = {}     # rótulo -> {"outdir", "stats"} das montagens concluídas
+        pending = []
+        for spec, cand, key, inputs in cands:
+            outdir, cached = _resolve_outdir(sample, key)
+            fasta = _final_fasta(outdir) if cached and self.var_use_cache.get() else None
+            if fasta:
+                st = _fasta_stats(str(fasta))
+                self._append_log(f"[{sample}] [race] {spec}: já montado em {outdir} (cache), N50={st['n50']}.\n")
+                results[spec] = {"outdir": outdir, "key": key, "cand": cand, "stats": st, "cached": True}
+            else:
+                pending.append((spec, cand, key, inputs))
+        if any(_race_dominates(r["stats"], genome) for r in results.values()):
+            pending = []
+
+        # Subamostragem/filtro uma vez só, compartilhados pelos candidatos
+        scratch = None
+        steps = []
+        if pending and job.get("target_cov"):
+            steps.append(self._subsample_job)
+        if job["long"] and job.get("long_target_cov") and any(c["tool"] == "unicycler" for _, c, _, _ in pending):
+            steps.append(self._filter_long_job)
+        reads = job
+        for step in steps:
+            reads, used = step(reads)
+            if reads is None:
+                return None
+            scratch = scratch or used
+        if self.asm_stop_requested:
+            self._append_log(f"[{sample}] [race] [Interrompido pelo usuário]\n")
+            self.asm_last_failure = "stopped"
+            return None
+
+        runs, done_q = [], Queue()
+        for spec, cand, key, inputs in pending:
+            run_dir = race_dir / re.sub(r"[^\w.-]+", "_", spec)
+            shutil.rmtree(run_dir, ignore_errors=True)
+            run_dir.mkdir(parents=True)
+            live = dict(cand, **{k: reads[k] for k in _INPUT_FIELDS})
+            cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in _assembler_parts(live, run_dir)))
+            run = {"spec": spec, "cand": cand, "live": live, "key": key, "outdir": run_dir, "cmd": cmd,
+                   "prefix": f"[{sample}] [{spec}] ", "tail": deque(maxlen=TAIL_LINES),
+                   "manifest": {"key": key, "tool": cand["tool"], "sample": sample, "job": dict(cand),
+                                "inputs": inputs, "status": "running", "race": job.get("race") or RACE_DEFAULT,
+                                "started": time.strftime("%Y-%m-%d %H:%M:%S")}}
+            _write_manifest(run_dir, run["manifest"])
+            self._append_log(f"{run['prefix']}{cmd}\n")
+            self._race_start(run, 60 * int(job.get("idle_timeout_min") or 0), done_q)
+            runs.append(run)
+
+        # Acompanha: pontua cada montagem concluída; dominância ou tempo esgotado cancelam o resto
+        limit = 60 * int(job.get("max_runtime_min") or 0)
+        t0 = time.monotonic()
+        left = len(runs)
+        if runs:
+            self._append_log(f"[{sample}] [race] {len(runs)} candidato(s) em paralelo, "
+                             f"{runs[0]['cand']['threads']} thread(s) cada.\n")
+        while left:
+            try:
+                run = done_q.get(timeout=1.0)
+            except Empty:
+                if limit and time.monotonic() - t0 > limit and not self._race_cancelling(runs):
+                    self._append_log(f"[{sample}] [race] tempo máximo atingido: cancelando os candidatos restantes.\n")
+                    self._race_cancel(runs, "timeout")
+                continue
+            left -= 1
+            fasta = _final_fasta(run["outdir"]) if run["ret"] == 0 else None
+            try:
+                st = _fasta_stats(str(fasta)) if fasta else None
+            except OSError as e:
+                self._append_log(f"{run['prefix']}FASTA final ilegível: {e}\n")
+                st = None
+            if st is None:
+                continue
+            results[run["spec"]] = {"outdir": run["outdir"], "key": run["key"], "cand": run["cand"], "stats": st}
+            self._append_log(f"{run['prefix']}concluído em {fmt_duration(run['timer'].wall_s)}: {st['contigs']} contigs, "
+                             f"N50={st['n50']}, maior={st['largest']} bp, circulares={st['circular']}\n")
+            if left and _race_dominates(st, genome) and not self._race_cancelling(runs):
+                self._append_log(f"[{sample}] [race] {run['spec']} domina (maior contig ≥ "
+                                 f"{RACE_DOMINANCE:.0%} do genoma): cancelando os demais.\n")
+                self._race_cancel(runs, "skipped")
+        self.race_watches = []
+
+        # Registro de cada candidato (manifesto + histórico)
+        for run in runs:
+            man = run["manifest"]
+            w = run["watch"]
+            if run["ret"] == 0:
+                man["status"] = "ok"
+            elif self.asm_stop_requested or (w and w.reason == "stopped"):
+                man["status"] = man["failure"] = "stopped"
+            elif w and w.reason in ("skipped", "timeout") and not self.race_skip:
+                man["status"], man["failure"] = "cancelled", "race_" + w.reason
+            else:
+                man["status"] = "failed"
+                man["failure"] = _classify_failure(run["ret"], run["tail"], False, w.reason if w else None)
+            man["returncode"] = run["ret"]
+            man["resources"] = run["timer"].row()
+            man["policy"] = run["policy"].describe()
+            man["finished"] = time.strftime("%Y-%m-%d %H:%M:%S")
+            man["outputs"] = [p.name for p in _final_outputs(run["outdir"], run["cand"]["tool"])]
+            _write_manifest(run["outdir"], man)
+            self._ledger_job(run["live"], run["cmd"], man, run["timer"], run["policy"])
+        if runs:
+            threading.Thread(target=self._refit_predictor, daemon=True).start()
+
+        if not results or self.asm_stop_requested or self.race_skip:
+            fails = [r["manifest"].get("failure") for r in runs]
+            self.asm_last_failure = ("stopped" if self.asm_stop_requested or self.race_skip else
+                                     "oom" if "oom" in fails else next((f for f in fails if f), "unknown"))
+            self._append_log(f"[{sample}] [race] nenhuma montagem concluída ({self.asm_last_failure}); "
+                             f"pastas dos candidatos em {race_dir}\n")
+            self._update_outputs()
+            return None
+
+        # Vencedora -> pasta normal da amostra; perdedoras removidas
+        spec, win = max(results.items(), key=lambda kv: _race_score(kv[1]["stats"]))
+        outdir = win["outdir"]
+        if not win.get("cached"):
+            outdir, _ = _resolve_outdir(sample, win["key"])
+            shutil.rmtree(outdir, ignore_errors=True)
+            shutil.move(str(win["outdir"]), str(outdir))
+        summary = {"winner": spec, "outdir": str(outdir), "race": job.get("race") or RACE_DEFAULT,
+                   "candidates": {k: {f: v["stats"][f] for f in STATS_FIELDS[2:]} for k, v in results.items()},
+                   "cancelled": [r["spec"] for r in runs if r["manifest"]["status"] == "cancelled"],
+                   "failed": [r["spec"] for r in runs if r["manifest"]["status"] == "failed"]}
+        with open(outdir / RACE_SUMMARY, "w") as fh:
+            json.dump(summary, fh, indent=2)
+        shutil.rmtree(race_dir, ignore_errors=True)
+        self._append_log(f"[{sample}] [race] vencedor: {spec} (N50={win['stats']['n50']}) -> {outdir}\n")
+        self._assembly_done(win["cand"], outdir, scratch)
+        self._update_outputs()
+        return outdir
+
+    def _race_start(self, run, idle_timeout, done_q):
+        """Inicia um candidato; um thread por candidato espera o EOF e entrega o resultado em done_q."""
+        run["watch"] = None
+        pol = run["policy"] = exec_policy(run["cand"]["tool"], run["cand"]["threads"])
+        self._append_log(run["prefix"] + f"[política] {pol.summary()}\n")
+        run["timer"] = RunTimer()
+        try:
+            proc = subprocess.Popen(pol.wrap(run["cmd"]), shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                    start_new_session=True)
+        except OSError as e:
+            self._append_log(run["prefix"] + f"Erro inesperado: {e}\n")
+            pol.release()
+            run["ret"] = -1
+            done_q.put(run)
+            return
+        pol.started(proc)
+        watch = run["watch"] = watchdog().watch(proc, 0, idle_timeout,
+                                                on_event=lambda t: self._append_log(run["prefix"] + t))
+        self.race_watches.append(watch)
+
+        def on_text(text):
+            watch.touch()
+            self._append_log(text)
+            run["tail"].extend(text.splitlines(True))
+        eof = output_mux().register(proc.stdout, run["prefix"], on_text)
+
+        def wait():
+            while not eof.wait(0.5):
+                if watch.reason and not watch.alive():
+                    break
+            watch.settle()
+            run["ret"] = run["timer"].finish(proc)
+            pol.release()
+            done_q.put(run)
+        threading.Thread(target=wait, daemon=True).start()
+
+    def _race_cancelling(self, runs) -> bool:
+        return any(r["watch"] and r["watch"].reason for r in runs)
+
+    def _race_cancel(self, runs, reason: str):
+        for r in runs:
+            if "ret" not in r:
+                watchdog().cancel(r["watch"], reason)
+
+    # ---------- Previsão (tempo/memória) ----------
+    def _refit_predictor(self):
+        self.predictor = RuntimePredictor.from_ledger()
+        # aproveita o thread para atualizar as bases guardadas dos jobs da fila (arquivos podem ter mudado)
+        for job in list(self.batch_queue):
+            self._store_job_bases(job)
+        self.after(0, self._batch_refresh)
+
+    def _job_prediction(self, job, cached_only: bool = False, bases=None):
+        """
+        Previsão para o job (bases efetivas: alvo de cobertura × genoma quando há subamostragem).
+        cached_only: sem I/O (uso na GUI): usa as bases guardadas no batch_meta do job, None
+        enquanto ainda não foram estimadas (_batch_estimate).
+        """
+        if bases is None:
+            bases = (self.batch_meta.get(id(job), {}).get("bases") if cached_only
+                     else _job_input_bases(job))
+            if bases is None:
+                return None
+        if job["tool"] == "race":
+            # candidatos em paralelo (mesmas entradas): o job dura o que durar o mais lento
+            try:
+                preds = [self._job_prediction(c, bases=bases) for _, c in _race_candidates(job)]
+            except ValueError:
+                return None
+            return max(preds, key=lambda p: p["wall_s"]) if all(preds) else None
+        if job.get("target_cov"):
+            target = job["target_cov"] * (_parse_genome_size(job.get("genome_size")) or DEFAULT_GENOME_SIZE)
+            bases = min(bases, target) if bases else target
+        return self.predictor.predict(job["tool"], bases, job["threads"], _normalize_job(job))
+
+    def _batch_eta_update(self):
+        """ETA da fila: restante do job em execução + soma dos pendentes; maior pico de memória previsto."""
+        total, peak, unknown, n = 0.0, 0.0, 0, 0
+        for job in self.batch_queue:
+            meta = self.batch_meta.get(id(job), {})
+            if meta.get("state") not in ("pending", "running"):
+                continue
+            n += 1
+            pred = self._job_prediction(job, cached_only=True)
+            if not pred:
+                unknown += 1
+                continue
+            left = pred["wall_s"]
+            if meta.get("state") == "running" and meta.get("t0"):
+                left = max(0.0, left - (time.monotonic() - meta["t0"]))
+            total += left
+            peak = max(peak, pred["peak_mb"] or 0)
+        if not n:
+            self.batch_eta.config(text="")
+            return
+        txt = f"Previsão: {n} job(s) restante(s), ~{fmt_duration(total)}"
+        if self.batch_running:
+            txt += f" (término ~{time.strftime('%d/%m %H:%M', time.localtime(time.time() + total))})"
+        if peak:
+            txt += f"; maior pico de memória ~{peak / 1024:.1f} GB"
+            mem = _total_mem_gb()
+            if mem and peak / 1024 > mem:
+                txt += f" (ACIMA dos {mem} GB da máquina)"
+        if unknown:
+            txt += f"; {unknown} sem histórico suficiente"
+        self.batch_eta.config(text=txt)
+        if self._eta_after:
+            self.after_cancel(self._eta_after)
+            self._eta_after = None
+        if self.batch_running:
+            self._eta_after = self.after(30000, self._batch_eta_update)
+
+    def _ledger_job(self, job, cmd, manifest, timer=None, policy=None):
+        """Registra a execução no histórico (nb_runs.sqlite); entradas = as efetivamente usadas."""
+        paths = [job[k] for k in _INPUT_FIELDS if job.get(k)]
+        ledger_record(
+            app="assembly", tool=job["tool"], sample=job["sample"], argv=cmd,
+            params=dict(_normalize_job(job), attempt=int(job.get("attempt") or 0)),
+            input_bytes=sum(os.path.getsize(p) for p in paths if os.path.exists(p)),
+            input_bases=_job_input_bases(job), threads=job["threads"],
+            status=manifest["status"] if manifest["status"] == "ok" else manifest.get("failure", manifest["status"]),
+            policy=(policy or self.asm_policy).summary(), **(timer or self.asm_timer).row())
+
+    def _retry_job(self, job):
+        """Job degradado para nova tentativa após falha retentável, ou None."""
+        new, notes = _degrade_job(job, self.asm_last_failure)
+        if new is None:
+            if self.asm_last_failure in RETRYABLE_FAILURES and job.get("max_retries"):
+                self._append_log(f"[{job['sample']}] Limite de tentativas atingido ({job['max_retries']}).\n")
+            return None
+        self._append_log(
+            f"[{job['sample']}] Falha '{self.asm_last_failure}': nova tentativa "
+            f"{new['attempt']}/{new['max_retries']} ({notes}).\n"
+        )
+        return new
+
+    def _run_and_stream(self, cmd: str, prefix: str = "", max_runtime: float = 0, idle_timeout: float = 0,
+                        expected=None, policy=None) -> int:
+        """
+        Roda cmd com saída no log. O watchdog encerra o grupo do processo (SIGTERM -> SIGKILL)
+        por parada/pulo do usuário, tempo máximo (max_runtime, s) ou silêncio (idle_timeout, s);
+        o motivo fica em self.asm_watch.reason. expected (RuntimePredictor.predict) só gera aviso
+        quando a execução passa muito do previsto. policy (exec_policy) fica em self.asm_policy.
+        A flag de parada (self.asm_stop_requested) é zerada por quem inicia a execução, não aqui.
+        """
+        self.asm_tail = deque(maxlen=TAIL_LINES)
+        self.asm_watch = None
+        pol = self.asm_policy = policy or exec_policy("")
+        if policy:
+            self._append_log(prefix + f"[política] {pol.summary()}\n")
+        self.asm_timer = RunTimer()
+        def on_text(text):
+            watch.touch()
+            self._append_log(text)
+            self.asm_tail.extend(text.splitlines(True))
         try:
             self.asm_current_proc = subprocess.Popen(
-                cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
-                preexec_fn=os.setsid if hasattr(os, "setsid") else None, bufsize=1
+                pol.wrap(cmd), shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                start_new_session=True
             )
-            for line in iter(self.asm_current_proc.stdout.readline, ""):
-                if line:
-                    self._append_log(prefix + line)
-                if self.asm_stop_requested and self.asm_current_proc and self.asm_current_proc.poll() is None:
-                    try:
-                        if hasattr(os, "setsid"):
-                            os.killpg(os.getpgid(self.asm_current_proc.pid), signal.SIGTERM)
-                        else:
-                            self.asm_current_proc.terminate()
-                    except Exception:
-                        pass
-                    self._append_log(prefix + "[Interrompido pelo usuário]\n")
+            pol.started(self.asm_current_proc)
+            watch = self.asm_watch = watchdog().watch(
+                self.asm_current_proc, max_runtime, idle_timeout, on_event=lambda t: self._append_log(prefix + t))
+            # saída lida pelo thread de I/O compartilhado; aqui só esperamos EOF
+            eof = output_mux().register(self.asm_current_proc.stdout, prefix, on_text)
+            while not eof.wait(0.5):
+                # grupo encerrado mas algum neto (fora do grupo) segura o pipe: não espera por ele
+                if watch.reason and not watch.alive():
                     break
-            ret = self.asm_current_proc.wait()
+                if expected and time.monotonic() - self.asm_timer.t0 > expected["limit_s"]:
+                    self._append_log(prefix + f"[previsão] AVISO: rodando há {fmt_duration(time.monotonic() - self.asm_timer.t0)}; "
+                                     f"previsto ~{fmt_duration(expected['wall_s'])} (fora da curva do histórico).\n")
+                    expected = None
+            watch.settle()
+            ret = self.asm_timer.finish(self.asm_current_proc)
+            if watch.reason in ("stopped", "skipped"):
+                self._append_log(prefix + ("[Interrompido pelo usuário]\n" if watch.reason == "stopped"
+                                           else "[Job pulado pelo usuário]\n"))
             self.asm_current_proc = None
             return ret
         except Exception as e:
             self._append_log(prefix + f"Erro inesperado: {e}\n")
             return -1
+        finally:
+            pol.release()
+
+    # ---------- Subamostragem ----------
+    def _estimate_genome_size(self, sample: str) -> tuple:
+        """(bp, origem): montagem anterior concluída da amostra ou valor padrão."""
+        for man_path in sorted(ASSEMBLY_DIR.glob(f"{sample}*/{MANIFEST_NAME}")):
+            man = _read_manifest(man_path.parent)
+            fasta = _final_fasta(man_path.parent)
+            if man and man.get("sample") == sample and man.get("status") == "ok" and fasta:
+                try:
+                    return _fasta_stats(str(fasta))["total_length"], f"montagem anterior ({man_path.parent.name})"
+                except OSError:
+                    continue
+        prof = _read_kmer_profile(sample)
+        if prof and prof.get("genome_size"):
+            return int(prof["genome_size"]), "espectro de k-mers"
+        return DEFAULT_GENOME_SIZE, "padrão"
+
+    def _subsample_job(self, job):
+        """
+        Retorna (job_com_leituras_subamostradas, pasta_scratch) ou (job, None) se não for preciso.
+        Em caso de erro retorna (None, None).
+        """
+        sample = job["sample"]
+        names = ("r1", "r2") if job["mode"] == "PE" and job["r1"] and job["r2"] else ("se",) if job["se"] else ()
+        if not names:
+            return job, None
+        gsize = _parse_genome_size(job.get("genome_size"))
+        origin = "informado"
+        if not gsize:
+            gsize, origin = self._estimate_genome_size(sample)
+        target = int(job["target_cov"]) * gsize
+        self._append_log(f"[{sample}] Subamostragem: alvo {job['target_cov']}× de {gsize:,} bp ({origin}).\n")
+
+        scratch = (SCRATCH_DIR / sample).resolve()
+        scratch.mkdir(parents=True, exist_ok=True)
+        srcs = [job[n] for n in names]
+        outs = [str(scratch / f"{sample}_sub{job['target_cov']}x_{n.upper()}.fastq.gz") for n in names]
+        try:
+            sig = hashlib.sha1(json.dumps(
+                {"src": [_file_fingerprint(p) for p in srcs], "target": target, "seed": SUBSAMPLE_SEED},
+                sort_keys=True).encode()).hexdigest()
+            side = scratch / "nb_subsample.json"
+            prev = json.loads(side.read_text()) if side.exists() else {}
+            if prev.get("sig") == sig and all(Path(o).exists() for o in prev.get("outputs", [])):
+                info = prev["info"]
+                self._append_log(f"[{sample}] Subamostragem reaproveitada de {scratch}.\n")
+            else:
+                info = _subsample_reads(srcs, outs, target,
+                                        log=lambda m: self._append_log(f"[{sample}] Subamostragem: {m}"))
+                if info["subsampled"]:
+                    side.write_text(json.dumps({"sig": sig, "outputs": outs, "info": info}, indent=2))
+        except (OSError, EOFError, ValueError, gzip.BadGzipFile) as e:
+            self._append_log(f"[{sample}] ERRO na subamostragem: {e}\n")
+            return None, None
+
+        est_cov = info["est_bases"] / gsize if gsize else 0
+        if not info["subsampled"]:
+            self._append_log(f"[{sample}] Cobertura estimada {est_cov:.0f}× ≤ alvo; usando leituras originais.\n")
+            return job, None
+        self._append_log(
+            f"[{sample}] Subamostragem: {est_cov:.0f}× -> {info['kept_bases'] / gsize:.0f}× "
+            f"({info['kept_bases']:,} bases) em {scratch}\n"
+        )
+        job = dict(job)
+        for n, o in zip(names, outs):
+            job[n] = o
+        return job, scratch
+
+    def _filter_long_job(self, job):
+        """Filtro de long reads (Unicycler híbrido). Mesmo contrato de _subsample_job."""
+        sample = job["sample"]
+        gsize = _parse_genome_size(job.get("genome_size"))
+        origin = "informado"
+        if not gsize:
+            gsize, origin = self._estimate_genome_size(sample)
+        target = int(job["long_target_cov"]) * gsize
+        min_len = int(job.get("long_min_len") or 0)
+        self._append_log(
+            f"[{sample}] Long reads: alvo {job['long_target_cov']}× de {gsize:,} bp ({origin}), "
+            f"mínimo {min_len} bp.\n"
+        )
+        scratch = (SCRATCH_DIR / sample).resolve()
+        scratch.mkdir(parents=True, exist_ok=True)
+        out = str(scratch / f"{sample}_long_{job['long_target_cov']}x.fastq.gz")
+        try:
+            sig = hashlib.sha1(json.dumps(
+                {"src": _file_fingerprint(job["long"]), "target": target, "min_len": min_len},
+                sort_keys=True).encode()).hexdigest()
+            side = scratch / "nb_longfilter.json"
+            prev = json.loads(side.read_text()) if side.exists() else {}
+            if prev.get("sig") == sig and Path(out).exists() and prev["info"].get("kept_reads"):
+                info = prev["info"]
+                self._append_log(f"[{sample}] Long reads filtradas reaproveitadas de {scratch}.\n")
+            else:
+                info = _filter_long_reads(job["long"], out, target, min_len)
+                if info["filtered"]:
+                    side.write_text(json.dumps({"sig": sig, "info": info}, indent=2))
+        except (OSError, EOFError, gzip.BadGzipFile) as e:
+            self._append_log(f"[{sample}] ERRO no filtro de long reads: {e}\n")
+            return None, None
+        if not info["filtered"] and info["reads"] and not info["kept_reads"]:
+            self._append_log(f"[{sample}] Long reads: nenhuma das {info['reads']:,} leituras tem ≥ {min_len} bp; "
+                             f"filtro ignorado, usando arquivo original.\n")
+            return job, None
+        if not info["filtered"]:
+            self._append_log(f"[{sample}] Long reads: {info['bases']:,} bases já ≤ alvo; usando arquivo original.\n")
+            return job, None
+        self._append_log(
+            f"[{sample}] Long reads: {info['reads']:,} leituras/{info['bases']:,} bases -> "
+            f"{info['kept_reads']:,}/{info['kept_bases']:,} ({info['kept_bases'] / gsize:.0f}×)\n"
+        )
+        job = dict(job)
+        job["long"] = out
+        return job, scratch
 
-    def _stop_assembly(self):
-        self.asm_stop_requested = True
-        if self.asm_current_proc and self.asm_current_proc.poll() is None:
+    # ---------- Espectro de k-mers ----------
+    def _kmer_thread(self):
+        job = self._collect_current_job()
+        paths = [p for p in ((job["r1"], job["r2"]) if job["mode"] == "PE" else (job["se"],)) if p]
+        if not paths:
+            messagebox.showwarning("k-mers", "Informe as leituras curtas (R1/R2 ou SE) do job atual.")
+            return
+        sample = job["sample"]
+        self.var_kmer_info.set("estimando…")
+        def target():
+            self._append_log(f"[{sample}] [k-mers] Contando k={KMER_K} em até {KMER_MAX_READS:,} leituras/arquivo…\n")
             try:
-                if hasattr(os, "setsid"):
-                    os.killpg(os.getpgid(self.asm_current_proc.pid), signal.SIGTERM)
-                else:
-                    self.asm_current_proc.terminate()
+                prof = _kmer_profile(paths)
+            except Exception as e:
+                self._append_log(f"[{sample}] [k-mers] ERRO: {e}\n")
+                self.after(0, lambda: self.var_kmer_info.set("falhou"))
+                return
+            prof.update(sample=sample, inputs=paths, when=time.strftime("%Y-%m-%d %H:%M:%S"))
+            KMER_DIR.mkdir(parents=True, exist_ok=True)
+            with open(KMER_DIR / f"{sample}.json", "w") as fh:
+                json.dump(prof, fh)
+            with open(KMER_DIR / f"{sample}_hist.tsv", "w") as fh:
+                fh.writelines(f"{c}\t{n}\n" for c, n in enumerate(prof["hist"]) if c and n)
+            self._append_log(f"[{sample}] [k-mers] {self._kmer_summary(prof)}\n")
+            self.after(0, lambda: self._kmer_apply(prof))
+        threading.Thread(target=target, daemon=True).start()
+
+    def _kmer_summary(self, prof) -> str:
+        txt = (f"genoma ≈ {prof['genome_size'] / 1e6:.2f} Mb, cobertura ≈ {prof['coverage']:.0f}×, "
+               f"k-mers de erro {100 * prof['error_kmer_fraction']:.1f}%, "
+               f"pico={prof['kmer_peak']} vale={prof['error_trough']}")
+        if prof["secondary_peak_half"]:
+            txt += " — pico secundário em cobertura/2 (heterozigose ou contaminação?)"
+        # SPAdes/Unicycler: memória ~ k-mers distintos (erros incluídos) × ~32 bytes (aprox.)
+        txt += f"; memória estimada ≈ {max(4, prof['distinct_kmers_est'] * 32 / 1e9):.0f} GB"
+        return txt
+
+    def _kmer_apply(self, prof):
+        """Preenche o formulário com as estimativas (sem sobrescrever valores informados)."""
+        if prof["genome_size"] and not self.var_genome_size.get().strip():
+            self.var_genome_size.set(f"{prof['genome_size'] / 1e6:.2f}m")
+        if prof["coverage"] > 150 and not self.var_target_cov.get():
+            self.var_target_cov.set(100)
+        self.var_kmer_info.set(f"{prof['genome_size'] / 1e6:.2f} Mb, {prof['coverage']:.0f}×, "
+                               f"erro {100 * prof['error_kmer_fraction']:.1f}%")
+
+    # ---------- QUAST ----------
+    def _quast_reference(self):
+        """(fasta_preparado, tamanho) da referência do formulário, ou (None, 0)."""
+        ref = self.var_quast_ref.get().strip()
+        if not ref:
+            return None, 0
+        try:
+            return _prepare_reference(ref)
+        except OSError as e:
+            self._append_log(f"[QUAST] Referência inválida ({ref}): {e}\n")
+            return None, 0
+
+    def _quast_submit(self, sample: str, fasta: Path):
+        if not self.var_quast.get():
+            return None
+        fut = self.quast_pool.submit(self._quast_run, [str(fasta)], [sample],
+                                     QUAST_DIR / fasta.parent.name, False)
+        with self.quast_lock:
+            self.quast_futures = [f for f in self.quast_futures if not f.done()] + [fut]
+        return fut
+
+    def _quast_run(self, fastas, labels, outdir: Path, with_ref: bool) -> int:
+        """Roda quast.py (saída completa em <outdir>/nb_quast_stdout.log)."""
+        ref, ref_len = self._quast_reference()
+        parts = ["quast.py", "-o", str(outdir), "-t", str(self.var_quast_threads.get()),
+                 "-l", ",".join(labels)]
+        if ref and with_ref:
+            parts += ["-r", ref]
+        elif ref_len:
+            parts += ["--est-ref-size", str(ref_len)]
+        parts += fastas
+        outdir.mkdir(parents=True, exist_ok=True)
+        cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
+        tag = labels[0] if len(labels) == 1 else f"{len(labels)} amostras"
+        self._append_log(f"[QUAST] ({tag}) {cmd}\n")
+        pol = exec_policy("quast", self.var_quast_threads.get())
+        self._append_log(f"[QUAST] ({tag}) [política] {pol.summary()}\n")
+        with open(outdir / "nb_quast_stdout.log", "w") as fh:
+            try:
+                ret = subprocess.run(pol.wrap(cmd), shell=True, stdout=fh, stderr=subprocess.STDOUT,
+                                     start_new_session=True).returncode
+            finally:
+                pol.release()
+        report = outdir / "report.html"
+        if ret == 0 and report.exists():
+            self._append_log(f"[QUAST] ({tag}) relatório: {report}\n")
+        else:
+            self._append_log(f"[QUAST] ({tag}) falhou com código {ret} (ver {outdir / 'nb_quast_stdout.log'}).\n")
+        self.after(0, self._update_outputs)
+        return ret
+
+    def _quast_compare(self, outdirs):
+        """Relatório comparativo de todas as montagens concluídas na fila (aguarda os QUAST por amostra)."""
+        fastas, labels = [], []
+        for d in outdirs:
+            fasta = _final_fasta(d)
+            if fasta:
+                fastas.append(str(fasta))
+                labels.append(d.name)
+        if len(fastas) < 2:
+            return
+        with self.quast_lock:
+            waiting = list(self.quast_futures)
+        for fut in waiting:
+            try:
+                fut.result()
             except Exception:
                 pass
+        with self.quast_lock:
+            self.quast_futures = [f for f in self.quast_futures if f not in waiting]
+        out = QUAST_DIR / time.strftime("batch_%Y%m%d_%H%M%S")
+        self._quast_run(fastas, labels, out, True)
+
+    def _compact_job(self, sample: str, outdir: Path, mode: str):
+        try:
+            before, after, n = _compact_outdir(outdir, mode)
+        except Exception as e:
+            self._append_log(f"[{sample}] [compactação] ERRO: {e}\n")
+            return
+        if not n:
+            self._append_log(f"[{sample}] [compactação] nada a compactar em {outdir.name}.\n")
+            return
+        self._append_log(
+            f"[{sample}] [compactação] {mode}: {n} item(ns); {_fmt_bytes(before)} -> {_fmt_bytes(after)} "
+            f"(-{_fmt_bytes(before - after)})\n"
+        )
+        man = _read_manifest(outdir) or {}
+        man["compaction"] = {"mode": mode, "items": n, "bytes_before": before, "bytes_after": after,
+                             "when": time.strftime("%Y-%m-%d %H:%M:%S")}
+        _write_manifest(outdir, man)
+        with _COMPACT_REPORT_LOCK, open(COMPACT_REPORT, "a", newline="") as fh:
+            wr = csv.writer(fh, delimiter="\t")
+            if fh.tell() == 0:
+                wr.writerow(["when", "sample", "outdir", "mode", "items", "bytes_before", "bytes_after"])
+            wr.writerow([man["compaction"]["when"], sample, outdir.name, mode, n, before, after])
+
+    def _compact_existing(self):
+        """Aplica a compactação escolhida a todas as montagens concluídas (status ok)."""
+        mode = self.var_compact.get()
+        if mode not in ("compress", "delete"):
+            messagebox.showinfo("Compactação", "Escolha 'compress' ou 'delete' em Compactação pós-job.")
+            return
+        if mode == "delete" and not messagebox.askyesno(
+                "Compactação", "Remover intermediários de TODAS as montagens concluídas?"):
+            return
+        n = 0
+        for man_path in sorted(ASSEMBLY_DIR.glob(f"*/{MANIFEST_NAME}")):
+            man = _read_manifest(man_path.parent)
+            if man and man.get("status") == "ok":
+                self.compact_pool.submit(self._compact_job, man.get("sample", man_path.parent.name),
+                                         man_path.parent, mode)
+                n += 1
+        self._append_log(f"[compactação] {n} pasta(s) enviadas para compactação ({mode}).\n")
+
+    def _stop_assembly(self):
+        self.asm_stop_requested = True
+        for w in [self.asm_watch] + list(self.race_watches):
+            watchdog().cancel(w, "stopped")
+
+    def _skip_current_job(self):
+        """Encerra só o job em execução; a fila segue para o próximo (sem nova tentativa)."""
+        if self.asm_current_proc is None and not self.race_watches:
+            return
+        self._append_log("[batch] Pulando o job atual…\n")
+        self.race_skip = True
+        for w in [self.asm_watch] + list(self.race_watches):
+            watchdog().cancel(w, "skipped")
 
     # ---------- Batch/Fila ----------
     def _batch_add_current(self):
-        job = self._collect_current_job()
+        self._batch_append(self._collect_current_job())
+
+    def _batch_append(self, job, refresh=True):
+        self.batch_meta[id(job)] = {"seq": self.batch_seq, "state": "pending"}
+        self.batch_seq += 1
         self.batch_queue.append(job)
-        self.batch_list.insert("end", self._job_label(job))
+        if refresh:
+            self._batch_estimate([job])
+            self._batch_refresh()
+
+    def _store_job_bases(self, job):
+        """Estima (thread de fundo) e guarda em batch_meta as bases de entrada do job."""
+        bases = _job_input_bases(job)
+        meta = self.batch_meta.get(id(job))
+        if meta is not None:
+            meta["bases"] = bases
+
+    def _batch_estimate(self, jobs):
+        """Estima as bases de entrada em segundo plano (ETA/sjf); redesenha a fila ao terminar."""
+        jobs = [j for j in jobs if self.batch_meta.get(id(j), {}).get("bases") is None]
+        if not jobs:
+            return
+        futs = [self.estimate_pool.submit(self._store_job_bases, j) for j in jobs]
+        def wait_all():
+            for f in futs:
+                f.exception()
+            self.after(0, self._batch_refresh)
+        threading.Thread(target=wait_all, daemon=True).start()
 
     def _batch_remove_selected(self):
-        sel = list(self.batch_list.curselection())
-        if not sel:
+        if not self.batch_sel:
             return
-        for idx in reversed(sel):
-            self.batch_list.delete(idx)
-            del self.batch_queue[idx]
+        # o job em execução sai só com "Parar fila"; o resto numa passada só
+        drop = {i for i in self.batch_sel if self.batch_meta.get(i, {}).get("state") != "running"}
+        self.batch_queue[:] = [j for j in self.batch_queue if id(j) not in drop]
+        for i in drop:
+            self.batch_meta.pop(i, None)
+        self.batch_sel -= drop
+        self._batch_refresh()
 
     def _batch_clear(self):
-        self.batch_queue.clear()
-        self.batch_list.delete(0, "end")
+        keep = [j for j in self.batch_queue if self.batch_meta.get(id(j), {}).get("state") == "running"]
+        self.batch_queue[:] = keep
+        self.batch_meta = {id(j): self.batch_meta[id(j)] for j in keep}
+        self.batch_sel &= set(self.batch_meta)
+        self._batch_refresh()
 
     def _job_label(self, job):
-        tool = job["tool"]
+        tool = job["tool"] if job["tool"] != "race" else f"race({job.get('race') or RACE_DEFAULT})"
         mode = job["mode"]
         lr = " +long" if bool(job["long"]) else ""
-        return f"{job['sample']} — {tool} [{mode}{lr}] threads={job['threads']}"
+        prio = f" prio={job['priority']}" if job.get("priority") else ""
+        retry = f" tentativa={job['attempt']}" if job.get("attempt") else ""
+        pred = self._job_prediction(job, cached_only=True)
+        eta = f"  (~{fmt_duration(pred['wall_s'])})" if pred else ""
+        return f"{job['sample']} — {tool} [{mode}{lr}] threads={job['threads']}{prio}{retry}{eta}"
+
+    # ---------- Ordem da fila ----------
+    def _batch_sort_key(self, job):
+        policy = self.var_queue_policy.get()
+        seq = self.batch_meta.get(id(job), {}).get("seq", 0)
+        if policy == "priority":
+            return (-int(job.get("priority") or 0), seq)
+        if policy == "sjf":
+            # menor tempo previsto primeiro (sem histórico: menor entrada em bases estimadas);
+            # prioridade desempata antes da ordem de chegada
+            pred = self._job_prediction(job, cached_only=True)
+            bases = self.batch_meta.get(id(job), {}).get("bases")
+            return (0 if pred else (1 if bases is not None else 2), pred["wall_s"] if pred else (bases or 0),
+                    -int(job.get("priority") or 0), seq)
+        return (seq,)
+
+    def _batch_refresh(self, *_):
+        """Reordena os jobs pendentes pela política e redesenha a lista (concluídos/em execução no topo)."""
+        state = lambda j: self.batch_meta.get(id(j), {}).get("state", "pending")
+        started = [j for j in self.batch_queue if state(j) != "pending"]
+        pending = sorted((j for j in self.batch_queue if state(j) == "pending"), key=self._batch_sort_key)
+        self.batch_queue[:] = started + pending
+        self._batch_render()
+        self._batch_eta_update()
+
+    def _batch_render(self):
+        """Desenha só as linhas visíveis da fila (custo constante, mesmo com milhares de jobs)."""
+        n = len(self.batch_queue)
+        self.batch_top = max(0, min(self.batch_top, n - self.batch_rows))
+        marks = {"running": "▶ ", "done": "✓ ", "failed": "✗ ", "pending": "   "}
+        view = self.batch_queue[self.batch_top:self.batch_top + self.batch_rows]
+        self.batch_list.delete(0, "end")
+        for i, job in enumerate(view):
+            state = self.batch_meta.get(id(job), {}).get("state", "pending")
+            self.batch_list.insert("end", marks[state] + self._job_label(job))
+            if id(job) in self.batch_sel:
+                self.batch_list.selection_set(i)
+        if n > self.batch_rows:
+            self.batch_scroll.set(self.batch_top / n, (self.batch_top + len(view)) / n)
+        else:
+            self.batch_scroll.set(0, 1)
+
+    def _batch_yview(self, *args):
+        n = len(self.batch_queue)
+        if args[0] == "moveto":
+            self.batch_top = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = int(args[1]) * (self.batch_rows if args[2] == "pages" else 1)
+            self.batch_top += step
+        self._batch_render()
+
+    def _batch_on_wheel(self, event):
+        if event.num == 4 or getattr(event, "delta", 0) > 0:
+            self._batch_yview("scroll", -3, "units")
+        else:
+            self._batch_yview("scroll", 3, "units")
+        return "break"
+
+    def _batch_on_select(self, _event=None):
+        view = self.batch_queue[self.batch_top:self.batch_top + self.batch_rows]
+        self.batch_sel -= {id(j) for j in view}
+        self.batch_sel |= {id(view[i]) for i in self.batch_list.curselection() if i < len(view)}
+
+    def _batch_next(self):
+        """Próximo job pendente (a fila já está ordenada pela política)."""
+        for job in self.batch_queue:
+            if self.batch_meta.get(id(job), {}).get("state") == "pending":
+                return job
+        return None
+
+    def _batch_bump(self, delta: int):
+        """Altera a prioridade dos jobs selecionados (vale também com a fila rodando)."""
+        for job in self.batch_queue:
+            if id(job) in self.batch_sel:
+                job["priority"] = int(job.get("priority") or 0) + delta
+        if self.var_queue_policy.get() == "fifo" and self.batch_sel:
+            self.var_queue_policy.set("priority")
+        self._batch_refresh()
 
     def _batch_load_csv(self):
         path = filedialog.askopenfilename(filetypes=[("CSV", "*.csv"), ("All", "*.*")])
         if not path:
             return
-        loaded = 0
+        policy = ""
+        rows = []
         with open(path, newline="") as fh:
             rd = csv.DictReader(fh)
             # Se não tiver cabeçalho, tentar ler como lista simples
             if rd.fieldnames is None:
                 self._append_log("[batch] CSV sem cabeçalho não suportado — adicione cabeçalho.\n")
                 return
-            for row in rd:
-                job = {
-                    "sample": (row.get("sample") or "sample1").strip(),
-                    "tool": (row.get("tool") or "unicycler").strip(),
-                    "mode": (row.get("mode") or "PE").strip().upper(),
-                    "r1": (row.get("r1") or "").strip(),
-                    "r2": (row.get("r2") or "").strip(),
-                    "se": (row.get("se") or "").strip(),
-                    "long": (row.get("long") or "").strip(),
-                    "threads": int(row.get("threads") or 16),
-                    "uc_mode": (row.get("uc_mode") or "normal").strip(),
-                    "keep": int(row.get("keep") or 1),
-                    "min_fasta_length": int(row.get("min_fasta_length") or 100),
-                    "linear_seqs": int(row.get("linear_seqs") or 0),
-                    "spades_careful": (str(row.get("spades_careful") or "1").lower() in ("1","true","yes","y")),
-                    "spades_kmers": (row.get("spades_kmers") or "").strip(),
-                }
-                self.batch_queue.append(job)
-                self.batch_list.insert("end", self._job_label(job))
-                loaded += 1
-        self._append_log(f"[batch] {loaded} job(s) carregado(s) de {path}\n")
+            for lineno, row in enumerate(rd, start=2):
+                job, errs = JobRecord.from_row(row)
+                pol = (row.get("policy") or "").strip().lower()
+                if pol in QUEUE_POLICIES and not policy:
+                    policy = pol
+                rows.append((lineno, job, errs))
+        # Validação de todas as linhas antes de enfileirar (stat em paralelo)
+        with ThreadPoolExecutor(max_workers=min(16, (os.cpu_count() or 4) * 2)) as ex:
+            checks = list(ex.map(lambda r: r[2] or _validate_job(r[1]), rows))
+        bad = 0
+        for (lineno, job, _), errs in zip(rows, checks):
+            if errs:
+                bad += 1
+                self._append_log(f"[batch] linha {lineno} ({job['sample']}): {'; '.join(errs)}\n")
+                continue
+            self._batch_append(job, refresh=False)
+        if policy:
+            self.var_queue_policy.set(policy)
+        self._batch_estimate(self.batch_queue)
+        self._batch_refresh()
+        self._append_log(f"[batch] {len(rows) - bad} job(s) carregado(s) de {path}"
+                         + (f"; {bad} linha(s) com erro ignorada(s)" if bad else "") + "\n")
+        if bad:
+            messagebox.showwarning("Planilha", f"{bad} de {len(rows)} linha(s) com erro não foram "
+                                   "enfileiradas.\nDetalhes linha a linha no log.")
 
     def _batch_save_csv(self):
         if not self.batch_queue:
@@ -454,46 +2701,323 @@ class AssemblyApp(tk.Tk):
         path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
         if not path:
             return
-        fields = ["sample","tool","mode","r1","r2","se","long","threads","uc_mode","keep",
-                  "min_fasta_length","linear_seqs","spades_careful","spades_kmers"]
+        fields = list(JOB_FIELDS) + ["policy"]
+        policy = self.var_queue_policy.get()
         with open(path, "w", newline="") as fh:
-            wr = csv.DictWriter(fh, fieldnames=fields)
+            wr = csv.DictWriter(fh, fieldnames=fields, extrasaction="ignore")
             wr.writeheader()
             for job in self.batch_queue:
-                wr.writerow(job)
+                wr.writerow(dict(job, policy=policy))
         self._append_log(f"[batch] Fila salva em {path}\n")
 
     def _batch_run_thread(self):
-        if self.batch_running:
-            messagebox.showwarning("Fila", "A fila já está em execução.")
+        if self.batch_running or self.pipe_running:
+            messagebox.showwarning("Fila", "A fila (ou o pipeline) já está em execução.")
             return
         if not self.batch_queue:
             messagebox.showinfo("Fila", "A fila está vazia.")
             return
         self.batch_running = True
+        self.asm_stop_requested = False
         self._append_log("[batch] Iniciando execução sequencial da fila…\n")
+        for job in self.batch_queue:
+            # original que já ganhou uma nova tentativa na fila não volta (senão a amostra roda duas vezes)
+            if not self.batch_meta[id(job)].get("superseded"):
+                self.batch_meta[id(job)]["state"] = "pending"
+        self._batch_refresh()
+        verify = bool(self.var_verify_inputs.get())
         def target():
+            done = []
+            idx = 0
             try:
-                for idx, job in enumerate(list(self.batch_queue)):
-                    if not self.batch_running:
+                if verify:
+                    self._batch_verify(mark_failed=True)
+                while self.batch_running:
+                    # escolhido a cada iteração: reprioridades e novos jobs valem já para o próximo
+                    job = self._batch_next()
+                    if job is None:
                         break
-                    self._append_log(f"[batch] ({idx+1}/{len(self.batch_queue)}) {self._job_label(job)}\n")
-                    self._run_job(job)
+                    idx += 1
+                    self.batch_meta[id(job)]["state"] = "running"
+                    self.batch_meta[id(job)]["t0"] = time.monotonic()
+                    self.after(0, self._batch_refresh)
+                    self._append_log(f"[batch] ({idx}/{len(self.batch_queue)}) {self._job_label(job)}\n")
+                    outdir = self._run_job(job)
+                    if id(job) in self.batch_meta:
+                        self.batch_meta[id(job)]["state"] = "done" if outdir else "failed"
+                    if not outdir and self.batch_running:
+                        retry = self._retry_job(job)
+                        if retry is not None:
+                            self.batch_meta[id(retry)] = {"seq": self.batch_meta.get(id(job), {}).get("seq", 0),
+                                                          "bases": self.batch_meta.get(id(job), {}).get("bases"),
+                                                          "state": "pending"}
+                            if id(job) in self.batch_meta:
+                                self.batch_meta[id(job)]["superseded"] = True
+                            self.batch_queue.append(retry)
+                    self.after(0, self._batch_refresh)
+                    if outdir:
+                        done.append(outdir)
                     if not self.batch_running:
                         break
                 if self.batch_running:
                     self._append_log("[batch] Fila concluída.\n")
+                    if self.var_quast.get() and len(done) > 1:
+                        threading.Thread(target=self._quast_compare, args=(done,), daemon=True).start()
             finally:
                 self.batch_running = False
         self.batch_thread = threading.Thread(target=target, daemon=True)
         self.batch_thread.start()
 
+    def _batch_verify(self, mark_failed: bool = False) -> set:
+        """
+        Verifica gzip (CRC/trailer) e contagem R1/R2 das entradas dos jobs pendentes (pool de
+        processos; veredictos em cache). Com mark_failed, jobs com entrada ruim saem da fila como ✗.
+        """
+        is_fastq = re.compile(r"\.(?:fastq|fq)(?:\.gz)?$", re.I)
+        jobs = [j for j in self.batch_queue if self.batch_meta.get(id(j), {}).get("state") == "pending"]
+        paths, pairs = [], []
+        for j in jobs:
+            paths += [j[k] for k in ("r1", "r2", "se") if j.get(k)]
+            if j.get("long") and is_fastq.search(j["long"]):
+                paths.append(j["long"])
+            if j.get("r1") and j.get("r2"):
+                pairs.append((j["r1"], j["r2"]))
+        if not paths:
+            return set()
+        self._append_log(f"[verificação] {len(set(paths))} arquivo(s) de {len(jobs)} job(s)…\n")
+        def on_result(path, v, cached):
+            if not v["ok"]:
+                self._append_log(f"[verificação] ERRO{' (cache)' if cached else ''}: {path}: {v['error']}\n")
+        res = verify_inputs(paths, pairs, on_result=on_result)
+        bad_jobs = set()
+        for j in jobs:
+            errs = [f"{k}: {res[j[k]]['error']}" for k in ("r1", "r2", "se", "long")
+                    if j.get(k) in res and not res[j[k]]["ok"]]
+            if errs:
+                bad_jobs.add(id(j))
+                self._append_log(f"[verificação] {j['sample']}: {'; '.join(errs)}\n")
+                if mark_failed and id(j) in self.batch_meta:
+                    self.batch_meta[id(j)]["state"] = "failed"
+        self._append_log(f"[verificação] {len(jobs) - len(bad_jobs)} job(s) ok, {len(bad_jobs)} com entrada inválida"
+                         f"{' (fora da fila)' if mark_failed and bad_jobs else ''}.\n")
+        if mark_failed and bad_jobs:
+            self.after(0, self._batch_refresh)
+        return bad_jobs
+
     def _batch_stop(self):
         if self.batch_running:
             self._append_log("[batch] Solicitando parada da fila…\n")
             self.batch_running = False
             self._stop_assembly()  # interrompe o job atual
 
+    # ---------- Pipeline (fastp → montagem → QC) ----------
+    def _pipeline_window(self):
+        if self.pipe_win is not None and self.pipe_win.winfo_exists():
+            self.pipe_win.lift()
+            return
+        win = tk.Toplevel(self)
+        self.pipe_win = win
+        win.title("Pipeline — fastp → montagem → QC")
+        win.geometry("1000x520")
+
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        self.pipe_files = []
+        ttk.Button(top, text="Adicionar pasta (FASTQ brutos)…", command=self._pipeline_add_folder).pack(side="left")
+        self.var_pipe_total = tk.IntVar(value=max(2, os.cpu_count() or 2))
+        ttk.Label(top, text="Threads totais").pack(side="left", padx=(12, 4))
+        ttk.Spinbox(top, from_=2, to=256, textvariable=self.var_pipe_total, width=6).pack(side="left")
+        self.var_pipe_fastp_threads = tk.IntVar(value=4)
+        ttk.Label(top, text="Threads fastp").pack(side="left", padx=(12, 4))
+        ttk.Spinbox(top, from_=1, to=64, textvariable=self.var_pipe_fastp_threads, width=6).pack(side="left")
+        ttk.Button(top, text="Iniciar", command=self._pipeline_start).pack(side="left", padx=(12, 4))
+        ttk.Button(top, text="Parar", command=self._pipeline_stop).pack(side="left")
+
+        preset = "preset salvo pelo app de pré-processamento" if FASTP_PRESET.exists() else "parâmetros padrão do fastp"
+        ttk.Label(win, text=f"fastp: {preset}. Montagem: parâmetros do formulário principal "
+                            f"(ferramenta, modo PE, opções). QC: QUAST (se marcado) + N50.",
+                  foreground="gray30").pack(fill="x", padx=8)
+
+        cols = ("fastp", "montagem", "qc")
+        self.pipe_tree = ttk.Treeview(win, columns=cols, show="tree headings")
+        self.pipe_tree.heading("#0", text="amostra")
+        for c in cols:
+            self.pipe_tree.heading(c, text=c)
+            self.pipe_tree.column(c, width=260)
+        self.pipe_tree.pack(fill="both", expand=True, padx=8, pady=6)
+
+    def _pipeline_add_folder(self):
+        folder = filedialog.askdirectory()
+        if not folder:
+            return
+        files = sorted({str(p) for pat in ("*.fastq.gz", "*.fq.gz", "*.fastq", "*.fq")
+                        for p in Path(folder).rglob(pat)})
+        pairs, unpaired = _detect_pairs(files)
+        known = {iid for iid in self.pipe_tree.get_children()}
+        for r1, r2, key in pairs:
+            if key in known:
+                continue
+            self.pipe_files.append((r1, r2, key))
+            self.pipe_tree.insert("", "end", iid=key, text=key, values=("pendente", "aguardando fastp", ""))
+        if unpaired:
+            self._append_log(f"[pipeline] {len(unpaired)} arquivo(s) sem par R1/R2 ignorado(s).\n")
+
+    def _pipe_set(self, key, col, text):
+        def upd():
+            if self.pipe_win is not None and self.pipe_win.winfo_exists() and self.pipe_tree.exists(key):
+                self.pipe_tree.set(key, col, text)
+        self.after(0, upd)
+
+    def _pipeline_start(self):
+        if self.pipe_running or self.batch_running:
+            messagebox.showwarning("Pipeline", "Já há uma fila/pipeline em execução.")
+            return
+        samples = list(self.pipe_files)
+        if not samples:
+            messagebox.showinfo("Pipeline", "Adicione uma pasta com pares R1/R2.")
+            return
+        total = int(self.var_pipe_total.get())
+        fastp_t = min(int(self.var_pipe_fastp_threads.get()), max(1, total - 1))
+        template = self._collect_current_job()
+        self.pipe_running = True
+        self.asm_stop_requested = False
+        threading.Thread(target=self._pipeline_run, args=(samples, template, total, fastp_t),
+                         daemon=True).start()
+
+    def _pipeline_stop(self):
+        if not self.pipe_running:
+            return
+        self._append_log("[pipeline] Solicitando parada…\n")
+        self.pipe_running = False
+        watchdog().cancel(self.pipe_fastp_watch, "stopped")
+        self._stop_assembly()
+
+    def _pipeline_run(self, samples, template, total, fastp_t):
+        budget = _ThreadBudget(total)
+        ready = Queue()
+        stop = lambda: not self.pipe_running
+        FASTP_DIR.mkdir(parents=True, exist_ok=True)
+        self._append_log(f"[pipeline] {len(samples)} amostra(s); {total} threads (fastp: {fastp_t}).\n")
+
+        def fastp_stage():
+            for r1, r2, key in samples:
+                if stop():
+                    break
+                got = budget.acquire(fastp_t, stop)
+                if not got:
+                    break
+                self._pipe_set(key, "fastp", f"rodando ({got} threads)")
+                try:
+                    outs = self._pipeline_fastp(r1, r2, key, got)
+                finally:
+                    budget.release(got)
+                if outs:
+                    self._pipe_set(key, "fastp", "ok")
+                    self._pipe_set(key, "montagem", "na fila")
+                    ready.put((key, outs))
+                else:
+                    self._pipe_set(key, "fastp", "parado" if stop() else "ERRO (ver log do fastp)")
+                    self._pipe_set(key, "montagem", "—")
+            ready.put(None)
+
+        feeder = threading.Thread(target=fastp_stage, daemon=True)
+        feeder.start()
+        done = []
+        try:
+            while True:
+                try:
+                    item = ready.get(timeout=0.5)
+                except Empty:
+                    if stop():
+                        break
+                    continue
+                if item is None or stop():
+                    break
+                key, (c1, c2) = item
+                job = dict(template, sample=key, mode="PE", r1=c1, r2=c2, se="", long="", attempt=0)
+                while job is not None and not stop():
+                    # com fastp ainda pendente, a montagem deixa espaço para ele
+                    want = job["threads"] if not feeder.is_alive() else min(job["threads"], total - fastp_t)
+                    got = budget.acquire(want, stop)
+                    if not got:
+                        break
+                    job["threads"] = got
+                    self._pipe_set(key, "montagem", f"rodando ({got} threads)"
+                                   + (f", tentativa {job['attempt']}" if job.get("attempt") else ""))
+                    try:
+                        outdir = self._run_job(job)
+                    finally:
+                        budget.release(got)
+                    if outdir:
+                        self._pipe_set(key, "montagem", f"ok ({outdir.name})")
+                        done.append(outdir)
+                        self._pipeline_qc(key, outdir)
+                        break
+                    self._pipe_set(key, "montagem", f"falhou ({self.asm_last_failure})")
+                    job = None if stop() else self._retry_job(job)
+        finally:
+            self.pipe_running = False
+            feeder.join(timeout=5)
+        if self.var_quast.get() and len(done) > 1:
+            self._quast_compare(done)
+        self._append_log(f"[pipeline] Fim: {len(done)}/{len(samples)} amostra(s) montada(s).\n")
+
+    def _pipeline_fastp(self, r1, r2, key, threads):
+        """Roda o fastp (mesma nomenclatura do app de pré-processamento). Retorna (R1, R2) limpos ou None."""
+        out1 = FASTP_DIR / f"{key}_R1_cleaned.fastq.gz"
+        out2 = FASTP_DIR / f"{key}_R2_cleaned.fastq.gz"
+        html = str((FASTP_DIR / f"{key}_fastp_report.html").resolve())
+        jsn = str((FASTP_DIR / f"{key}_fastp_report.json").resolve())
+        parts = _fastp_preset_args(threads, html, jsn)
+        parts += ["-i", r1, "-I", r2, "-o", str(out1), "-O", str(out2)]
+        cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
+        self._append_log(f"[{key}] [fastp] {cmd}\n")
+        pol = exec_policy("fastp", threads)
+        self._append_log(f"[{key}] [fastp] [política] {pol.summary()}\n")
+        timer = RunTimer()
+        with open(FASTP_DIR / f"{key}_fastp.log", "w") as fh:
+            try:
+                self.pipe_fastp_proc = subprocess.Popen(
+                    pol.wrap(cmd), shell=True, stdout=fh, stderr=subprocess.STDOUT,
+                    start_new_session=True
+                )
+                pol.started(self.pipe_fastp_proc)
+                self.pipe_fastp_watch = watchdog().watch(
+                    self.pipe_fastp_proc, on_event=lambda t: self._append_log(f"[{key}] [fastp] " + t))
+                ret = timer.finish(self.pipe_fastp_proc)
+            finally:
+                pol.release()
+        self.pipe_fastp_proc = None
+        self.pipe_fastp_watch = None
+        try:
+            with open(jsn) as jf:
+                bases = json.load(jf)["summary"]["before_filtering"]["total_bases"]
+        except (OSError, ValueError, KeyError):
+            bases = None
+        ledger_record(app="assembly-pipeline", tool="fastp", sample=key, argv=cmd, params={"args": parts},
+                      input_bytes=sum(os.path.getsize(p) for p in (r1, r2) if os.path.exists(p)),
+                      input_bases=bases, threads=threads, status="ok" if ret == 0 else "failed",
+                      policy=pol.summary(), **timer.row())
+        if ret != 0 or not out1.exists() or not out2.exists():
+            self._append_log(f"[{key}] [fastp] falhou com código {ret} (ver {FASTP_DIR / (key + '_fastp.log')}).\n")
+            return None
+        return str(out1), str(out2)
+
+    def _pipeline_qc(self, key, outdir):
+        fasta = _final_fasta(outdir)
+        if not fasta:
+            return
+        try:
+            st = _fasta_stats(str(fasta))
+            qc = f"{st['contigs']} contigs, N50={st['n50']}"
+        except OSError:
+            qc = "estatísticas indisponíveis"
+        self._pipe_set(key, "qc", qc + (" | QUAST na fila" if self.var_quast.get() else ""))
+        fut = self.asm_last_quast
+        if fut is not None:
+            fut.add_done_callback(lambda f: self._pipe_set(
+                key, "qc", qc + (" | QUAST ok" if not f.exception() and f.result() == 0 else " | QUAST falhou")))
+
     # ---------- Saídas ----------
     def _update_outputs(self):
         self.lb.delete(0, "end")
@@ -506,6 +3030,9 @@ class AssemblyApp(tk.Tk):
                 self.lb.insert("end", str(f))
             for f in sorted(ASSEMBLY_DIR.rglob("spades.log")):
                 self.lb.insert("end", str(f))
+        if QUAST_DIR.exists():
+            for f in sorted(QUAST_DIR.glob("*/report.html")):
+                self.lb.insert("end", str(f))
 
     def _open_selected(self):
         sel = self.lb.curselection()
@@ -514,7 +3041,280 @@ class AssemblyApp(tk.Tk):
             return
         for i in sel:
             p = self.lb.get(i)
-            webbrowser.open_new_tab(f"file://{Path(p).resolve()}")
+            if p.lower().endswith(VIEW_SUFFIXES):
+                self._open_viewer(p)
+            elif p.lower().endswith((".log", ".txt", ".tsv")):
+                self._open_text_viewer(p)
+            else:
+                webbrowser.open_new_tab(f"file://{Path(p).resolve()}")
+
+    # ---------- Visualizador (FASTA/GFA/logs grandes) ----------
+    def _mmap_window(self, win, path: str):
+        """mmap somente-leitura do arquivo, fechado junto com a janela (b"" se vazio)."""
+        if not os.path.getsize(path):
+            return b""
+        fh = open(path, "rb")
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def close():
+            mm.close()
+            fh.close()
+            win.destroy()
+        win.protocol("WM_DELETE_WINDOW", close)
+        return mm
+
+    def _open_viewer(self, path: str):
+        win = tk.Toplevel(self)
+        win.title(f"{Path(path).parent.name}/{Path(path).name}")
+        win.geometry("1100x720")
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        v_name, v_min, v_max = tk.StringVar(), tk.StringVar(value="0"), tk.StringVar(value="0")
+        v_sort = tk.BooleanVar(value=False)
+        for label, var, w in (("Nome contém", v_name, 20), ("Compr. mín.", v_min, 10), ("máx. (0 = sem)", v_max, 10)):
+            ttk.Label(top, text=label).pack(side="left", padx=(8, 4))
+            ttk.Entry(top, textvariable=var, width=w).pack(side="left")
+        ttk.Checkbutton(top, text="Maiores primeiro", variable=v_sort).pack(side="left", padx=8)
+        status, page_lbl, chunk_lbl = tk.StringVar(value="Indexando…"), tk.StringVar(), tk.StringVar()
+
+        pane = ttk.PanedWindow(win, orient="vertical")
+        pane.pack(fill="both", expand=True, padx=8, pady=6)
+        fr = ttk.Frame(pane)
+        nav = ttk.Frame(fr)
+        nav.pack(side="bottom", fill="x", pady=(4, 0))
+        tree = ttk.Treeview(fr, columns=("n", "name", "length"), show="headings", height=14)
+        for c, h, wd in (("n", "#", 70), ("name", "Contig / segmento", 520), ("length", "Comprimento (bp)", 140)):
+            tree.heading(c, text=h)
+            tree.column(c, width=wd, anchor="w" if c == "name" else "e")
+        sb = ttk.Scrollbar(fr, orient="vertical", command=tree.yview)
+        tree.configure(yscrollcommand=sb.set)
+        tree.pack(side="left", fill="both", expand=True)
+        sb.pack(side="right", fill="y")
+        pane.add(fr, weight=1)
+        fr2 = ttk.Frame(pane)
+        nav2 = ttk.Frame(fr2)
+        nav2.pack(side="bottom", fill="x", pady=(4, 0))
+        txt = tk.Text(fr2, wrap="char", height=14, font="TkFixedFont")
+        txt.pack(fill="both", expand=True)
+        pane.add(fr2, weight=1)
+        ttk.Label(win, textvariable=status).pack(fill="x", padx=8, pady=(0, 6))
+        st = {"idx": None, "mm": b"", "hits": [], "page": 0, "rec": None, "off": 0}
+
+        def apply_filter(*_):
+            idx = st["idx"]
+            if idx is None:
+                return
+            try:
+                lo, hi = int(v_min.get() or 0), int(v_max.get() or 0)
+            except ValueError:
+                status.set("Comprimentos devem ser inteiros.")
+                return
+            st["hits"], st["page"] = idx.select(v_name.get(), lo, hi, v_sort.get()), 0
+            show_page()
+            status.set(f"{len(st['hits']):,} de {len(idx):,} registro(s) ({idx.kind.upper()}, "
+                       f"{idx.meta.get('total', 0):,} bp no total; índice {Path(path).name}{INDEX_SUFFIX})"
+                       + (f" — grafo: {_fmt_graph(idx.meta['graph'])}" if idx.meta.get("graph") else "") + ".")
+
+        def show_page(delta=0):
+            pages = max(1, -(-len(st["hits"]) // VIEW_PAGE))
+            st["page"] = max(0, min(pages - 1, st["page"] + delta))
+            tree.delete(*tree.get_children())
+            idx = st["idx"]
+            for i in st["hits"][st["page"] * VIEW_PAGE:(st["page"] + 1) * VIEW_PAGE]:
+                tree.insert("", "end", iid=str(i), values=(i + 1, idx.names[i].decode(errors="replace"),
+                                                           f"{idx.lengths[i]:,}"))
+            page_lbl.set(f"página {st['page'] + 1}/{pages}")
+
+        def show_rec(delta=0):
+            idx, i = st["idx"], st["rec"]
+            if i is None:
+                return
+            total = idx.seq_bytes(i)
+            st["off"] = max(0, min(st["off"] + delta * VIEW_CHUNK, max(0, total - 1)))
+            raw = idx.chunk(st["mm"], i, st["off"])
+            seq = b"".join(raw.split())
+            txt.delete("1.0", "end")
+            txt.insert("end", idx.header(st["mm"], i) + "\n")
+            txt.insert("end", b"\n".join(seq[k:k + 80] for k in range(0, len(seq), 80)).decode(errors="replace"))
+            chunk_lbl.set(f"bytes {st['off']:,}–{st['off'] + len(raw):,} de {total:,} da sequência")
+
+        def on_select(_e=None):
+            sel = tree.selection()
+            if sel:
+                st["rec"], st["off"] = int(sel[0]), 0
+                show_rec()
+
+        ttk.Button(top, text="Filtrar", command=apply_filter).pack(side="left", padx=8)
+        for w in top.winfo_children():
+            if isinstance(w, ttk.Entry):
+                w.bind("<Return>", apply_filter)
+        ttk.Button(nav, text="◀", width=3, command=lambda: show_page(-1)).pack(side="left")
+        ttk.Label(nav, textvariable=page_lbl).pack(side="left", padx=6)
+        ttk.Button(nav, text="▶", width=3, command=lambda: show_page(1)).pack(side="left")
+        ttk.Button(nav2, text="◀ trecho", command=lambda: show_rec(-1)).pack(side="left")
+        ttk.Label(nav2, textvariable=chunk_lbl).pack(side="left", padx=6)
+        ttk.Button(nav2, text="trecho ▶", command=lambda: show_rec(1)).pack(side="left")
+        tree.bind("<<TreeviewSelect>>", on_select)
+
+        def ready(idx):
+            if not win.winfo_exists():
+                return
+            st["idx"], st["mm"] = idx, self._mmap_window(win, path)
+            apply_filter()
+
+        def load():
+            try:
+                idx = SeqIndex.open(path)
+            except (OSError, ValueError) as e:
+                self.after(0, lambda m=str(e): win.winfo_exists() and status.set(f"Erro ao indexar: {m}"))
+                return
+            self.after(0, lambda: ready(idx))
+        threading.Thread(target=load, daemon=True).start()
+
+    def _open_text_viewer(self, path: str):
+        """Logs/TSV grandes: páginas de VIEW_CHUNK bytes lidas do mmap (abre no fim) e busca."""
+        win = tk.Toplevel(self)
+        win.title(f"{Path(path).parent.name}/{Path(path).name}")
+        win.geometry("1100x720")
+        mm = self._mmap_window(win, path)
+        size = len(mm)
+        bar = ttk.Frame(win)
+        bar.pack(fill="x", padx=8, pady=6)
+        txt = tk.Text(win, wrap="none", font="TkFixedFont")
+        txt.pack(fill="both", expand=True, padx=8, pady=(0, 6))
+        txt.tag_configure("hit", background="yellow")
+        v_find, pos_lbl = tk.StringVar(), tk.StringVar()
+        st = {"off": max(0, size - VIEW_CHUNK), "hit": -1}
+
+        def show(off):
+            st["off"] = max(0, min(off, max(0, size - VIEW_CHUNK)))
+            txt.delete("1.0", "end")
+            txt.insert("end", mm[st["off"]:st["off"] + VIEW_CHUNK].decode(errors="replace"))
+            pos_lbl.set(f"bytes {st['off']:,}–{min(size, st['off'] + VIEW_CHUNK):,} de {size:,}")
+
+        def find_next(*_):
+            term = v_find.get().encode()
+            if not term or not size:
+                return
+            hit = mm.find(term, st["hit"] + 1)
+            if hit == -1:
+                hit = mm.find(term)        # recomeça do início
+            if hit == -1:
+                pos_lbl.set("não encontrado")
+                return
+            st["hit"] = hit
+            show(hit - VIEW_CHUNK // 4)
+            a = len(mm[st["off"]:hit].decode(errors="replace"))
+            txt.tag_add("hit", f"1.0+{a}c", f"1.0+{a + len(v_find.get())}c")
+            txt.see(f"1.0+{a}c")
+
+        for label, cmd in (("⏮", lambda: show(0)), ("◀", lambda: show(st["off"] - VIEW_CHUNK)),
+                           ("▶", lambda: show(st["off"] + VIEW_CHUNK)), ("⏭", lambda: show(size))):
+            ttk.Button(bar, text=label, width=3, command=cmd).pack(side="left")
+        ttk.Label(bar, textvariable=pos_lbl).pack(side="left", padx=8)
+        e = ttk.Entry(bar, textvariable=v_find, width=30)
+        e.pack(side="right")
+        e.bind("<Return>", find_next)
+        ttk.Button(bar, text="Buscar", command=find_next).pack(side="right", padx=6)
+        show(st["off"])
+        txt.see("end")
+
+    # ---------- Estatísticas ----------
+    def _stats_thread(self):
+        # Selecionados na lista (FASTA) ou, se nada selecionado, todas as montagens
+        sel = [self.lb.get(i) for i in self.lb.curselection()]
+        files = [f for f in sel if f.endswith((".fasta", ".fa", ".fasta.gz"))] or _find_assembly_fastas()
+        if not files:
+            messagebox.showinfo("Estatísticas", "Nenhum FASTA de montagem encontrado.")
+            return
+        def target():
+            workers = max(1, min(len(files), os.cpu_count() or 1))
+            self._append_log(f"[stats] Calculando estatísticas de {len(files)} montagem(ns) ({workers} processo(s))…\n")
+            try:
+                with process_pool(workers) as pool:
+                    rows = list(pool.map(_fasta_stats, files, chunksize=4))
+            except Exception as e:
+                self._append_log(f"[stats] ERRO: {e}\n")
+                return
+            with open(STATS_TSV, "w", newline="") as fh:
+                wr = csv.DictWriter(fh, fieldnames=STATS_FIELDS, delimiter="\t")
+                wr.writeheader()
+                wr.writerows(rows)
+            self._append_log(f"[stats] TSV salvo em {STATS_TSV}\n")
+            self.after(0, lambda: self._show_stats_table(rows))
+        threading.Thread(target=target, daemon=True).start()
+
+    def _gfa_thread(self):
+        # GFA selecionados na lista ou, sem seleção, todos os assembly.gfa
+        sel = [self.lb.get(i) for i in self.lb.curselection()]
+        files = [f for f in sel if f.endswith(".gfa")] or \
+            ([str(p) for p in sorted(ASSEMBLY_DIR.rglob("assembly.gfa"))] if ASSEMBLY_DIR.exists() else [])
+        if not files:
+            messagebox.showinfo("Grafos", "Nenhum GFA de montagem encontrado.")
+            return
+        def target():
+            workers = max(1, min(len(files), os.cpu_count() or 1))
+            self._append_log(f"[grafo] Resumindo {len(files)} grafo(s) ({workers} processo(s))…\n")
+            rows = []
+            with process_pool(workers) as pool:
+                futs = {pool.submit(_gfa_summary_cached, f): f for f in files}
+                for fut in futs:
+                    try:
+                        g = fut.result()
+                    except Exception as e:
+                        self._append_log(f"[grafo] ERRO em {futs[fut]}: {e}\n")
+                        continue
+                    rows.append(g)
+                    self._append_log(f"[grafo] {g['sample']}: {_fmt_graph(g)}\n")
+            with open(GFA_TSV, "w", newline="") as fh:
+                wr = csv.DictWriter(fh, fieldnames=GFA_FIELDS, delimiter="\t", extrasaction="ignore")
+                wr.writeheader()
+                wr.writerows(rows)
+            self._append_log(f"[grafo] TSV salvo em {GFA_TSV}\n")
+            self.after(0, lambda: self._show_gfa_table(rows))
+        threading.Thread(target=target, daemon=True).start()
+
+    def _show_gfa_table(self, rows):
+        win = tk.Toplevel(self)
+        win.title("Grafos de montagem (GFA)")
+        win.geometry("1100x480")
+        cols = ("segments", "links", "total_length", "components", "circular", "dead_ends", "depth", "kind")
+        heads = ("Segmentos", "Links", "Total (bp)", "Componentes", "Circulares", "Pontas soltas",
+                 "Profundidade (dp)", "Tipo provável")
+        tree = ttk.Treeview(win, columns=cols)
+        tree.heading("#0", text="Amostra / componente")
+        tree.column("#0", width=220)
+        for c, h in zip(cols, heads):
+            tree.heading(c, text=h)
+            tree.column(c, width=105, anchor="e")
+        for g in rows:
+            iid = tree.insert("", "end", text=g["sample"], open=True, values=(
+                g["segments"], g["links"], g["total_length"], g["components"], g["circular_components"],
+                g["dead_ends"], "", ""))
+            for n, d in enumerate(g["detail"], 1):
+                tree.insert(iid, "end", text=f"componente {n}", values=(
+                    d["segments"], "", d["length"], "", "sim" if d["circular"] else "não", d["dead_ends"],
+                    "—" if d["depth"] is None else d["depth"], d["kind"]))
+        tree.pack(side="left", fill="both", expand=True, padx=8, pady=8)
+        sb = ttk.Scrollbar(win, orient="vertical", command=tree.yview)
+        sb.pack(side="right", fill="y")
+        tree.configure(yscrollcommand=sb.set)
+
+    def _show_stats_table(self, rows):
+        win = tk.Toplevel(self)
+        win.title("Estatísticas das montagens")
+        win.geometry("1100x420")
+        cols = [c for c in STATS_FIELDS if c != "file"]
+        tree = ttk.Treeview(win, columns=cols, show="headings")
+        for c in cols:
+            tree.heading(c, text=c)
+            tree.column(c, width=110, anchor="e" if c != "sample" else "w")
+        for r in rows:
+            tree.insert("", "end", values=[r[c] for c in cols])
+        tree.pack(side="left", fill="both", expand=True, padx=8, pady=8)
+        sb = ttk.Scrollbar(win, orient="vertical", command=tree.yview)
+        sb.pack(side="right", fill="y")
+        tree.configure(yscrollcommand=sb.set)
 
     # ---------- Ajuda ----------
     def _show_help(self):
@@ -533,13 +3333,113 @@ class AssemblyApp(tk.Tk):
             " • --linear_seqs N: nº esperado de sequências lineares (geralmente 0).\n\n"
             "SPAdes:\n"
             " • --careful: reduz misassemblies; mais lento.\n"
-            " • --kmers: ex. 21,33,55,77,99 (vazio = automático).\n\n"
+            " • --kmers: ex. 21,33,55,77,99 (vazio = automático).\n"
+            " • -m: limite de memória (GB) do SPAdes; 0 = padrão do SPAdes.\n"
+            " • Novas tentativas: falhas por falta de memória (OOM), processo morto ou desconhecidas são\n"
+            "   re-enfileiradas: 1ª com metade das threads e -m menor (retoma do checkpoint); 2ª+ também\n"
+            "   sem --careful e --kmers 21,33,55. Disco cheio, erro de entrada ou parada manual não.\n"
+            " • Retomar: se a pasta do job (mesmo fingerprint) tem checkpoint de uma execução\n"
+            "   interrompida/falha, usa --continue (ou --restart-from last se threads mudaram).\n\n"
+            "Race (Ferramenta = race):\n"
+            " • Roda em paralelo os candidatos de 'Candidatos (race)', separados por ';': spades, unicycler\n"
+            "   ou spades:21,33,55 (conjunto de k-mers). Threads e -m do job são divididos entre eles.\n"
+            " • Cada montagem concluída é pontuada por N50, maior contig e nº de contigs. Se uma cobre\n"
+            "   ≥ 90% do genoma (tamanho informado ou o total montado) num contig, as demais são canceladas;\n"
+            "   'Tempo máx.' do job vale para a corrida toda (ao esgotar, vence a melhor já concluída).\n"
+            " • A vencedora vira a pasta normal da amostra (cache como um job comum; nb_race.json resume\n"
+            "   a corrida); as perdedoras são removidas. Candidatos já montados (cache) entram sem rodar.\n"
+            " • CSV: tool=race e coluna race com a lista de candidatos.\n\n"
             "Batch/Fila:\n"
             " • Adicionar job atual à fila: usa os parâmetros preenchidos acima.\n"
-            " • CSV (cabeçalho): sample,tool,mode,r1,r2,se,long,threads,uc_mode,keep,min_fasta_length,linear_seqs,spades_careful,spades_kmers\n"
-            "   - tool: unicycler|spades; mode: PE|SE; spades_careful: 1/0/true/false.\n"
+            " • CSV (cabeçalho): sample,tool,mode,r1,r2,se,long,threads,uc_mode,keep,min_fasta_length,linear_seqs,spades_careful,spades_kmers,resume,compact,\n"
+            "     target_cov,genome_size,long_target_cov,long_min_len,priority,spades_memory,max_retries,\n"
+            "     attempt,max_runtime_min,idle_timeout_min,race,policy\n"
+            "   - tool: unicycler|spades|race; mode: PE|SE; spades_careful/resume: 1/0/true/false;\n"
+            "     compact: off|compress|delete; target_cov: 0 = sem subamostragem; genome_size: ex. 5m.\n"
+            "   - priority: inteiro (maior roda antes); policy (opcional): fifo|priority|sjf.\n"
+            "   - Ao carregar, todas as linhas são validadas antes (ferramenta/modo, arquivos existentes e\n"
+            "     legíveis, par R1/R2 coerente); linhas com erro não entram na fila e são listadas no log\n"
+            "     como 'linha N (sample): motivo'. Milhares de linhas: a lista só desenha as visíveis e o\n"
+            "     tempo previsto de cada job aparece quando a estimativa de bases (em segundo plano) termina.\n"
+            " • Ordem: fifo (chegada), priority (coluna priority) ou sjf (menor tempo previsto primeiro; sem\n"
+            "   histórico, menor nº de bases de entrada).\n"
+            " • Previsão: regressão log-log (bases de entrada, threads) por ferramenta/modo/--careful/uc_mode,\n"
+            "   ajustada com as execuções ok deste host no histórico. Mostra ~tempo por job, ETA da fila e o\n"
+            "   maior pico de memória previsto; avisa no log quando um job passa muito do previsto.\n"
+            "   Prioridade +1/−1 altera os selecionados mesmo com a fila rodando (vale para o próximo job).\n"
             " • Executar fila: roda sequencialmente (1 por vez) com log prefixado por [sample].\n"
             " • Parar fila: interrompe o job atual e cancela o restante.\n"
+            " • Pular job atual: encerra só o job em execução (sem nova tentativa) e segue a fila.\n"
+            " • Verificar entradas / 'Verificar gzip/pares antes da fila': descomprime cada entrada por inteiro\n"
+            "   (vários processos), valida CRC/tamanho de cada membro gzip e compara o nº de registros de R1/R2.\n"
+            "   Veredictos ficam em cache por arquivo (tamanho + data). Jobs com entrada ruim saem da fila (✗)\n"
+            "   antes de ocupar o slot.\n\n"
+            "Watchdog:\n"
+            " • Tempo máx. (min): encerra o job que passar desse tempo de parede (falha 'timeout').\n"
+            " • Sem saída por (min): encerra o job sem nenhuma linha de log nesse intervalo (falha 'stalled',\n"
+            "   re-enfileirada como as demais falhas transitórias). Fases silenciosas do SPAdes podem levar\n"
+            "   dezenas de minutos: use um valor folgado. 0 = desligado.\n"
+            " • Interromper/Parar/Pular enviam SIGTERM ao grupo do processo na hora; se ele não sair em 15 s,\n"
+            "   recebe SIGKILL.\n\n"
+            "Histórico de execuções (nb_runs.sqlite, compartilhado com o pré-processamento):\n"
+            " • Cada montagem/tentativa e cada fastp do pipeline grava amostra, ferramenta, comando completo,\n"
+            "   parâmetros, bytes/bases de entrada, tempo de parede, CPU, pico de memória (maior processo),\n"
+            "   código de saída e host. A aba Tendências mostra mediana de tempo e Gb/h por ferramenta/host/mês.\n"
+            " • Linha de comando: python NB_PIPELINE_COMMON.py --tool spades --trends\n\n"
+            "Políticas de execução (nb_exec_policies.json, compartilhado com o pré-processamento):\n"
+            " • Por ferramenta (spades, unicycler, fastp, quast…): CPUs ('0-7,16-23', 'numa:1' ou 'numa:auto' =\n"
+            "   nó NUMA com menos jobs em execução; candidatos de um race se espalham pelos nós), nice (0-19)\n"
+            "   e ionice ('idle' ou 'be:0-7'). A GUI fica com prioridade normal e responde durante os jobs.\n"
+            " • CPU máx. (núcleos) e memória máx. (GB): limites de cgroup v2, aplicados só com delegação\n"
+            "   (NB_CGROUP_ROOT/raiz configurada com cpu+memory, ou systemd-run --user --scope); sem isso\n"
+            "   são ignorados e o aviso aparece no log.\n"
+            " • O que foi aplicado vai para o log ([política]), para o nb_manifest.json (policy) e para a\n"
+            "   coluna Política do histórico. Edições valem a partir do próximo job.\n\n"
+            "Cache / versões:\n"
+            " • Cada pasta de saída recebe um nb_manifest.json (fingerprint das entradas + parâmetros).\n"
+            " • Job idêntico já concluído termina na hora (cache); threads não entram no fingerprint.\n"
+            " • Parâmetros/entradas diferentes geram nova pasta <sample>_v2, _v3… (nada é sobrescrito).\n\n"
+            "Compactação pós-job:\n"
+            " • off: mantém tudo; compress: empacota intermediários (K*/, corrected/, misc/…) em intermediates.tar.gz;\n"
+            "   delete: remove intermediários. FASTA/GFA/paths finais, logs e params.txt são sempre mantidos.\n"
+            " • Roda em segundo plano; tamanho antes/depois vai para o log e assembly_output/compaction_report.tsv.\n\n"
+            "Abrir selecionado(s):\n"
+            " • FASTA/GFA abrem no visualizador interno: na 1ª abertura o arquivo é indexado (contigs ou\n"
+            "   segmentos S) via mmap e o índice fica em <arquivo>.nbidx; depois a lista é paginada, com filtro\n"
+            "   por nome e comprimento, e só o trecho exibido da sequência é lido (memória constante).\n"
+            " • Logs abrem paginados pelo fim, com busca; relatórios HTML do QUAST vão para o navegador.\n\n"
+            "Grafos (GFA):\n"
+            " • Uma passada por assembly.gfa (selecionados ou todos; 1 processo por arquivo): segmentos, links,\n"
+            "   componentes conexos, pontas soltas e profundidade média (dp do Unicycler) por componente.\n"
+            "   Componente sem pontas soltas = circular (≥ 1 Mb: cromossomo; menor: plasmídeo provável).\n"
+            " • O resumo fica no índice do arquivo (assembly.gfa.nbidx; recalculado só se o GFA mudar), em\n"
+            "   assembly_output/gfa_summary.tsv e no log ao fim de cada montagem com GFA.\n\n"
+            "Estatísticas (N50/GC):\n"
+            " • Nº de contigs, tamanho total, maior contig, N50/L50, GC% e contigs circulares (Unicycler).\n"
+            " • Usa os FASTA selecionados na lista de saídas ou, sem seleção, todas as montagens;\n"
+            "   roda em paralelo (1 processo por arquivo) e salva assembly_output/assembly_stats.tsv.\n\n"
+            "Subamostragem por cobertura:\n"
+            " • Cobertura alvo > 0: estima as bases totais (tamanho do arquivo × bases/byte dos primeiros\n"
+            "   registros) e mantém cada par R1/R2 com a mesma probabilidade, numa única passada.\n"
+            " • Tamanho do genoma: informado (ex. 5m) ou estimado (montagem anterior; senão 5 Mb).\n"
+            " • Leituras subamostradas ficam em scratch/<sample>/ e são removidas após sucesso.\n"
+            " • Estimar (k-mers): conta k-mers de até 2 M leituras/arquivo e estima genoma, cobertura e\n"
+            "   fração de k-mers de erro (kmer_profiles/<sample>.json); preenche tamanho do genoma e,\n"
+            "   acima de 150×, sugere cobertura alvo 100×. Pico secundário em cobertura/2 = alerta.\n"
+            " • Long reads (Unicycler híbrido): cobertura alvo > 0 mantém as melhores leituras\n"
+            "   (comprimento × acurácia média) até alvo × genoma, descartando as < comprimento mínimo.\n\n"
+            "Pipeline fastp → montagem:\n"
+            " • Botão no topo: escolhe uma pasta de FASTQ brutos (pares R1/R2) e roda, por amostra,\n"
+            "   fastp -> montagem (parâmetros do formulário) -> QC, sobrepondo o fastp da próxima amostra\n"
+            "   com a montagem da atual, dentro de um total único de threads.\n"
+            " • fastp usa o preset salvo no app de pré-processamento (botão 'Salvar preset p/ pipeline')\n"
+            "   ou os padrões dele; saídas em fastp_output/ com os mesmos nomes do app.\n\n"
+            "QUAST:\n"
+            " • Opcional: roda quast.py em segundo plano ao fim de cada job (quast_reports/<pasta>),\n"
+            "   enquanto a próxima montagem da fila já começa.\n"
+            " • Ao fim da fila, gera um relatório comparativo (quast_reports/batch_<data>) com todas as amostras.\n"
+            " • Referência: preparada uma única vez (quast_reports/_references); por amostra usa só\n"
+            "   --est-ref-size, e o comparativo alinha com -r uma vez para todas as montagens.\n"
         )
         win = tk.Toplevel(self)
         win.title("Ajuda — Montagem")
@@ -0,0 +1,1236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ---------------------------
+# Infra compartilhada pelos apps NB_PIPELINE_PRE-PROCESS.py e NB_PIPELINE_ASSEMBLY.py
+# ---------------------------
+# Importado pelos apps depois do guardião do ambiente conda (não o repete aqui).
+
+import os, re, sys, itertools, json, math, multiprocessing, selectors, shlex, shutil, signal, socket, sqlite3, subprocess, threading, time, zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# ---------------------------
+# Leitor multiplexado de saída de processos
+# ---------------------------
+# Um único thread de I/O (selectors/epoll) atende todos os processos em execução:
+#    - lê stdout em blocos binários grandes (sem readline() por linha, sem text mode);
+#    - separa linhas só na fronteira do bloco e decodifica uma vez por bloco;
+#    - colapsa barras de progresso com '\r' (mantém só o último estado da linha);
+#    - prefixa cada linha com a etiqueta do job e entrega um bloco por leitura ao callback.
+# register() devolve um threading.Event que é sinalizado no EOF do processo.
+CHUNK_SIZE = 1 << 16
+MAX_PARTIAL = 1 << 20   # linha sem '\n' maior que isso é entregue assim mesmo
+
+
+class _Stream:
+    __slots__ = ("pipe", "fd", "prefix", "on_text", "buf", "done")
+
+    def __init__(self, pipe, prefix, on_text):
+        self.pipe = pipe          # referência mantida até o EOF (fd não é reciclado antes)
+        self.fd = pipe.fileno()
+        self.prefix = prefix
+        self.on_text = on_text
+        self.buf = b""
+        self.done = threading.Event()
+
+
+def _collapse_cr(line: bytes) -> bytes:
+    """'a\rb\rc' -> 'c' (último estado visível de uma linha de progresso)."""
+    if b"\r" not in line:
+        return line
+    parts = [p for p in line.split(b"\r") if p]
+    return parts[-1] if parts else b""
+
+
+class OutputMux:
+    def __init__(self, chunk_size: int = CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self._sel = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        self._sel.register(self._wake_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._loop, name="output-mux", daemon=True)
+        self._thread.start()
+
+    def register(self, pipe, prefix: str, on_text) -> threading.Event:
+        """
+        pipe: stdout binário de um Popen (stdout=PIPE, sem text=True).
+        on_text(texto): recebe blocos de linhas completas já prefixadas (chamado no thread de I/O).
+        """
+        os.set_blocking(pipe.fileno(), False)
+        st = _Stream(pipe, prefix.encode("utf-8"), on_text)
+        with self._lock:
+            self._pending.append(st)
+        os.write(self._wake_w, b"x")
+        return st.done
+
+    # ---------- thread de I/O ----------
+    def _loop(self):
+        while True:
+            for key, _ in self._sel.select(timeout=1.0):
+                if key.data is None:
+                    self._drain_wake()
+                else:
+                    self._read(key.data)
+
+    def _drain_wake(self):
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for st in pending:
+            self._sel.register(st.fd, selectors.EVENT_READ, st)
+
+    def _read(self, st: _Stream):
+        try:
+            data = os.read(st.fd, self.chunk_size)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._sel.unregister(st.fd)
+            if st.buf:
+                self._emit(st, [st.buf])
+                st.buf = b""
+            try:
+                st.pipe.close()
+            except OSError:
+                pass
+            st.done.set()
+            return
+        buf = st.buf + data
+        cut = buf.rfind(b"\n")
+        if cut < 0:
+            # progresso só com '\r' (sem '\n'): guarda apenas o último estado
+            i = buf.rstrip(b"\r").rfind(b"\r")
+            st.buf = buf[i:] if i > 0 else buf
+            if len(st.buf) > MAX_PARTIAL:
+                self._emit(st, [st.buf])
+                st.buf = b""
+            return
+        st.buf = buf[cut + 1:]
+        self._emit(st, buf[:cut].split(b"\n"))
+
+    def _emit(self, st: _Stream, lines):
+        out = [st.prefix + _collapse_cr(ln) + b"\n" for ln in lines]
+        try:
+            st.on_text(b"".join(out).decode("utf-8", errors="replace"))
+        except Exception:
+            pass
+
+
+_MUX = None
+_SINGLETON_LOCK = threading.Lock()
+
+
+def output_mux() -> OutputMux:
+    """Instância única (lazy) do leitor multiplexado por processo."""
+    global _MUX
+    with _SINGLETON_LOCK:
+        if _MUX is None:
+            _MUX = OutputMux()
+        return _MUX
+
+
+# ---------------------------
+# Watchdog de processos (cancelamento, tempo máximo e silêncio)
+# ---------------------------
+# Um thread verifica a cada segundo os processos registrados:
+#    - max_runtime: tempo de parede máximo do job (s; 0 = sem limite)  -> motivo "timeout"
+#    - idle_timeout: tempo máximo sem nenhuma saída (s; 0 = sem limite) -> motivo "stalled"
+#    - cancel(): pedido do usuário, aplicado na hora (SIGTERM no grupo)
+# Em todos os casos, se o grupo ainda estiver vivo após KILL_GRACE s, recebe SIGKILL. O pgid é
+# guardado no registro: o encerramento vale para o grupo todo, mesmo que o líder (conda run /
+# bash -lc) saia no SIGTERM e deixe a ferramenta de verdade para trás.
+KILL_GRACE = 15.0
+
+
+def signal_group(proc, sig) -> None:
+    """Envia sig ao grupo do processo (criado com os.setsid) ou, sem setsid, ao processo."""
+    try:
+        if hasattr(os, "setsid"):
+            os.killpg(os.getpgid(proc.pid), sig)
+        elif sig == getattr(signal, "SIGKILL", None):
+            proc.kill()
+        else:
+            proc.terminate()
+    except (ProcessLookupError, PermissionError, OSError):
+        pass
+
+
+def group_alive(pgid: int) -> bool:
+    """True se ainda há algum processo (não zumbi) no grupo pgid."""
+    if os.path.isdir("/proc/self"):
+        for d in os.listdir("/proc"):
+            if not d.isdigit():
+                continue
+            try:
+                with open(f"/proc/{d}/stat", "rb") as fh:
+                    st = fh.read().rsplit(b")", 1)[1].split()
+            except (OSError, IndexError):
+                continue
+            # o líder fica zumbi até wait_rusage: não conta
+            if int(st[2]) == pgid and st[0] != b"Z":
+                return True
+        return False
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+
+
+def proc_exited(proc) -> bool:
+    """True se o processo já terminou, SEM recolhê-lo (o rusage fica para wait_rusage)."""
+    if proc.returncode is not None:
+        return True
+    if hasattr(os, "waitid") and hasattr(os, "WNOWAIT"):
+        try:
+            return os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+        except ChildProcessError:
+            return True
+    return proc.poll() is not None
+
+
+def wait_rusage(proc):
+    """Espera o processo e devolve (returncode, rusage|None); rusage inclui os descendentes já recolhidos."""
+    if proc.returncode is None and hasattr(os, "wait4"):
+        try:
+            _, status, ru = os.wait4(proc.pid, 0)
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return proc.returncode, ru
+        except ChildProcessError:
+            pass
+    return proc.wait(), None
+
+
+class ProcWatch:
+    __slots__ = ("proc", "pgid", "max_runtime", "idle_timeout", "on_event",
+                 "started", "last_output", "reason", "term_at", "killed")
+
+    def __init__(self, proc, max_runtime, idle_timeout, on_event):
+        self.proc = proc
+        self.pgid = None          # só quando o processo é líder do próprio grupo (setsid)
+        if hasattr(os, "setsid"):
+            try:
+                if os.getpgid(proc.pid) == proc.pid:
+                    self.pgid = proc.pid
+            except OSError:
+                pass
+        self.max_runtime = max_runtime or 0
+        self.idle_timeout = idle_timeout or 0
+        self.on_event = on_event
+        self.started = self.last_output = time.monotonic()
+        self.reason = None        # None | "stopped" | "skipped" | "timeout" | "stalled"
+        self.term_at = 0.0
+        self.killed = False
+
+    def touch(self, *_):
+        """Marca atividade (usar como/junto do callback de saída)."""
+        self.last_output = time.monotonic()
+
+    def alive(self) -> bool:
+        """True enquanto o grupo (ou, sem grupo próprio, o processo) não terminou."""
+        return group_alive(self.pgid) if self.pgid else not proc_exited(self.proc)
+
+    def settle(self, poll: float = 0.5) -> None:
+        """Após um encerramento (reason), espera o grupo todo sair; a escalada é do watchdog."""
+        while self.reason and self.alive():
+            time.sleep(poll)
+
+
+class Watchdog:
+    def __init__(self, grace: float = KILL_GRACE, interval: float = 1.0):
+        self.grace = grace
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._watches = []
+        self._thread = threading.Thread(target=self._loop, name="proc-watchdog", daemon=True)
+        self._thread.start()
+
+    def watch(self, proc, max_runtime: float = 0, idle_timeout: float = 0, on_event=None) -> ProcWatch:
+        """on_event(texto) é chamado (no thread do watchdog) ao encerrar/escalar o processo."""
+        w = ProcWatch(proc, max_runtime, idle_timeout, on_event)
+        with self._lock:
+            self._watches.append(w)
+        return w
+
+    def cancel(self, w: ProcWatch, reason: str = "stopped") -> None:
+        """Encerra já (SIGTERM); a escalada para SIGKILL fica com o thread do watchdog."""
+        if w is not None and w.reason is None and not proc_exited(w.proc):
+            self._terminate(w, reason, "")
+
+    def _terminate(self, w: ProcWatch, reason: str, why: str):
+        w.reason = reason
+        w.term_at = time.monotonic()
+        self._signal(w, signal.SIGTERM)
+        if why:
+            self._notify(w, f"[watchdog] {why}: SIGTERM enviado ao grupo do processo.\n")
+
+    @staticmethod
+    def _signal(w: ProcWatch, sig) -> None:
+        if w.pgid:
+            try:
+                os.killpg(w.pgid, sig)
+            except OSError:
+                pass
+        else:
+            signal_group(w.proc, sig)
+
+    def _notify(self, w: ProcWatch, text: str):
+        if w.on_event:
+            try:
+                w.on_event(text)
+            except Exception:
+                pass
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watches = list(self._watches)
+            now = time.monotonic()
+            done = []
+            for w in watches:
+                if w.reason is None:
+                    if proc_exited(w.proc):
+                        done.append(w)
+                    elif w.max_runtime and now - w.started > w.max_runtime:
+                        self._terminate(w, "timeout", f"tempo máximo de {_fmt_secs(w.max_runtime)} excedido")
+                    elif w.idle_timeout and now - w.last_output > w.idle_timeout:
+                        self._terminate(w, "stalled", f"sem saída há {_fmt_secs(w.idle_timeout)}")
+                elif not w.alive():
+                    done.append(w)
+                elif not w.killed and now - w.term_at > self.grace:
+                    w.killed = True
+                    self._signal(w, getattr(signal, "SIGKILL", signal.SIGTERM))
+                    self._notify(w, f"[watchdog] processo não encerrou em {self.grace:.0f}s: SIGKILL.\n")
+            if done:
+                with self._lock:
+                    self._watches = [w for w in self._watches if w not in done]
+
+
+def _fmt_secs(s: float) -> str:
+    s = int(s)
+    return f"{s // 3600}h{s % 3600 // 60:02d}m" if s >= 3600 else f"{s // 60}m{s % 60:02d}s"
+
+
+_WATCHDOG = None
+
+
+def watchdog() -> Watchdog:
+    """Instância única (lazy) do watchdog por processo."""
+    global _WATCHDOG
+    with _SINGLETON_LOCK:
+        if _WATCHDOG is None:
+            _WATCHDOG = Watchdog()
+        return _WATCHDOG
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Pool de processos que não faz fork do app: com os threads de I/O, watchdog e GUI vivos,
+    um fork pode herdar locks travados. forkserver (Unix) ou spawn; a função enviada ao pool
+    precisa ser de módulo (picklável).
+    """
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=ctx)
+
+
+# ---------------------------
+# Políticas de execução por ferramenta (CPU, prioridade e cgroup)
+# ---------------------------
+# fastp, montagens e MultiQC/QUAST rodando juntos disputam cache, disco e a própria GUI.
+# Cada ferramenta tem uma política (nb_exec_policies.json ao lado dos scripts; padrões abaixo):
+#    - cpus: "" (todas) | lista "0-7,16-23" | "numa:N" (CPUs do nó N) | "numa:auto" (nó com
+#      menos jobs nossos rodando e CPUs para as threads; se nenhum nó tem CPUs suficientes, não
+#      fixa). Aplicada pelo shell do job (`taskset -p $$`) e herdada pelos netos; a memória
+#      acompanha o nó pela alocação first-touch do kernel.
+#    - nice: 0..19 (`renice -p $$`); ionice: "" | "idle" | "be:0..7" (`ionice -p $$`), idem.
+#    - cpu_max (núcleos) / mem_max_gb: limites de cgroup v2, só quando há delegação:
+#        a) NB_CGROUP_ROOT (ou "cgroup_root" no JSON) = pasta cgroup v2 gravável com cpu e memory
+#           em cgroup.subtree_control -> um sub-cgroup por job, removido ao final;
+#        b) senão `systemd-run --user --scope` (CPUQuota/MemoryMax), se o systemd do usuário responder;
+#        c) senão os limites são ignorados (e isso fica anotado).
+# O que foi de fato aplicado vai para o log, para o manifesto e para a coluna "policy" do ledger.
+EXEC_POLICY_FILE = Path(__file__).resolve().parent / "nb_exec_policies.json"
+EXEC_POLICY_FIELDS = ("cpus", "nice", "ionice", "cpu_max", "mem_max_gb")
+_NO_LIMITS = {"cpu_max": 0, "mem_max_gb": 0}
+EXEC_POLICY_DEFAULTS = {
+    "spades":    dict(cpus="numa:auto", nice=5, ionice="be:4", **_NO_LIMITS),
+    "unicycler": dict(cpus="numa:auto", nice=5, ionice="be:4", **_NO_LIMITS),
+    "fastp":     dict(cpus="", nice=5, ionice="be:4", **_NO_LIMITS),
+    "kraken2":   dict(cpus="", nice=5, ionice="be:6", **_NO_LIMITS),
+    "quast":     dict(cpus="", nice=10, ionice="be:7", **_NO_LIMITS),
+    "multiqc":   dict(cpus="", nice=15, ionice="idle", **_NO_LIMITS),
+}
+CGROUP_PERIOD = 100000   # µs (cpu.max = "<quota> <período>")
+
+_POLICY_LOCK = threading.Lock()
+_NUMA_LOAD = {}          # nó -> nº de jobs deste processo fixados nele
+_CGROUP_PROBE = {}       # raiz configurada -> (modo, detalhe)
+_CGROUP_SEQ = itertools.count(1)
+
+
+def _parse_cpulist(text: str) -> set:
+    """'0-3,8,10-11' -> {0, 1, 2, 3, 8, 10, 11} (formato de cpulist do kernel). ValueError se inválido."""
+    cpus = set()
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        lo, _, hi = part.partition("-")
+        lo, hi = int(lo), int(hi or lo)
+        if lo < 0 or hi < lo:
+            raise ValueError(f"faixa de CPUs inválida: {part}")
+        cpus.update(range(lo, hi + 1))
+    return cpus
+
+
+def _fmt_cpulist(cpus) -> str:
+    """Inverso de _parse_cpulist (faixas contíguas compactadas)."""
+    out, run = [], []
+    for c in sorted(cpus):
+        if run and c != run[-1] + 1:
+            out.append(f"{run[0]}-{run[-1]}" if len(run) > 1 else str(run[0]))
+            run = []
+        run.append(c)
+    if run:
+        out.append(f"{run[0]}-{run[-1]}" if len(run) > 1 else str(run[0]))
+    return ",".join(out)
+
+
+def numa_nodes() -> dict:
+    """{nó: CPUs} lido de /sys (só nós com CPU); {} fora do Linux."""
+    nodes = {}
+    for p in Path("/sys/devices/system/node").glob("node[0-9]*"):
+        try:
+            cpus = _parse_cpulist((p / "cpulist").read_text().strip())
+        except (OSError, ValueError):
+            continue
+        if cpus:
+            nodes[int(p.name[4:])] = cpus
+    return nodes
+
+
+def load_exec_policies() -> dict:
+    """{"cgroup_root": str, "tools": {ferramenta: política}}: arquivo do usuário sobre os padrões."""
+    cfg = {"cgroup_root": "", "tools": {t: dict(p) for t, p in EXEC_POLICY_DEFAULTS.items()}}
+    try:
+        with open(EXEC_POLICY_FILE) as fh:
+            user = json.load(fh)
+    except (OSError, ValueError):
+        return cfg
+    cfg["cgroup_root"] = str(user.get("cgroup_root") or "")
+    for tool, spec in (user.get("tools") or {}).items():
+        if isinstance(spec, dict):
+            cfg["tools"].setdefault(tool, {}).update({k: v for k, v in spec.items() if k in EXEC_POLICY_FIELDS})
+    return cfg
+
+
+def save_exec_policies(cfg: dict) -> None:
+    tmp = EXEC_POLICY_FILE.with_suffix(".tmp")
+    with open(tmp, "w") as fh:
+        json.dump(cfg, fh, indent=2, sort_keys=True)
+    os.replace(tmp, EXEC_POLICY_FILE)
+
+
+def check_exec_policy(spec: dict) -> list:
+    """Erros de uma política (para a janela de edição); a execução tolera e só anota."""
+    errs = []
+    cpus = str(spec.get("cpus") or "").strip()
+    if cpus.startswith("numa:"):
+        if cpus != "numa:auto" and not cpus[5:].isdigit():
+            errs.append(f"cpus: use numa:auto ou numa:<nó> ({cpus})")
+    elif cpus:
+        try:
+            _parse_cpulist(cpus)
+        except ValueError:
+            errs.append(f"cpus: lista inválida ({cpus})")
+    try:
+        if not 0 <= int(spec.get("nice") or 0) <= 19:
+            errs.append("nice: 0 a 19")
+    except (TypeError, ValueError):
+        errs.append("nice: número inteiro")
+    io = str(spec.get("ionice") or "")
+    if io not in ("", "idle") and not (io.startswith("be:") and io[3:].isdigit() and int(io[3:]) <= 7):
+        errs.append(f"ionice: '', idle ou be:0..7 ({io})")
+    for k in ("cpu_max", "mem_max_gb"):
+        try:
+            if float(spec.get(k) or 0) < 0:
+                errs.append(f"{k}: não pode ser negativo")
+        except (TypeError, ValueError):
+            errs.append(f"{k}: número")
+    return errs
+
+
+def cgroup_delegation(root: str = "") -> tuple:
+    """('direct', pasta) | ('systemd', '') | ('', motivo). Resultado em cache por raiz."""
+    root = os.environ.get("NB_CGROUP_ROOT") or root
+    with _POLICY_LOCK:
+        if root in _CGROUP_PROBE:
+            return _CGROUP_PROBE[root]
+    if root:
+        try:
+            ctl = set((Path(root) / "cgroup.subtree_control").read_text().split())
+        except OSError as e:
+            res = ("", f"cgroup_root inacessível: {e}")
+        else:
+            missing = {"cpu", "memory"} - ctl
+            res = (("", f"controladores {', '.join(sorted(missing))} não delegados em {root}") if missing else
+                   ("", f"sem permissão de escrita em {root}") if not os.access(root, os.W_OK) else
+                   ("direct", root))
+    elif shutil.which("systemd-run"):
+        try:
+            ok = subprocess.run(["systemd-run", "--user", "--scope", "--quiet", "--collect", "true"],
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=15).returncode == 0
+        except (OSError, subprocess.SubprocessError):
+            ok = False
+        res = ("systemd", "") if ok else ("", "systemd --user indisponível e NB_CGROUP_ROOT não definido")
+    else:
+        res = ("", "sem delegação de cgroup v2 (defina NB_CGROUP_ROOT)")
+    with _POLICY_LOCK:
+        _CGROUP_PROBE[root] = res
+    return res
+
+
+class ExecPolicy:
+    """
+    Política resolvida para UM job. Uso: Popen(p.wrap(cmd), shell=True, start_new_session=True);
+    p.started(proc) logo após o Popen; p.release() depois do wait (libera nó NUMA/cgroup).
+    Nada roda entre fork e exec (o app tem vários threads): cgroup, afinidade e nice são
+    aplicados pelo próprio shell do job antes do comando e, sem taskset/renice, pelo app no pid.
+    """
+
+    def __init__(self, tool: str, spec: dict, threads: int = 0, cgroup_root: str = ""):
+        self.tool = tool
+        self.notes = []
+        self.node = None
+        self._held = False      # nó contado em _NUMA_LOAD até release()
+        self.cpus = self._resolve_cpus(str(spec.get("cpus") or "").strip(), int(threads or 0))
+        self.nice = min(19, max(0, int(spec.get("nice") or 0)))
+        self.ionice = str(spec.get("ionice") or "")
+        if self.ionice and not (sys.platform.startswith("linux") and shutil.which("ionice")):
+            self.notes.append("ionice indisponível")
+            self.ionice = ""
+        self.cpu_max = float(spec.get("cpu_max") or 0)
+        self.mem_max_gb = float(spec.get("mem_max_gb") or 0)
+        self.cgroup = ""
+        self.cg_dir = None
+        self.cg_stats = {}
+        if self.cpu_max or self.mem_max_gb:
+            self._setup_cgroup(cgroup_root)
+
+    def _resolve_cpus(self, text: str, threads: int):
+        if not text:
+            return None
+        if not hasattr(os, "sched_setaffinity"):
+            self.notes.append("afinidade de CPU indisponível neste SO")
+            return None
+        avail = os.sched_getaffinity(0)
+        if text.startswith("numa:"):
+            nodes = {n: c & avail for n, c in numa_nodes().items() if c & avail}
+            if text == "numa:auto":
+                if len(nodes) < 2:
+                    return None     # um nó só: fixar não muda nada
+                fit = [n for n, c in nodes.items() if len(c) >= threads]
+                if not fit:
+                    # fixar num nó só cortaria as threads pela metade (ou mais): sem afinidade
+                    self.notes.append(f"nenhum nó NUMA com {threads} CPUs: sem afinidade")
+                    return None
+                with _POLICY_LOCK:
+                    self.node = min(fit, key=lambda n: (_NUMA_LOAD.get(n, 0), -len(nodes[n])))
+                    _NUMA_LOAD[self.node] = _NUMA_LOAD.get(self.node, 0) + 1
+                self._held = True
+                return nodes[self.node]
+            node = int(text[5:]) if text[5:].isdigit() else -1
+            if node not in nodes:
+                self.notes.append(f"nó NUMA {text[5:]} inexistente")
+                return None
+            self.node = node
+            with _POLICY_LOCK:
+                _NUMA_LOAD[node] = _NUMA_LOAD.get(node, 0) + 1
+            self._held = True
+            cpus = nodes[node]
+        else:
+            try:
+                cpus = _parse_cpulist(text) & avail
+            except ValueError:
+                self.notes.append(f"lista de CPUs inválida: {text}")
+                return None
+            if not cpus:
+                self.notes.append(f"nenhuma das CPUs {text} está disponível")
+                return None
+        if threads > len(cpus):
+            self.notes.append(f"{threads} threads em {len(cpus)} CPU(s)")
+        return cpus
+
+    def _setup_cgroup(self, root: str):
+        mode, detail = cgroup_delegation(root)
+        if mode == "direct":
+            d = Path(detail) / f"nb-{self.tool or 'job'}-{os.getpid()}-{next(_CGROUP_SEQ)}"
+            try:
+                d.mkdir()
+                if self.cpu_max:
+                    (d / "cpu.max").write_text(f"{int(self.cpu_max * CGROUP_PERIOD)} {CGROUP_PERIOD}")
+                if self.mem_max_gb:
+                    (d / "memory.max").write_text(str(int(self.mem_max_gb * (1 << 30))))
+            except OSError as e:
+                self.notes.append(f"cgroup: {e}")
+                try:
+                    d.rmdir()
+                except OSError:
+                    pass
+                return
+            self.cg_dir = str(d)
+        elif not mode:
+            self.notes.append(f"limites ignorados: {detail}")
+            return
+        self.cgroup = mode
+
+    def wrap(self, cmd: str) -> str:
+        """Linha de shell com a política: aplicada ao próprio shell ($$, herdado pelos filhos) e systemd-run por fora."""
+        pre = []
+        if self.cg_dir:
+            pre.append(f"echo $$ > {shlex.quote(os.path.join(self.cg_dir, 'cgroup.procs'))}"
+                       " || echo '[política] processo não entrou no cgroup' >&3")
+        if self.cpus and shutil.which("taskset"):
+            pre.append(f"taskset -p -c {_fmt_cpulist(self.cpus)} $$ >/dev/null"
+                       " || echo '[política] afinidade não aplicada' >&3")
+        if self.nice and shutil.which("renice"):
+            pre.append(f"renice -n {self.nice} -p $$ >/dev/null || echo '[política] nice não aplicado' >&3")
+        if self.ionice:
+            cls = "-c 3" if self.ionice == "idle" else f"-c 2 -n {self.ionice[3:]}"
+            pre.append(f"ionice {cls} -p $$")
+        if pre:
+            cmd = "{ " + "; ".join(pre) + "; } 3>&2 2>/dev/null; " + cmd
+        if self.cgroup == "systemd":
+            pre = ["systemd-run", "--user", "--scope", "--quiet", "--collect"]
+            if self.cpu_max:
+                pre += ["-p", f"CPUQuota={int(self.cpu_max * 100)}%"]
+            if self.mem_max_gb:
+                pre += ["-p", f"MemoryMax={int(self.mem_max_gb * (1 << 30))}"]
+            cmd = " ".join(shlex.quote(p) for p in pre + ["sh", "-c", cmd])
+        return cmd
+
+    def started(self, proc) -> None:
+        """Logo após o Popen: aplica pelo pid o que o shell não tem como aplicar (sem taskset/renice)."""
+        try:
+            if self.cpus and not shutil.which("taskset"):
+                os.sched_setaffinity(proc.pid, self.cpus)
+            if self.nice and not shutil.which("renice"):
+                os.setpriority(os.PRIO_PROCESS, proc.pid, self.nice)
+        except (OSError, AttributeError):
+            self.notes.append("afinidade/nice não aplicados")
+
+    def release(self) -> None:
+        """Fim do job: devolve o nó NUMA e lê/remove o sub-cgroup (OOM kills, pico de memória)."""
+        if self.node is not None and self._held:
+            with _POLICY_LOCK:
+                _NUMA_LOAD[self.node] = max(0, _NUMA_LOAD.get(self.node, 0) - 1)
+            self._held = False
+        if not self.cg_dir:
+            return
+        d = Path(self.cg_dir)
+        try:
+            for line in (d / "memory.events").read_text().splitlines():
+                key, _, val = line.partition(" ")
+                if key == "oom_kill":
+                    self.cg_stats["oom_kills"] = int(val)
+            if (d / "memory.peak").exists():
+                self.cg_stats["mem_peak_mb"] = round(int((d / "memory.peak").read_text()) / (1 << 20), 1)
+        except (OSError, ValueError):
+            pass
+        try:
+            d.rmdir()
+        except OSError:
+            pass    # algum neto ainda vivo: o cgroup vazio pode ser removido depois
+        self.cg_dir = None
+
+    def describe(self) -> dict:
+        """Política aplicada (manifesto)."""
+        return {"tool": self.tool, "cpus": _fmt_cpulist(self.cpus) if self.cpus else "",
+                "numa_node": self.node, "nice": self.nice, "ionice": self.ionice,
+                "cgroup": self.cgroup, "cpu_max": self.cpu_max or None, "mem_max_gb": self.mem_max_gb or None,
+                **self.cg_stats, "notes": list(self.notes)}
+
+    def summary(self) -> str:
+        """Uma linha (log e coluna policy do ledger)."""
+        out = []
+        if self.cpus:
+            out.append(f"cpus={_fmt_cpulist(self.cpus)}" + (f" (numa {self.node})" if self.node is not None else ""))
+        if self.nice:
+            out.append(f"nice={self.nice}")
+        if self.ionice:
+            out.append(f"io={self.ionice}")
+        if self.cgroup:
+            lim = ([f"cpu≤{self.cpu_max:g}"] if self.cpu_max else []) + ([f"mem≤{self.mem_max_gb:g}G"] if self.mem_max_gb else [])
+            out.append(f"cgroup {self.cgroup} " + "/".join(lim))
+        if self.cg_stats.get("oom_kills"):
+            out.append(f"oom_kill={self.cg_stats['oom_kills']}")
+        if self.notes:
+            out.append("avisos: " + "; ".join(self.notes))
+        return ", ".join(out) or "padrão"
+
+
+def exec_policy(tool: str, threads: int = 0) -> ExecPolicy:
+    """Política da ferramenta (relida do JSON a cada job: edições valem sem reiniciar o app)."""
+    cfg = load_exec_policies()
+    spec = cfg["tools"].get(tool) or {}
+    errs = check_exec_policy(spec)
+    pol = ExecPolicy(tool, {} if errs else spec, threads, cfg["cgroup_root"])
+    pol.notes += [f"política inválida ignorada ({e})" for e in errs]
+    return pol
+
+
+def show_policy_window(parent):
+    """Janela Tk para editar nb_exec_policies.json (compartilhada pelos apps)."""
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+    cfg = load_exec_policies()
+    win = tk.Toplevel(parent)
+    win.title("Políticas de execução por ferramenta")
+    fr = ttk.Frame(win, padding=8)
+    fr.pack(fill="both", expand=True)
+    heads = ("Ferramenta", "CPUs (lista | numa:N | numa:auto)", "nice (0-19)", "ionice (idle | be:0-7)",
+             "CPU máx. (núcleos)", "Memória máx. (GB)")
+    for c, h in enumerate(heads):
+        ttk.Label(fr, text=h).grid(row=0, column=c, sticky="w", padx=4)
+    rows = {}
+    for r, (tool, spec) in enumerate(sorted(cfg["tools"].items()), start=1):
+        ttk.Label(fr, text=tool).grid(row=r, column=0, sticky="w", padx=4)
+        rows[tool] = {}
+        for c, f in enumerate(EXEC_POLICY_FIELDS, start=1):
+            var = rows[tool][f] = tk.StringVar(value=str(spec.get(f, "")))
+            ttk.Entry(fr, textvariable=var, width=28 if f == "cpus" else 12).grid(row=r, column=c, sticky="w", padx=4, pady=2)
+    r = len(rows) + 1
+    ttk.Label(fr, text="Raiz cgroup delegada").grid(row=r, column=0, sticky="w", padx=4, pady=(8, 2))
+    v_root = tk.StringVar(value=cfg["cgroup_root"])
+    ttk.Entry(fr, textvariable=v_root, width=60).grid(row=r, column=1, columnspan=4, sticky="we", padx=4, pady=(8, 2))
+    nodes = numa_nodes()
+    info = tk.StringVar(value=(f"{len(nodes)} nó(s) NUMA: " + "; ".join(f"{n}: {_fmt_cpulist(c)}" for n, c in sorted(nodes.items()))
+                               if nodes else "Topologia NUMA indisponível."))
+    ttk.Label(fr, textvariable=info, foreground="#555").grid(row=r + 1, column=0, columnspan=6, sticky="w", padx=4)
+    v_cg = tk.StringVar(value="Limites de cgroup: use 'Testar cgroup' para verificar a delegação.")
+    ttk.Label(fr, textvariable=v_cg, foreground="#555").grid(row=r + 2, column=0, columnspan=6, sticky="w", padx=4)
+
+    def collect():
+        out = {"cgroup_root": v_root.get().strip(), "tools": {}}
+        for tool, vars_ in rows.items():
+            spec = {}
+            for f, var in vars_.items():
+                val = var.get().strip()
+                try:
+                    spec[f] = int(val or 0) if f == "nice" else float(val or 0) if f in _NO_LIMITS else val
+                except ValueError:
+                    spec[f] = val
+            out["tools"][tool] = spec
+        return out
+
+    def probe():
+        root = v_root.get().strip()
+        with _POLICY_LOCK:
+            _CGROUP_PROBE.pop(os.environ.get("NB_CGROUP_ROOT") or root, None)
+        mode, detail = cgroup_delegation(root)
+        v_cg.set({"direct": f"Limites de cgroup: sub-cgroups em {detail}.",
+                  "systemd": "Limites de cgroup: via systemd-run --user --scope."}.get(mode, f"Limites de cgroup: {detail}."))
+
+    def save():
+        new = collect()
+        errs = [f"{t}: {e}" for t, spec in new["tools"].items() for e in check_exec_policy(spec)]
+        if errs:
+            messagebox.showerror("Políticas", "\n".join(errs), parent=win)
+            return
+        try:
+            save_exec_policies(new)
+        except OSError as e:
+            messagebox.showerror("Políticas", f"Falha ao gravar {EXEC_POLICY_FILE}: {e}", parent=win)
+            return
+        with _POLICY_LOCK:
+            _CGROUP_PROBE.clear()
+        win.destroy()
+
+    btns = ttk.Frame(fr)
+    btns.grid(row=r + 3, column=0, columnspan=6, sticky="w", pady=(8, 0))
+    ttk.Button(btns, text="Salvar", command=save).pack(side="left")
+    ttk.Button(btns, text="Testar cgroup", command=probe).pack(side="left", padx=6)
+    ttk.Button(btns, text="Padrões", command=lambda: [rows[t][f].set(str(EXEC_POLICY_DEFAULTS.get(t, {}).get(f, "")))
+                                                     for t in rows for f in EXEC_POLICY_FIELDS]).pack(side="left", padx=6)
+    ttk.Button(btns, text="Fechar", command=win.destroy).pack(side="left", padx=6)
+    return win
+
+
+# ---------------------------
+# Nomes e leitura de FASTQ (usados pelos dois apps)
+# ---------------------------
+# Pares R1/R2: <prefixo>[._-]R?<1|2>[_001]?.<fastq|fq>[.gz] (regex explicada no app de
+# pré-processamento); grupo 1 = prefixo da amostra, grupo 2 = 1|2.
+PAIR_REGEX = re.compile(r"(.+?)[._-]R?([12])(?:_001)?\.(?:fastq|fq)(?:\.gz)?$", re.IGNORECASE)
+
+
+def raw_tell(fh) -> int:
+    """Bytes consumidos do arquivo em disco (comprimido, no caso de .gz)."""
+    raw = getattr(fh, "fileobj", None) or fh
+    try:
+        return raw.tell()
+    except (OSError, ValueError):
+        return 0
+
+
+# ---------------------------
+# Verificação de integridade de FASTQ(.gz) antes de rodar
+# ---------------------------
+# Descomprime o arquivo inteiro (todos os membros gzip) validando CRC32 e ISIZE
+# de cada trailer (zlib com wbits=31 faz a checagem) e conta os registros; pares
+# R1/R2 devem ter o mesmo nº de registros. Cada arquivo roda num processo do pool.
+# Veredictos ficam em cache (caminho + tamanho + mtime): cada versão de arquivo é
+# verificada uma vez só.
+INTEGRITY_CACHE = Path(__file__).resolve().parent / ".nb_integrity_cache.json"
+_INTEGRITY_CHUNK = 1 << 20
+_INTEGRITY_LOCK = threading.Lock()
+
+
+def check_fastq_file(path: str) -> dict:
+    """{"ok": bool, "records": int|None, "error": str}. Roda em processo filho (sem estado global)."""
+    lines = 0
+    try:
+        with open(path, "rb") as fh:
+            if not path.endswith(".gz"):
+                for chunk in iter(lambda: fh.read(_INTEGRITY_CHUNK), b""):
+                    lines += chunk.count(b"\n")
+            else:
+                d = zlib.decompressobj(31)
+                pending, padding = b"", False
+                for chunk in iter(lambda: fh.read(_INTEGRITY_CHUNK), b""):
+                    data, pending = pending + chunk, b""
+                    if padding:
+                        if data.strip(b"\x00"):
+                            return {"ok": False, "records": None, "error": "dados após o fim do gzip"}
+                        continue
+                    while data:
+                        if d.eof:
+                            # membro anterior fechou (CRC/ISIZE ok): o resto é outro membro ou zeros
+                            if len(data) < 2:
+                                pending = data
+                                break
+                            if data[:2] != b"\x1f\x8b":
+                                if data.strip(b"\x00"):
+                                    return {"ok": False, "records": None, "error": "dados após o fim do gzip"}
+                                padding = True
+                                break
+                            d = zlib.decompressobj(31)
+                        lines += d.decompress(data).count(b"\n")
+                        data = d.unused_data if d.eof else b""
+                if not d.eof or pending:
+                    return {"ok": False, "records": None, "error": "gzip truncado (fim do arquivo antes do trailer)"}
+    except zlib.error as e:
+        return {"ok": False, "records": None, "error": f"gzip corrompido ({e})"}
+    except OSError as e:
+        return {"ok": False, "records": None, "error": str(e)}
+    if lines % 4:
+        return {"ok": False, "records": lines // 4, "error": f"{lines} linhas (não múltiplo de 4)"}
+    return {"ok": True, "records": lines // 4, "error": ""}
+
+
+def _integrity_key(path: str):
+    st = os.stat(path)
+    return f"{os.path.realpath(path)}|{st.st_size}|{st.st_mtime_ns}"
+
+
+def _load_verdicts() -> dict:
+    try:
+        with open(INTEGRITY_CACHE) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
+
+
+def verify_inputs(paths, pairs=(), workers: int = 0, on_result=None) -> dict:
+    """
+    Verifica paths (pool de processos; cache por tamanho/mtime) e os pares (r1, r2).
+    on_result(path, verdict, cached) é chamado a cada arquivo. Retorna {path: veredicto};
+    pares com contagens diferentes recebem ok=False nos dois lados.
+    """
+    paths = list(dict.fromkeys(p for p in paths if p))
+    with _INTEGRITY_LOCK:
+        cache = _load_verdicts()
+    out, todo = {}, {}
+    for p in paths:
+        try:
+            key = _integrity_key(p)
+        except OSError as e:
+            out[p] = {"ok": False, "records": None, "error": str(e)}
+            on_result and on_result(p, out[p], False)
+            continue
+        if key in cache:
+            out[p] = cache[key]
+            on_result and on_result(p, out[p], True)
+        else:
+            todo[p] = key
+    if todo:
+        # todo arquivo recebe um veredicto e um on_result, mesmo se o worker (ou o pool) falhar
+        try:
+            with process_pool(workers or min(len(todo), os.cpu_count() or 2)) as ex:
+                futs = {ex.submit(check_fastq_file, p): p for p in todo}
+                for fut in as_completed(futs):
+                    p = futs[fut]
+                    try:
+                        out[p] = fut.result()
+                    except Exception as e:
+                        out[p] = {"ok": False, "records": None, "error": f"falha na verificação: {e}"}
+                    on_result and on_result(p, out[p], False)
+        except (OSError, RuntimeError) as e:
+            for p in todo:
+                if p not in out:
+                    out[p] = {"ok": False, "records": None, "error": f"falha na verificação: {e}"}
+                    on_result and on_result(p, out[p], False)
+        with _INTEGRITY_LOCK:
+            cache = _load_verdicts()
+            cache.update({todo[p]: out[p] for p in todo if p in out and "falha na verificação" not in out[p]["error"]})
+            try:
+                tmp = str(INTEGRITY_CACHE) + ".tmp"
+                with open(tmp, "w") as fh:
+                    json.dump(cache, fh)
+                os.replace(tmp, INTEGRITY_CACHE)
+            except OSError:
+                pass
+    for r1, r2 in pairs:
+        a, b = out.get(r1), out.get(r2)
+        if a and b and a["ok"] and b["ok"] and a["records"] != b["records"]:
+            msg = f"R1/R2 com nº de registros diferente ({a['records']} vs {b['records']})"
+            out[r1] = dict(a, ok=False, error=msg)
+            out[r2] = dict(b, ok=False, error=msg)
+    return out
+
+
+# ---------------------------
+# Histórico de execuções (ledger SQLite)
+# ---------------------------
+# Cada execução de fastp/kraken2 (pré-processamento) e SPAdes/Unicycler/fastp do
+# pipeline (montagem) vira uma linha em nb_runs.sqlite: amostra, ferramenta, argv
+# completo, parâmetros, bytes/bases de entrada, tempo de parede, CPU (usuário +
+# sistema dos descendentes), pico de RSS do maior processo, código de saída, host e a política
+# de execução aplicada (CPUs/nice/ionice/cgroup).
+# WAL + uma conexão por operação: os dois apps podem gravar ao mesmo tempo.
+LEDGER_DB = Path(__file__).resolve().parent / "nb_runs.sqlite"
+_LEDGER_COLUMNS = (
+    ("app", "TEXT"), ("tool", "TEXT"), ("sample", "TEXT"), ("argv", "TEXT"), ("params", "TEXT"),
+    ("input_bytes", "INTEGER"), ("input_bases", "INTEGER"), ("threads", "INTEGER"),
+    ("started", "REAL"), ("wall_s", "REAL"), ("cpu_s", "REAL"), ("peak_rss_mb", "REAL"),
+    ("exit_code", "INTEGER"), ("status", "TEXT"), ("host", "TEXT"), ("policy", "TEXT"),
+)
+
+
+class RunTimer:
+    """Mede uma execução: start() antes do Popen; finish(proc) no lugar de proc.wait()."""
+    __slots__ = ("started", "t0", "wall_s", "cpu_s", "peak_rss_mb", "returncode")
+
+    def __init__(self):
+        self.started = time.time()
+        self.t0 = time.monotonic()
+        self.wall_s = self.cpu_s = self.peak_rss_mb = None
+        self.returncode = None
+
+    def finish(self, proc) -> int:
+        self.returncode, ru = wait_rusage(proc)
+        self.wall_s = round(time.monotonic() - self.t0, 2)
+        if ru is not None:
+            self.cpu_s = round(ru.ru_utime + ru.ru_stime, 2)
+            # ru_maxrss: KiB no Linux, bytes no macOS
+            self.peak_rss_mb = round(ru.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+        return self.returncode
+
+    def row(self) -> dict:
+        return {"started": self.started, "wall_s": self.wall_s, "cpu_s": self.cpu_s,
+                "peak_rss_mb": self.peak_rss_mb, "exit_code": self.returncode}
+
+
+def _ledger_connect(path=None):
+    con = sqlite3.connect(str(path or LEDGER_DB), timeout=30)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                + ", ".join(f"{c} {t}" for c, t in _LEDGER_COLUMNS) + ")")
+    # bancos de versões anteriores: acrescenta as colunas novas
+    have = {r[1] for r in con.execute("PRAGMA table_info(runs)")}
+    for c, t in _LEDGER_COLUMNS:
+        if c not in have:
+            try:
+                con.execute(f"ALTER TABLE runs ADD COLUMN {c} {t}")
+            except sqlite3.OperationalError:
+                pass    # o outro app acabou de acrescentar
+    con.execute("CREATE INDEX IF NOT EXISTS runs_tool_started ON runs(tool, started)")
+    return con
+
+
+def ledger_record(**row) -> None:
+    """Grava uma execução. Falhas do ledger nunca derrubam o job (só são ignoradas)."""
+    row.setdefault("host", socket.gethostname())
+    if isinstance(row.get("params"), dict):
+        row["params"] = json.dumps(row["params"], sort_keys=True, default=str)
+    if isinstance(row.get("argv"), (list, tuple)):
+        row["argv"] = " ".join(shlex.quote(str(a)) for a in row["argv"])
+    cols = [c for c, _ in _LEDGER_COLUMNS if c in row]
+    try:
+        con = _ledger_connect()
+        with con:
+            con.execute(f"INSERT INTO runs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})",
+                        [row[c] for c in cols])
+        con.close()
+    except sqlite3.Error:
+        pass
+
+
+def ledger_query(tool: str = "", host: str = "", sample: str = "", limit: int = 500) -> list:
+    """Execuções mais recentes primeiro (dicts)."""
+    where, args = [], []
+    for col, val in (("tool", tool), ("host", host)):
+        if val:
+            where.append(f"{col} = ?")
+            args.append(val)
+    if sample:
+        where.append("sample LIKE ?")
+        args.append(f"%{sample}%")
+    sql = "SELECT * FROM runs" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY started DESC LIMIT ?"
+    con = _ledger_connect()
+    try:
+        return [dict(r) for r in con.execute(sql, args + [limit])]
+    finally:
+        con.close()
+
+
+def _median(vals):
+    vals = sorted(v for v in vals if v is not None)
+    if not vals:
+        return None
+    m = len(vals) // 2
+    return vals[m] if len(vals) % 2 else (vals[m - 1] + vals[m]) / 2
+
+
+def ledger_trends(tool: str = "", host: str = "", period: str = "%Y-%m") -> list:
+    """
+    Tendências por (ferramenta, host, período): nº de execuções, % ok, mediana de tempo de
+    parede, de throughput (Gb de entrada/h, só execuções ok) e de pico de memória.
+    """
+    groups = {}
+    for r in ledger_query(tool, host, limit=100000):
+        key = (r["tool"], r["host"], time.strftime(period, time.localtime(r["started"] or 0)))
+        groups.setdefault(key, []).append(r)
+    out = []
+    for (t, h, per), rows in sorted(groups.items(), key=lambda kv: (kv[0][0], kv[0][1], kv[0][2])):
+        ok = [r for r in rows if r["exit_code"] == 0]
+        tput = [r["input_bases"] / 1e9 / (r["wall_s"] / 3600) for r in ok
+                if r["input_bases"] and r["wall_s"]]
+        out.append({"tool": t, "host": h, "period": per, "runs": len(rows),
+                    "ok_pct": round(100 * len(ok) / len(rows), 1),
+                    "median_wall_s": _median([r["wall_s"] for r in ok]),
+                    "median_gb_per_h": round(_median(tput), 3) if tput else None,
+                    "median_peak_mb": _median([r["peak_rss_mb"] for r in ok])})
+    return out
+
+
+def show_ledger_window(parent, tool: str = ""):
+    """Janela Tk com as últimas execuções e as tendências de throughput (compartilhada pelos apps)."""
+    import tkinter as tk
+    from tkinter import ttk
+    win = tk.Toplevel(parent)
+    win.title("Histórico de execuções (nb_runs.sqlite)")
+    win.geometry("1200x640")
+    top = ttk.Frame(win)
+    top.pack(fill="x", padx=8, pady=6)
+    v_tool, v_host, v_sample = tk.StringVar(value=tool), tk.StringVar(), tk.StringVar()
+    for label, var in (("Ferramenta", v_tool), ("Host", v_host), ("Amostra contém", v_sample)):
+        ttk.Label(top, text=label).pack(side="left", padx=(8, 4))
+        ttk.Entry(top, textvariable=var, width=16).pack(side="left")
+    nb = ttk.Notebook(win)
+    nb.pack(fill="both", expand=True, padx=8, pady=6)
+
+    def table(cols, heads):
+        fr = ttk.Frame(nb)
+        tv = ttk.Treeview(fr, columns=cols, show="headings")
+        for c, h in zip(cols, heads):
+            tv.heading(c, text=h)
+            tv.column(c, width=90 if c not in ("sample", "policy", "argv") else 200, anchor="w")
+        sb = ttk.Scrollbar(fr, orient="vertical", command=tv.yview)
+        tv.configure(yscrollcommand=sb.set)
+        tv.pack(side="left", fill="both", expand=True)
+        sb.pack(side="right", fill="y")
+        return fr, tv
+
+    run_cols = ("when", "app", "tool", "sample", "threads", "input", "wall", "cpu", "peak", "exit", "status", "host",
+                "policy", "argv")
+    fr_runs, tv_runs = table(run_cols, ("Início", "App", "Ferramenta", "Amostra", "Threads", "Entrada (Gb)",
+                                        "Parede", "CPU (s)", "Pico (MB)", "Código", "Status", "Host", "Política",
+                                        "Comando"))
+    tr_cols = ("tool", "host", "period", "runs", "ok_pct", "wall", "gbh", "peak")
+    fr_tr, tv_tr = table(tr_cols, ("Ferramenta", "Host", "Mês", "Execuções", "% ok", "Parede (mediana)",
+                                   "Gb/h (mediana)", "Pico MB (mediana)"))
+    nb.add(fr_runs, text="Execuções")
+    nb.add(fr_tr, text="Tendências (regressões de desempenho)")
+
+    def fmt_t(s):
+        return "—" if s is None else (f"{s / 3600:.2f} h" if s >= 3600 else f"{s / 60:.1f} min")
+
+    def refresh():
+        tv_runs.delete(*tv_runs.get_children())
+        tv_tr.delete(*tv_tr.get_children())
+        try:
+            runs = ledger_query(v_tool.get().strip(), v_host.get().strip(), v_sample.get().strip())
+            trends = ledger_trends(v_tool.get().strip(), v_host.get().strip())
+        except sqlite3.Error as e:
+            tv_runs.insert("", "end", values=(f"erro: {e}",))
+            return
+        for r in runs:
+            tv_runs.insert("", "end", values=(
+                time.strftime("%Y-%m-%d %H:%M", time.localtime(r["started"] or 0)), r["app"], r["tool"],
+                r["sample"], r["threads"], f"{(r['input_bases'] or 0) / 1e9:.2f}", fmt_t(r["wall_s"]),
+                r["cpu_s"], r["peak_rss_mb"], r["exit_code"], r["status"], r["host"], r["policy"] or "", r["argv"]))
+        for t in trends:
+            tv_tr.insert("", "end", values=(t["tool"], t["host"], t["period"], t["runs"], t["ok_pct"],
+                                            fmt_t(t["median_wall_s"]), t["median_gb_per_h"] or "—",
+                                            t["median_peak_mb"] or "—"))
+    ttk.Button(top, text="Atualizar", command=refresh).pack(side="left", padx=8)
+    refresh()
+    return win
+
+
+
+# ---------------------------
+# Previsão de tempo/memória a partir do histórico
+# ---------------------------
+# Regressão log-log por grupo (ferramenta + variante: modo, --careful, uc_mode),
+# ajustada só com execuções ok do ledger:
+#     log(parede) ~ a + b·log(tamanho) + c·log(threads);  log(pico) ~ a' + b'·log(tamanho)
+# tamanho = bases de entrada (montadores) ou bytes (fastp/kraken2: bases só se sabem depois).
+# Poucos dados no grupo -> cai para o nível da ferramenta; sem dados -> sem previsão.
+# O desvio-padrão dos resíduos define quando uma execução está "fora da curva".
+PREDICT_MIN_RUNS = 3
+_SIZE_FEATURE = {"fastp": "input_bytes", "kraken2": "input_bytes"}
+
+
+def _variant(tool: str, params: dict) -> str:
+    if tool == "spades":
+        return f"{params.get('mode', '')}/{'careful' if params.get('spades_careful') else 'default'}"
+    if tool == "unicycler":
+        return f"{params.get('mode', '')}/{params.get('uc_mode', '')}"
+    return ""
+
+
+def _solve(X, y, ridge=1e-3):
+    """Mínimos quadrados (equações normais + ridge pequeno; k <= 3, sem numpy)."""
+    k = len(X[0])
+    A = [[sum(r[i] * r[j] for r in X) + (ridge if i == j and i else 0.0) for j in range(k)] for i in range(k)]
+    b = [sum(r[i] * v for r, v in zip(X, y)) for i in range(k)]
+    for c in range(k):
+        piv = max(range(c, k), key=lambda r: abs(A[r][c]))
+        if abs(A[piv][c]) < 1e-12:
+            return None
+        A[c], A[piv], b[c], b[piv] = A[piv], A[c], b[piv], b[c]
+        for r in range(k):
+            if r != c:
+                f = A[r][c] / A[c][c]
+                A[r] = [x - f * z for x, z in zip(A[r], A[c])]
+                b[r] -= f * b[c]
+    return [b[i] / A[i][i] for i in range(k)]
+
+
+class _Fit:
+    __slots__ = ("wall", "wall_sd", "mem", "n")
+
+    def __init__(self, rows, feat):
+        xs = [(math.log(r[feat]), math.log(max(1, r["threads"] or 1))) for r in rows]
+        use_thr = len({t for _, t in xs}) > 1 and len(rows) >= PREDICT_MIN_RUNS
+        X = [[1.0, s, t] if use_thr else [1.0, s] for s, t in xs]
+        y = [math.log(r["wall_s"]) for r in rows]
+        if len(rows) == 1:
+            self.wall = [y[0] - xs[0][0], 1.0]          # escala linear com o tamanho
+        else:
+            self.wall = _solve(X, y) or [sum(y) / len(y), 0.0]
+        res = [v - sum(c * x for c, x in zip(self.wall, row)) for row, v in zip(X, y)]
+        self.wall_sd = math.sqrt(sum(e * e for e in res) / max(1, len(res) - len(self.wall))) if len(res) > 1 else 0.5
+        mem = [(math.log(r[feat]), math.log(r["peak_rss_mb"])) for r in rows if r["peak_rss_mb"]]
+        self.mem = (_solve([[1.0, s] for s, _ in mem], [m for _, m in mem]) if len(mem) >= 2 else None) \
+            or ([sum(m for _, m in mem) / len(mem), 0.0] if mem else None)
+        self.n = len(rows)
+
+
+class RuntimePredictor:
+    def __init__(self, rows=()):
+        groups = {}
+        for r in rows:
+            feat = _SIZE_FEATURE.get(r["tool"], "input_bases")
+            if r["exit_code"] != 0 or not r["wall_s"] or not r[feat]:
+                continue
+            try:
+                params = json.loads(r["params"] or "{}")
+            except ValueError:
+                params = {}
+            groups.setdefault((r["tool"], _variant(r["tool"], params)), []).append(r)
+            groups.setdefault((r["tool"], None), []).append(r)
+        self._fits = {k: _Fit(v, _SIZE_FEATURE.get(k[0], "input_bases")) for k, v in groups.items()}
+
+    @classmethod
+    def from_ledger(cls, host: str = "") -> "RuntimePredictor":
+        """Ajusta com o histórico local (host atual por padrão; sem histórico => previsor vazio)."""
+        try:
+            rows = ledger_query(host=host or socket.gethostname(), limit=5000)
+        except sqlite3.Error:
+            rows = []
+        return cls(rows)
+
+    def predict(self, tool: str, size: float, threads: int = 1, params: dict = None):
+        """{"wall_s", "peak_mb", "limit_s", "n", "level"} ou None sem dados suficientes."""
+        if not size or size <= 0:
+            return None
+        fit, level = self._fits.get((tool, _variant(tool, params or {}))), "variante"
+        if fit is None or fit.n < PREDICT_MIN_RUNS:
+            fit, level = self._fits.get((tool, None)), "ferramenta"
+        if fit is None:
+            return None
+        x = [1.0, math.log(size), math.log(max(1, threads))][:len(fit.wall)]
+        wall = math.exp(sum(c * v for c, v in zip(fit.wall, x)))
+        peak = math.exp(fit.mem[0] + fit.mem[1] * math.log(size)) if fit.mem else None
+        # "fora da curva": além de ~3 desvios (no mínimo o dobro do previsto)
+        return {"wall_s": wall, "peak_mb": peak, "limit_s": wall * max(2.0, math.exp(3 * fit.wall_sd)),
+                "n": fit.n, "level": level}
+
+
+def fmt_duration(s) -> str:
+    if s is None:
+        return "?"
+    s = int(s)
+    return f"{s // 3600}h{s % 3600 // 60:02d}" if s >= 3600 else f"{max(1, s // 60)} min"
+
+
+def _ledger_cli(argv=None):
+    import argparse
+    ap = argparse.ArgumentParser(description="Consulta o histórico de execuções (nb_runs.sqlite).")
+    ap.add_argument("--tool", default="")
+    ap.add_argument("--host", default="")
+    ap.add_argument("--sample", default="")
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--trends", action="store_true", help="tendências por ferramenta/host/mês")
+    a = ap.parse_args(argv)
+    if a.trends:
+        rows = ledger_trends(a.tool, a.host)
+        cols = ["tool", "host", "period", "runs", "ok_pct", "median_wall_s", "median_gb_per_h", "median_peak_mb"]
+    else:
+        rows = ledger_query(a.tool, a.host, a.sample, a.limit)
+        cols = ["id", "app", "tool", "sample", "threads", "input_bases", "wall_s", "cpu_s",
+                "peak_rss_mb", "exit_code", "status", "host", "policy"]
+    print("\t".join(cols))
+    for r in rows:
+        print("\t".join("" if r.get(c) is None else str(r[c]) for c in cols))
+
+
+if __name__ == "__main__":
+    # python NB_PIPELINE_COMMON.py [--tool spades] [--host X] [--trends]
+    _ledger_cli()
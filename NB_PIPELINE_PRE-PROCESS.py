@@ -61,13 +61,26 @@ import shutil
 import re
 import shlex
 from pathlib import Path
-import signal
-from queue import Queue, Empty
-
-PAIR_REGEX = re.compile(r"(.+?)[._-]R?([12])(?:_001)?\.(?:fastq|fq)(?:\.gz)?$",re.IGNORECASE)
-
-
-# Identifica FASTQs pareados (R1/R2), com ou sem compressão .gz
+import json
+import time
+import gzip
+import csv
+import zlib
+import math
+import itertools
+import html
+import errno
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from queue import Queue, Empty, Full
+from NB_PIPELINE_COMMON import (output_mux, watchdog, verify_inputs, proc_exited, RunTimer,
+                                ledger_record, show_ledger_window, RuntimePredictor, fmt_duration,
+                                exec_policy, show_policy_window, PAIR_REGEX, raw_tell)
+try:
+    import numpy as np
+except ImportError:  # numpy vem do env (installer); sem ele a pré-visualização fica indisponível
+    np = None
+
+# Identifica FASTQs pareados (R1/R2), com ou sem compressão .gz (PAIR_REGEX, em NB_PIPELINE_COMMON)
 # Padrão: <prefixo>[._-]R?<1|2>[_001]?.<fastq|fq>[.gz]$
 #
 # Quebra da regex:
@@ -107,9 +120,581 @@ BASE_DIR = Path(__file__).resolve().parent
 OUT_DIR = BASE_DIR / "fastp_output"
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Preset lido pelo modo pipeline (fastp -> montagem) do NB_PIPELINE_ASSEMBLY.py
+FASTP_PRESET = OUT_DIR / "fastp_pipeline_preset.json"
+
 def _abs(p):
     return str((OUT_DIR / p).resolve())
 
+# ---------------------------
+# Pré-visualização de FASTQ bruto (antes do fastp)
+# ---------------------------
+# Lê o FASTQ(.gz) em blocos binários grandes e processa cada bloco com NumPy:
+# posições de '\n' -> registros completos (4 linhas) -> máscaras das linhas de
+# sequência/qualidade -> histogramas (comprimento, byte de qualidade, bases) via
+# bincount. Para após PREVIEW_READS leituras; bases/leituras totais são
+# extrapoladas pela fração do arquivo em disco já consumida.
+PREVIEW_READS = 100_000
+PREVIEW_CHUNK = 1 << 22
+_PREVIEW_CACHE = {}
+
+
+def _line_mask(n: int, starts, ends):
+    """Máscara booleana (tamanho n) dos bytes em [starts[i], ends[i])."""
+    m = np.zeros(n + 1, dtype=np.int8)
+    m[starts] = 1
+    m[ends] -= 1
+    return np.cumsum(m[:-1], dtype=np.int8).astype(bool)
+
+
+def _fastq_preview(path: str, max_reads: int = PREVIEW_READS) -> dict:
+    """Estatísticas das primeiras max_reads leituras + estimativa do total (cache por tamanho/mtime)."""
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns, max_reads)
+    if key in _PREVIEW_CACHE:
+        return _PREVIEW_CACHE[key]
+    len_hist = np.zeros(1, dtype=np.int64)
+    qual_hist = np.zeros(256, dtype=np.int64)
+    base_hist = np.zeros(256, dtype=np.int64)
+    reads, status, complete = 0, "ok", False
+    dec_read = dec_used = 0
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as fh:
+        carry = b""
+        while reads < max_reads:
+            try:
+                chunk = fh.read(PREVIEW_CHUNK)
+            except (EOFError, OSError, zlib.error) as e:
+                status = f"TRUNCADO/corrompido ({type(e).__name__})"
+                break
+            if not chunk:
+                complete = True
+                if carry.strip():
+                    status = "TRUNCADO (registro incompleto no fim)"
+                break
+            dec_read += len(chunk)
+            buf = carry + chunk
+            arr = np.frombuffer(buf, dtype=np.uint8)
+            nl = np.flatnonzero(arr == 10)
+            nrec = min(len(nl) // 4, max_reads - reads)
+            if nrec == 0:
+                carry = buf
+                continue
+            nl = nl[:4 * nrec]
+            cut = int(nl[-1]) + 1
+            starts = np.concatenate(([0], nl[:-1] + 1))
+            if (arr[starts[0::4]] != ord("@")).any() or (arr[starts[2::4]] != ord("+")).any():
+                status = "formato inválido (registros desalinhados)"
+                break
+            s_st, s_en, q_st, q_en = starts[1::4], nl[1::4], starts[3::4], nl[3::4]
+            lens = s_en - s_st
+            if (lens != q_en - q_st).any():
+                status = "formato inválido (SEQ/QUAL de tamanhos diferentes)"
+                break
+            lh = np.bincount(lens)
+            if len(lh) > len(len_hist):
+                len_hist = np.pad(len_hist, (0, len(lh) - len(len_hist)))
+            len_hist[:len(lh)] += lh
+            view = arr[:cut]
+            qual_hist += np.bincount(view[_line_mask(cut, q_st, q_en)], minlength=256)
+            base_hist += np.bincount(view[_line_mask(cut, s_st, s_en)], minlength=256)
+            reads += nrec
+            dec_used += cut
+            carry = buf[cut:]
+        consumed = raw_tell(fh)
+    res = {"reads": reads, "status": status, "complete": complete}
+    bases = int(base_hist.sum())
+    if reads:
+        lengths = np.flatnonzero(len_hist)
+        qs = np.flatnonzero(qual_hist)
+        qmin = int(qs[0]) if len(qs) else 33
+        offset = 64 if qmin >= 64 else 33
+        qual_total = int(qual_hist.sum()) or 1
+        # Q média = Phred da probabilidade de erro média (média dos Q superestima a qualidade)
+        err = 10.0 ** (-np.clip(np.arange(256) - offset, 0, None) / 10.0)
+        mean_err = float((qual_hist * err).sum()) / qual_total
+        gc = int(base_hist[b"G"[0]] + base_hist[b"C"[0]] + base_hist[b"g"[0]] + base_hist[b"c"[0]])
+        # só a fração usada do que foi descomprimido conta para a razão leituras/byte em disco
+        used = consumed * dec_used / dec_read if dec_read else 0
+        scale = 1.0 if complete or not used else st.st_size / used
+        res.update({
+            "len_min": int(lengths[0]), "len_max": int(lengths[-1]),
+            "len_mean": round(bases / reads, 1),
+            "encoding": "Phred+33" if qmin < 59 else ("Phred+64" if qmin >= 64 else "Solexa+64?"),
+            "mean_q": round(-10.0 * math.log10(mean_err), 1),
+            "q30": round(100.0 * int(qual_hist[offset + 30:].sum()) / qual_total, 1),
+            "gc": round(100.0 * gc / (bases or 1), 1),
+            "est_reads": int(reads * scale), "est_bases": int(bases * scale),
+        })
+    _PREVIEW_CACHE[key] = res
+    return res
+
+
+def _fmt_count(n) -> str:
+    for unit, div in (("G", 1e9), ("M", 1e6), ("k", 1e3)):
+        if n >= div:
+            return f"{n / div:.1f} {unit}"
+    return str(n)
+
+# ---------------------------
+# Triagem de contaminação (Kraken2) após o fastp
+# ---------------------------
+# Classifica só uma subamostra (primeiras N leituras/pares) de cada FASTQ limpo.
+# O banco é aberto com --memory-mapping: o kraken2 não copia os 8–60 GB para a
+# memória do processo a cada amostra; as páginas ficam no page cache do sistema e
+# são reaproveitadas por todas as amostras do lote. Pré-aquecer (WILLNEED no banco
+# inteiro) é opcional e só vale para bancos que cabem folgados na RAM disponível:
+# senão o readahead expulsa do page cache tudo o mais que roda na máquina.
+KRAKEN_DIR = BASE_DIR / "kraken2_output"
+KRAKEN_SUMMARY = KRAKEN_DIR / "kraken2_summary.tsv"
+KRAKEN_DB_FILES = ("hash.k2d", "opts.k2d", "taxo.k2d")
+KRAKEN_PRELOAD_MAX_FRAC = 0.5   # pré-aquece só se o banco ocupar até metade da MemAvailable
+KRAKEN_FIELDS = ["sample", "reads_after_fastp", "q30_after_fastp", "gc_after_fastp", "screened_reads",
+                 "classified_pct", "target", "target_pct", "top_contaminants"]
+
+
+def _kraken_db_ok(db: str) -> bool:
+    return bool(db) and all((Path(db) / f).is_file() for f in KRAKEN_DB_FILES)
+
+
+def _mem_available() -> int:
+    """MemAvailable em bytes (/proc/meminfo); 0 se desconhecido."""
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+
+def _kraken_preload_check(db: str) -> str:
+    """'' se o banco pode ser pré-aquecido; senão o motivo para não fazê-lo."""
+    if not hasattr(os, "posix_fadvise"):
+        return "posix_fadvise indisponível"
+    size = sum(os.path.getsize(Path(db) / n) for n in KRAKEN_DB_FILES if (Path(db) / n).is_file())
+    avail = _mem_available()
+    if not avail:
+        return "memória disponível desconhecida"
+    if size > avail * KRAKEN_PRELOAD_MAX_FRAC:
+        return f"banco de {size / 1e9:.1f} GB para {avail / 1e9:.1f} GB disponíveis"
+    return ""
+
+
+def _warm_kraken_db(db: str) -> None:
+    """Pede ao kernel leitura antecipada do banco (assíncrona; não bloqueia nem aloca)."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for name in KRAKEN_DB_FILES:
+        try:
+            fd = os.open(str(Path(db) / name), os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+def _head_fastq(srcs, dests, n_reads: int) -> int:
+    """Copia as primeiras n_reads leituras de cada FASTQ(.gz) (em paralelo p/ pares). Retorna nº de leituras."""
+    ins = [gzip.open(p, "rb") if str(p).endswith(".gz") else open(p, "rb") for p in srcs]
+    outs = [open(p, "wb") for p in dests]
+    n = 0
+    try:
+        while n < n_reads:
+            recs = [[fh.readline() for _ in range(4)] for fh in ins]
+            if any(not r[3] for r in recs):
+                break
+            for fh, r in zip(outs, recs):
+                fh.writelines(r)
+            n += 1
+    finally:
+        for fh in ins + outs:
+            fh.close()
+    return n
+
+
+def _fastp_metrics(json_path: str) -> dict:
+    try:
+        with open(json_path) as fh:
+            summ = json.load(fh)["summary"]
+        after = summ["after_filtering"]
+        return {"bases_before_fastp": summ["before_filtering"].get("total_bases"),
+                "reads_after_fastp": after.get("total_reads", ""),
+                "q30_after_fastp": round(100 * after.get("q30_rate", 0), 2),
+                "gc_after_fastp": round(100 * after.get("gc_content", 0), 2)}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def _parse_kraken_report(path, target: str, top: int = 3) -> dict:
+    """
+    Relatório do kraken2 (--report): pct, reads_clado, reads_taxon, rank, taxid, nome.
+    Alvo = espécie (rank S) com esse nome; vazio => a espécie mais abundante.
+    """
+    species, classified = [], 0.0
+    with open(path) as fh:
+        for line in fh:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 6:
+                continue
+            pct, rank, name = float(cols[0]), cols[3].strip(), cols[5].strip()
+            if rank == "U":
+                classified = 100.0 - pct
+            elif rank == "S":
+                species.append((pct, name))
+    species.sort(reverse=True)
+    tgt = target.strip().lower()
+    hit = next(((p, n) for p, n in species if n.lower() == tgt), None) if tgt else (species[0] if species else None)
+    others = [(p, n) for p, n in species if hit is None or n != hit[1]][:top]
+    return {"classified_pct": round(classified, 2),
+            "target": hit[1] if hit else (target or "—"),
+            "target_pct": hit[0] if hit else 0.0,
+            "top_contaminants": "; ".join(f"{n} {p:.2f}%" for p, n in others)}
+
+
+def _append_kraken_summary(row: dict) -> None:
+    new = not KRAKEN_SUMMARY.exists()
+    with open(KRAKEN_SUMMARY, "a", newline="") as fh:
+        wr = csv.DictWriter(fh, fieldnames=KRAKEN_FIELDS, delimiter="\t", extrasaction="ignore")
+        if new:
+            wr.writeheader()
+        wr.writerow(row)
+
+# ---------------------------
+# Varredura de parâmetros do fastp (subamostra)
+# ---------------------------
+# Grade: uma opção por linha, "opção: v1, v2, ..." (ex.: "-q: 15,20,25", "-r: on,off").
+# Cada combinação roda sobre as mesmas primeiras N leituras/pares de cada amostra
+# escolhida; o restante dos parâmetros vem da tela. Várias execuções em paralelo
+# (poucas threads cada: numa subamostra o fastp escala mal com -w alto). Sem -o:
+# o fastp filtra e gera o JSON sem gravar FASTQ.
+SWEEP_DIR = BASE_DIR / "fastp_sweep"
+SWEEP_MAX_COMBOS = 256
+FASTP_FLAGS = {"-5", "-3", "-r", "-c", "-y", "-g", "-x", "--detect_adapter_for_pe"}
+FASTP_LONG = {
+    "--qualified_quality_phred": "-q", "--unqualified_percent_limit": "-u", "--n_base_limit": "-n",
+    "--length_required": "-l", "--cut_front": "-5", "--cut_tail": "-3", "--cut_right": "-r",
+    "--cut_window_size": "-W", "--cut_mean_quality": "-M", "--trim_front1": "-f", "--trim_tail1": "-t",
+    "--max_len1": "-b", "--trim_front2": "-F", "--trim_tail2": "-T", "--max_len2": "-B",
+    "--adapter_sequence": "-a", "--correction": "-c", "--low_complexity_filter": "-y",
+    "--complexity_threshold": "-Y", "--trim_poly_g": "-g", "--trim_poly_x": "-x",
+}
+SWEEP_FIELDS = ["reads_kept_pct", "bases_kept_pct", "q30_after", "gc_after", "mean_len_after",
+                "low_quality_pct", "too_short_pct", "too_many_n_pct", "adapter_trimmed_pct", "duplication_pct"]
+
+
+def _parse_sweep_grid(text: str):
+    """[(opção curta, [valores])]; ValueError com a linha problemática."""
+    grid = []
+    for n, line in enumerate(text.splitlines(), start=1):
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        opt, sep, vals = line.partition(":")
+        opt = FASTP_LONG.get(opt.strip(), opt.strip())
+        vals = [v.strip() for v in vals.split(",") if v.strip()]
+        if not sep or not opt.startswith("-") or not vals:
+            raise ValueError(f"linha {n}: use 'opção: v1, v2, ...' ({line})")
+        if opt in ("-w", "-i", "-I", "-o", "-O", "-j", "-h", "-s", "-S", "-d"):
+            raise ValueError(f"linha {n}: {opt} é controlado pela varredura")
+        if opt in FASTP_FLAGS:
+            try:
+                vals = [{"on": True, "1": True, "sim": True, "off": False, "0": False, "não": False}[v.lower()] for v in vals]
+            except KeyError:
+                raise ValueError(f"linha {n}: {opt} é liga/desliga (on/off)") from None
+        if any(o == opt for o, _ in grid):
+            raise ValueError(f"linha {n}: {opt} repetido")
+        grid.append((opt, list(dict.fromkeys(vals))))
+    return grid
+
+
+def _set_fastp_option(parts, opt: str, val):
+    """Troca a opção na linha de comando (inclusive o nome longo); val None ou flag False = remove."""
+    names = {opt} | {k for k, v in FASTP_LONG.items() if v == opt}
+    out, i = [], 0
+    while i < len(parts):
+        if parts[i] in names:
+            i += 1 if opt in FASTP_FLAGS else 2
+            continue
+        out.append(parts[i])
+        i += 1
+    if val is None or val is False:
+        return out
+    return out + [opt] if opt in FASTP_FLAGS else out + [opt, str(val)]
+
+
+def _sweep_label(combo) -> str:
+    return " ".join((o if v else f"sem {o}") if o in FASTP_FLAGS else f"{o} {v}" for o, v in combo)
+
+
+def _sweep_metrics(json_path) -> dict:
+    """Métricas comparáveis entre combinações (percentuais sobre a subamostra)."""
+    with open(json_path) as fh:
+        rep = json.load(fh)
+    before, after = rep["summary"]["before_filtering"], rep["summary"]["after_filtering"]
+    filt = rep.get("filtering_result", {})
+    reads, bases = before.get("total_reads") or 0, before.get("total_bases") or 0
+
+    def pct(x, tot=reads):
+        return round(100.0 * (x or 0) / tot, 2) if tot else 0.0
+    return {
+        "reads_kept_pct": pct(after.get("total_reads")), "bases_kept_pct": pct(after.get("total_bases"), bases),
+        "q30_after": round(100 * after.get("q30_rate", 0), 2), "gc_after": round(100 * after.get("gc_content", 0), 2),
+        "mean_len_after": after.get("read1_mean_length", 0),
+        "low_quality_pct": pct(filt.get("low_quality_reads")), "too_short_pct": pct(filt.get("too_short_reads")),
+        "too_many_n_pct": pct(filt.get("too_many_N_reads")),
+        "adapter_trimmed_pct": pct(rep.get("adapter_cutting", {}).get("adapter_trimmed_reads")),
+        "duplication_pct": round(100 * rep.get("duplication", {}).get("rate", 0.0), 2),
+    }
+
+# ---------------------------
+# fastp em shards (uma amostra muito grande em vários processos)
+# ---------------------------
+# Um único fastp com -w alto para de escalar por volta de 16 núcleos (leitura/escrita
+# são um thread por arquivo). No modo shards a amostra é fatiada em fluxo, sem arquivos
+# temporários de entrada:
+#    - o FASTQ(.gz) é lido em blocos grandes cortados em fronteira de registro (4 linhas);
+#      no PE o R2 entrega exatamente o mesmo nº de registros e os dois são intercalados;
+#    - cada bloco vai para o shard que estiver livre (fila única): N fastp --stdin, cada um
+#      lendo um FIFO próprio (conda run não repassa stdin; o bash redireciona o FIFO);
+#    - os .fastq.gz de saída dos shards são concatenados sem recomprimir (gzip multi-membro
+#      é válido) e os JSON somados num relatório único (contagens somadas; taxas recalculadas;
+#      curvas por ciclo e duplicação ponderadas pelo nº de leituras de cada shard).
+# Fronteiras de membro gzip não servem para cortar: não coincidem entre R1 e R2 nem com
+# registros. A ordem das leituras na saída muda (por blocos); os pares continuam alinhados.
+# Com --stdin o fastp não auto-detecta adaptadores: uma passada rápida nas primeiras
+# leituras detecta e os shards recebem -a/--adapter_sequence_r2 explícitos.
+SHARD_BLOCK = 8 << 20            # bytes de R1 por bloco
+SHARD_QUEUE = 2                  # blocos em trânsito por shard
+SHARD_ADAPTER_READS = 200_000
+_SHARD_AFTER = {"after_filtering", "read1_after_filtering", "read2_after_filtering"}
+_SHARD_MEAN_INT = {"read1_mean_length", "read2_mean_length"}
+
+
+class _RecordReader:
+    """FASTQ(.gz) lido em blocos grandes, sempre cortados em fronteira de registro."""
+
+    def __init__(self, path: str, block: int = SHARD_BLOCK):
+        self.path = path
+        self.fh = gzip.open(path, "rb") if path.lower().endswith(".gz") else open(path, "rb")
+        self.block = block
+        self.buf = b""
+        self.eof = False
+
+    def close(self):
+        self.fh.close()
+
+    def _fill(self):
+        data = self.fh.read(self.block)
+        if data:
+            self.buf += data
+        else:
+            self.eof = True
+            if self.buf and not self.buf.endswith(b"\n"):
+                self.buf += b"\n"
+
+    def _cut(self, end: int) -> bytes:
+        out, self.buf = self.buf[:end], self.buf[end:]
+        return out
+
+    def read(self):
+        """(bloco, nº de registros) com ~block bytes; (b"", 0) no fim do arquivo."""
+        while len(self.buf) < self.block and not self.eof:
+            self._fill()
+        buf = self.buf
+        end = buf.rfind(b"\n") + 1
+        lines = buf.count(b"\n", 0, end)
+        for _ in range(lines % 4):
+            end = buf.rfind(b"\n", 0, end - 1) + 1
+        lines -= lines % 4
+        if not lines and buf:
+            raise ValueError(f"{os.path.basename(self.path)}: registro incompleto no fim do arquivo")
+        return self._cut(end), lines // 4
+
+    def take(self, nrec: int, hint: int) -> bytes:
+        """Exatamente nrec registros (o par de um bloco de hint bytes do R1)."""
+        need = 4 * nrec
+        while len(self.buf) < hint + (hint >> 3) and not self.eof:
+            self._fill()
+        have = self.buf.count(b"\n")
+        while have < need and not self.eof:
+            n0 = len(self.buf)
+            self._fill()
+            have += self.buf.count(b"\n", n0)
+        buf = self.buf
+        if have < need:
+            raise ValueError(f"{os.path.basename(self.path)}: menos registros que o R1")
+        # R1 e R2 têm registros de tamanho parecido: parte do fim do buffer, aproxima pela média
+        # de bytes por linha (contando só o trecho entre estimativas) e termina linha a linha
+        avg = len(buf) / have
+        pos, c = len(buf), have
+        while abs(need - c) > 8:
+            new = min(len(buf), max(0, pos + int((need - c) * avg)))
+            c += buf.count(b"\n", pos, new) if new >= pos else -buf.count(b"\n", new, pos)
+            pos = new
+        if c >= need:
+            idx = pos
+            for _ in range(c - need + 1):
+                idx = buf.rfind(b"\n", 0, idx)
+        else:
+            idx = pos - 1
+            for _ in range(need - c):
+                idx = buf.find(b"\n", idx + 1)
+        return self._cut(idx + 1)
+
+
+def _interleave(b1: bytes, b2: bytes) -> bytes:
+    """Blocos R1/R2 com o mesmo nº de registros -> FASTQ intercalado (--interleaved_in)."""
+    l1, l2 = b1.split(b"\n"), b2.split(b"\n")
+    n = len(l1) - 1
+    out = [b""] * (2 * n)
+    for i in range(4):
+        out[i::8] = l1[i:n:4]
+        out[4 + i::8] = l2[i:n:4]
+    out.append(b"")
+    return b"\n".join(out)
+
+
+def _shard_blocks(inputs, abort):
+    """
+    Blocos prontos para os shards (SE: registros inteiros; PE: intercalados). No PE o R1
+    é descomprimido num thread à parte (zlib solta o GIL) enquanto este lê o R2.
+    """
+    r1 = _RecordReader(inputs[0])
+    if len(inputs) == 1:
+        try:
+            while not abort.is_set():
+                block, n = r1.read()
+                if not n:
+                    return
+                yield block
+        finally:
+            r1.close()
+        return
+    r2 = _RecordReader(inputs[1])
+    q = Queue(maxsize=2)
+    done = threading.Event()
+
+    def read_r1():
+        try:
+            while True:
+                try:
+                    item = r1.read()
+                except Exception as e:   # gzip/zlib/registro truncado: repassa ao consumidor
+                    item = e
+                while not (abort.is_set() or done.is_set()):
+                    try:
+                        q.put(item, timeout=0.5)
+                        break
+                    except Full:
+                        pass
+                if isinstance(item, Exception) or not item[1] or abort.is_set() or done.is_set():
+                    return
+        finally:
+            r1.close()
+    threading.Thread(target=read_r1, name="shard-r1", daemon=True).start()
+    try:
+        while not abort.is_set():
+            try:
+                item = q.get(timeout=0.5)
+            except Empty:
+                continue
+            if isinstance(item, Exception):
+                raise item
+            b1, n = item
+            if not n:
+                if r2.read()[1]:
+                    raise ValueError(f"{os.path.basename(inputs[1])}: mais registros que o R1")
+                return
+            yield _interleave(b1, r2.take(n, len(b1)))
+    finally:
+        done.set()
+        r2.close()
+
+
+def _merge_fastp_reports(reports: list) -> dict:
+    """JSON dos shards -> um relatório no formato do fastp."""
+    before = [r["summary"]["before_filtering"].get("total_reads") or 0 for r in reports]
+    after = [r["summary"]["after_filtering"].get("total_reads") or 0 for r in reports]
+
+    def mean(items, weights):
+        tot = sum(weights[i] for i, _ in items)
+        if not tot:
+            return sum(v for _, v in items) / len(items)
+        return sum(v * weights[i] for i, v in items) / tot
+
+    def merge(items, key, is_after):
+        # items: [(índice do shard, valor)]
+        first = items[0][1]
+        w = after if is_after else before
+        if isinstance(first, dict):
+            keys = dict.fromkeys(k for _, v in items if isinstance(v, dict) for k in v)
+            return {k: merge([(i, v[k]) for i, v in items if isinstance(v, dict) and k in v], k,
+                             is_after or k in _SHARD_AFTER) for k in keys}
+        if isinstance(first, list):
+            size = max(len(v) for _, v in items)
+            cols = [[(i, v[j]) for i, v in items if j < len(v) and isinstance(v[j], (int, float))] for j in range(size)]
+            if key == "histogram":
+                return [sum(v for _, v in c) for c in cols]
+            return [round(mean(c, w), 6) if c else 0 for c in cols]
+        if isinstance(first, bool) or not isinstance(first, (int, float)):
+            return first
+        nums = [(i, v) for i, v in items if isinstance(v, (int, float))]
+        if key == "total_cycles":
+            return max(v for _, v in nums)
+        if key in _SHARD_MEAN_INT:
+            return round(mean(nums, w))
+        if isinstance(first, int):
+            return sum(v for _, v in nums)
+        return round(mean(nums, w), 6)
+
+    out = merge(list(enumerate(reports)), "", False)
+    for sec in ("before_filtering", "after_filtering"):
+        s = out["summary"].get(sec, {})
+        if s.get("total_bases"):
+            for q in ("q20", "q30"):
+                if f"{q}_bases" in s:
+                    s[f"{q}_rate"] = round(s[f"{q}_bases"] / s["total_bases"], 6)
+    ins = out.get("insert_size")
+    if ins and ins.get("histogram"):
+        ins["peak"] = max(range(len(ins["histogram"])), key=ins["histogram"].__getitem__)
+    out["command"] = f"{reports[0].get('command', 'fastp')}  # {len(reports)} shards somados (NB_PIPELINE)"
+    out["shards"] = len(reports)
+    return out
+
+
+def _shard_report_html(merged: dict, key: str, shard_htmls) -> str:
+    """Resumo HTML do relatório somado (o HTML do fastp não é combinável) + links por shard."""
+    s = merged["summary"]
+    fields = ("total_reads", "total_bases", "q20_rate", "q30_rate", "read1_mean_length", "read2_mean_length", "gc_content")
+    rows = "".join(f"<tr><td>{f}</td><td>{s['before_filtering'].get(f, '')}</td><td>{s['after_filtering'].get(f, '')}</td></tr>"
+                   for f in fields if f in s["before_filtering"])
+    filt = "".join(f"<tr><td>{k}</td><td>{v}</td></tr>" for k, v in merged.get("filtering_result", {}).items())
+    links = "".join(f'<li><a href="{html.escape(os.path.relpath(p, OUT_DIR))}">{html.escape(Path(p).name)}</a></li>'
+                    for p in shard_htmls)
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>fastp {html.escape(key)} "
+            f"({merged['shards']} shards)</title></head><body><h1>fastp — {html.escape(key)}</h1>"
+            f"<p>{merged['shards']} shards; duplicação (média ponderada): "
+            f"{round(100 * merged.get('duplication', {}).get('rate', 0), 2)}%</p>"
+            f"<table border='1'><tr><th></th><th>Antes</th><th>Depois</th></tr>{rows}</table>"
+            f"<h2>Filtragem</h2><table border='1'>{filt}</table><h2>Relatórios por shard</h2><ul>{links}</ul>"
+            f"</body></html>")
+
+
+def _concat_files(parts, dest) -> None:
+    """Concatena byte a byte (gzip multi-membro continua válido); o 1º shard vira o destino."""
+    os.replace(parts[0], dest)
+    with open(dest, "ab") as out:
+        for p in parts[1:]:
+            with open(p, "rb") as fh:
+                shutil.copyfileobj(fh, out, 16 << 20)
+            os.remove(p)
+
 # ---------------------------
 # APLICAÇÃO PRINCIPAL
 # ---------------------------
@@ -135,21 +720,35 @@ class App(tk.Tk):
 
 # Controle de subprocesso: self.current_proc / self.stop_requested / self.batch_proc
 #    - self.current_proc guarda o objeto subprocess.Popen do fastp em execução.
-#    - self.stop_requested é uma flag booleana: quando True, a thread de leitura
-#      de stdout tenta encerrar o processo (SIGTERM no grupo, ou terminate()).
-#    - Em Unix, preexec_fn=os.setsid cria um *grupo de processos*; isso permite
-#      matar todo o grupo (fastp + filhos) com os.killpg(..., SIGTERM).
-#    - O laço de leitura usa readline() em stdout para *streaming* de linhas:
-#      cada linha é enviada para a fila de logs (Queue) e então exibida pela GUI.
+#    - self.stop_requested é uma flag booleana: quando True, o laço de amostras para;
+#      o processo atual é encerrado na hora pelo watchdog (self.current_watch).
+#    - Em Unix, start_new_session=True cria um *grupo de processos*; isso permite
+#      matar todo o grupo (fastp + filhos) com os.killpg: SIGTERM e, se o grupo não
+#      sair em alguns segundos, SIGKILL (NB_PIPELINE_COMMON.Watchdog). O watchdog
+#      também aplica o tempo máximo e o tempo sem saída por amostra.
+#    - A saída é lida em blocos pelo thread único de NB_PIPELINE_COMMON.output_mux
+#      e enviada para a fila de logs (Queue), exibida pela GUI.
 #    - Ao terminar, wait() é chamado, e self.current_proc volta a None.
 #    - self.batch_proc está reservado para fluxos em lote (não utilizado aqui)
 
 
         # Controle de processos
         self.current_proc = None
+        self.current_watch = None
         self.stop_requested = False
         self.batch_proc = None
 
+        # Varredura de parâmetros: várias execuções simultâneas (cada uma com seu watchdog)
+        self.sweep_watches = set()
+        self.sweep_stop = False
+        self.sweep_running = False
+
+        # fastp em shards: um watchdog por processo da amostra em execução
+        self.shard_watches = set()
+
+        # Pré-visualização de FASTQ (gzip e numpy liberam o GIL: threads bastam)
+        self.preview_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 2), thread_name_prefix="preview")
+
         # Notebook
         self.notebook = ttk.Notebook(self)
         self.notebook.pack(fill='both', expand=True)
@@ -297,6 +896,19 @@ class App(tk.Tk):
         # 1) Seleção de arquivos
         file_sel_frame, self.fastp_file_listbox = self.create_file_selection_frame(self.filtering_frame)
         file_sel_frame.grid(row=1, column=0, sticky="nsew", padx=8, pady=6)
+        ttk.Button(file_sel_frame, text="Pré-visualizar (estatísticas)", command=self.preview_files).grid(row=2, column=3, padx=5, pady=5, sticky="w")
+        ttk.Label(file_sel_frame, text="Leituras por arquivo").grid(row=2, column=4, sticky="e")
+        self.preview_reads = tk.IntVar(value=PREVIEW_READS)
+        ttk.Entry(file_sel_frame, textvariable=self.preview_reads, width=9).grid(row=2, column=5, sticky="w")
+        cols = ("reads", "len", "enc", "q", "q30", "gc", "est", "status")
+        heads = ("Leituras lidas", "Compr. (mín/méd/máx)", "Codificação", "Q média", "%Q30", "GC%", "Bases (estim.)", "Status")
+        self.preview_tree = ttk.Treeview(file_sel_frame, columns=cols, height=6)
+        self.preview_tree.heading("#0", text="Arquivo")
+        self.preview_tree.column("#0", width=260)
+        for c, h in zip(cols, heads):
+            self.preview_tree.heading(c, text=h)
+            self.preview_tree.column(c, width=110, anchor="center")
+        self.preview_tree.grid(row=3, column=0, columnspan=6, sticky="nsew", padx=8, pady=4)
 
         # 2) Parâmetros principais
         main = ttk.LabelFrame(self.filtering_frame, text="Parâmetros principais")
@@ -347,6 +959,15 @@ class App(tk.Tk):
         self.length_limit = tk.IntVar(value=0)
         ttk.Entry(main, textvariable=self.length_limit, width=6).grid(row=2, column=3, sticky="w")
 
+        # Watchdog por amostra (0 = desligado)
+        ttk.Label(main, text="Tempo máx./amostra (min)").grid(row=2, column=4, sticky="w", padx=4)
+        self.max_runtime_min = tk.IntVar(value=0)
+        ttk.Spinbox(main, from_=0, to=1440, textvariable=self.max_runtime_min, width=6).grid(row=2, column=5, sticky="w")
+
+        ttk.Label(main, text="Sem saída por (min)").grid(row=2, column=6, sticky="w", padx=4)
+        self.idle_timeout_min = tk.IntVar(value=0)
+        ttk.Spinbox(main, from_=0, to=1440, textvariable=self.idle_timeout_min, width=6).grid(row=2, column=7, sticky="w")
+
         # Opções específicas úteis conforme documentação fastp
         adv2 = ttk.LabelFrame(self.filtering_frame, text="Opções específicas (PE)")
         adv2.grid(row=3, column=0, sticky="nsew", padx=8, pady=6)
@@ -435,20 +1056,57 @@ class App(tk.Tk):
         self.split_prefix_digits = tk.IntVar(value=4)
         ttk.Entry(adv, textvariable=self.split_prefix_digits, width=6).grid(row=1, column=5, sticky="w")
 
+        # Shards: uma amostra grande em vários fastp (as threads -w são divididas entre eles)
+        ttk.Label(adv, text="Shards p/ amostra grande (0 = off)").grid(row=2, column=0, sticky="w")
+        self.shard_count = tk.IntVar(value=0)
+        ttk.Spinbox(adv, from_=0, to=32, textvariable=self.shard_count, width=6).grid(row=2, column=1, sticky="w")
+        ttk.Label(adv, text="a partir de (GB de entrada)").grid(row=2, column=2, sticky="w")
+        self.shard_min_gb = tk.DoubleVar(value=10.0)
+        ttk.Entry(adv, textvariable=self.shard_min_gb, width=8).grid(row=2, column=3, sticky="w")
+
+        # Triagem Kraken2 (opcional)
+        kr = ttk.LabelFrame(self.filtering_frame, text="Triagem de contaminação — Kraken2 (opcional, após o fastp)")
+        kr.grid(row=7, column=0, sticky="nsew", padx=8, pady=6)
+        for c in range(8):
+            kr.columnconfigure(c, weight=1)
+        self.kraken_enabled = tk.BooleanVar(value=False)
+        ttk.Checkbutton(kr, text="Rodar Kraken2 em cada amostra limpa", variable=self.kraken_enabled).grid(row=0, column=0, columnspan=2, sticky="w")
+        self.kraken_preload = tk.BooleanVar(value=False)
+        ttk.Checkbutton(kr, text="Pré-carregar banco no page cache (se couber na RAM livre)",
+                        variable=self.kraken_preload).grid(row=0, column=2, columnspan=4, sticky="w")
+        ttk.Label(kr, text="Banco (pasta com hash.k2d)").grid(row=1, column=0, sticky="w")
+        self.kraken_db = tk.StringVar(value=os.environ.get("KRAKEN2_DEFAULT_DB", ""))
+        ttk.Entry(kr, textvariable=self.kraken_db).grid(row=1, column=1, columnspan=5, sticky="ew", padx=4)
+        ttk.Button(kr, text="Escolher…", command=lambda: self.kraken_db.set(filedialog.askdirectory() or self.kraken_db.get())).grid(row=1, column=6, sticky="w")
+        ttk.Label(kr, text="Leituras/pares na subamostra").grid(row=2, column=0, sticky="w")
+        self.kraken_reads = tk.IntVar(value=200000)
+        ttk.Entry(kr, textvariable=self.kraken_reads, width=10).grid(row=2, column=1, sticky="w")
+        ttk.Label(kr, text="Espécie alvo (vazio = mais abundante)").grid(row=2, column=2, sticky="w")
+        self.kraken_target = tk.StringVar(value="")
+        ttk.Entry(kr, textvariable=self.kraken_target).grid(row=2, column=3, columnspan=2, sticky="ew", padx=4)
+        ttk.Label(kr, text="--confidence").grid(row=2, column=5, sticky="e")
+        self.kraken_confidence = tk.DoubleVar(value=0.1)
+        ttk.Entry(kr, textvariable=self.kraken_confidence, width=6).grid(row=2, column=6, sticky="w")
+
         # Botões de execução
         btns = ttk.Frame(self.filtering_frame)
-        btns.grid(row=7, column=0, sticky="ew", padx=8, pady=6)
+        btns.grid(row=8, column=0, sticky="ew", padx=8, pady=6)
         ttk.Button(btns, text="Rodar fastp", command=self.run_fastp_thread).pack(side="left")
         ttk.Button(btns, text="Interromper", command=self.stop_fastp).pack(side="left", padx=6)
         ttk.Button(btns, text="Atualizar relatórios", command=self.update_reports_list).pack(side="left", padx=6)
+        ttk.Button(btns, text="Salvar preset p/ pipeline", command=self.save_pipeline_preset).pack(side="left", padx=6)
+        ttk.Button(btns, text="Varredura de parâmetros…", command=self.open_sweep_window).pack(side="left", padx=6)
+        ttk.Button(btns, text="Verificar integridade (gzip)", command=self.verify_files_thread).pack(side="left", padx=6)
+        self.verify_gzip = tk.BooleanVar(value=True)
+        ttk.Checkbutton(btns, text="Verificar gzip/pares antes de rodar", variable=self.verify_gzip).pack(side="left", padx=6)
 
         # Saída de log
         self.fastp_output_text = tk.Text(self.filtering_frame, wrap="word", height=12)
-        self.fastp_output_text.grid(row=8, column=0, sticky="nsew", padx=8, pady=6)
+        self.fastp_output_text.grid(row=9, column=0, sticky="nsew", padx=8, pady=6)
 
         # Lista de relatórios HTML do fastp
         rep = ttk.LabelFrame(self.filtering_frame, text="Relatórios HTML (fastp_output)")
-        rep.grid(row=9, column=0, sticky="nsew", padx=8, pady=6)
+        rep.grid(row=10, column=0, sticky="nsew", padx=8, pady=6)
         rep.columnconfigure(0, weight=1)
         rep.rowconfigure(0, weight=1)
 
@@ -463,6 +1121,8 @@ class App(tk.Tk):
         ttk.Button(rep_btns, text="Abrir selecionado(s)", command=self.open_report).pack(side="left")
         ttk.Button(rep_btns, text="Atualizar lista", command=self.update_reports_list).pack(side="left", padx=6)
         ttk.Button(rep_btns, text="Gerar MultiQC", command=self.run_multiqc_thread).pack(side="left", padx=6)
+        ttk.Button(rep_btns, text="Histórico de execuções", command=lambda: show_ledger_window(self, "fastp")).pack(side="left", padx=6)
+        ttk.Button(rep_btns, text="Políticas de execução", command=lambda: show_policy_window(self)).pack(side="left", padx=6)
 
     # ===============================
     # Execução fastp
@@ -560,6 +1220,21 @@ class App(tk.Tk):
 
         return parts
 
+    def save_pipeline_preset(self):
+        """Salva os parâmetros atuais do fastp para o pipeline fastp -> montagem do app de montagem."""
+        if self.only_report.get():
+            messagebox.showwarning("Preset", "Desmarque 'Somente relatório': o pipeline precisa das leituras limpas.")
+            return
+        if self.split_files.get() or self.split_by_lines.get():
+            messagebox.showwarning("Preset", "Zere o split (-s/-S): o pipeline precisa de um único par de saída.")
+            return
+        # placeholders substituídos por amostra pelo app de montagem
+        parts = self._build_common_fastp_parts("{html}", "{json}")
+        parts[parts.index("-w") + 1] = "{threads}"
+        with open(FASTP_PRESET, "w") as fh:
+            json.dump({"args": parts}, fh, indent=2)
+        self.log(self.fastp_output_text, f"[Preset] Parâmetros do fastp salvos em {FASTP_PRESET}\n")
+
     def _pair_key_and_read(self, filepath: str):
         """Return (key, read) where read is 1 or 2 if pattern matches; else (None, None)."""
         m = PAIR_REGEX.search(os.path.basename(filepath))
@@ -604,6 +1279,12 @@ class App(tk.Tk):
 
         mode = (self.seq_mode.get() or "PE").upper()
         self.stop_requested = False
+        kraken = self._kraken_prepare()
+        if self.verify_gzip.get():
+            bad = self._integrity_precheck(files, mode)
+            if bad:
+                files = [f for f in files if f not in bad]
+                self.log(self.fastp_output_text, f"[Integridade] {len(bad)} arquivo(s) com problema fora do lote.\n")
 
         def run_pe(file_r1, file_r2, base_key):
             base_name = base_key
@@ -641,30 +1322,61 @@ class App(tk.Tk):
             self.log(self.fastp_output_text, f"Filtrando (SE): {file_se}\n")
             return cmd, [str(out1)]
 
-        def run_and_stream(cmd):
+        max_runtime = 60 * int(self.max_runtime_min.get() or 0)
+        idle_timeout = 60 * int(self.idle_timeout_min.get() or 0)
+        predictor = RuntimePredictor.from_ledger()
+        threads = int(self.threads.get())
+
+        def predict(tool, inputs):
+            return predictor.predict(tool, sum(os.path.getsize(p) for p in inputs if os.path.exists(p)), threads)
+
+        def run_and_stream(cmd, tag="", ledger=None):
+            """ledger: {"tool", "sample", "inputs"[, "json"]} => grava a execução em nb_runs.sqlite."""
+            policy = exec_policy(ledger["tool"] if ledger else "", threads)
             try:
+                expected = predict(ledger["tool"], ledger["inputs"]) if ledger else None
+                if expected:
+                    self.log(self.fastp_output_text, f"{tag}[previsão] ~{fmt_duration(expected['wall_s'])}\n")
+                self.log(self.fastp_output_text, f"{tag}[política] {policy.summary()}\n")
+                timer = RunTimer()
                 self.current_proc = subprocess.Popen(
-                    cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
-                    preexec_fn=os.setsid if hasattr(os, "setsid") else None, bufsize=1
+                    policy.wrap(cmd), shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                    start_new_session=True
                 )
-                for line in iter(self.current_proc.stdout.readline, ''):
-                    if line:
-                        self.log(self.fastp_output_text, line)
-                    if self.stop_requested and self.current_proc and self.current_proc.poll() is None:
-                        try:
-                            if hasattr(os, "setsid"):
-                                os.killpg(os.getpgid(self.current_proc.pid), signal.SIGTERM)
-                            else:
-                                self.current_proc.terminate()
-                        except Exception:
-                            pass
-                        self.log(self.fastp_output_text, "[Interrompido pelo usuário]\n")
+                policy.started(self.current_proc)
+                watch = self.current_watch = watchdog().watch(
+                    self.current_proc, max_runtime, idle_timeout,
+                    on_event=lambda text: self.log(self.fastp_output_text, tag + text))
+
+                def on_text(text):
+                    watch.touch()
+                    self.log(self.fastp_output_text, text)
+                # Saída lida pelo thread de I/O único (NB_PIPELINE_COMMON.output_mux), em blocos;
+                # este thread só espera o EOF (parada e timeouts ficam com o watchdog).
+                eof = output_mux().register(self.current_proc.stdout, tag, on_text)
+                while not eof.wait(0.5):
+                    if watch.reason and not watch.alive():
                         break
-                ret = self.current_proc.wait()
+                    if expected and time.monotonic() - timer.t0 > expected["limit_s"]:
+                        self.log(self.fastp_output_text,
+                                 f"{tag}[previsão] AVISO: rodando há {fmt_duration(time.monotonic() - timer.t0)}; "
+                                 f"previsto ~{fmt_duration(expected['wall_s'])} (fora da curva do histórico).\n")
+                        expected = None
+                watch.settle()
+                ret = timer.finish(self.current_proc)
+                policy.release()
+                if ledger:
+                    self._ledger_run(ledger, cmd, timer, watch.reason, policy.summary())
+                if watch.reason == "stopped":
+                    self.log(self.fastp_output_text, "[Interrompido pelo usuário]\n")
+                elif watch.reason:
+                    self.log(self.fastp_output_text, f"{tag}[watchdog] amostra encerrada ({watch.reason}).\n")
                 self.current_proc = None
+                self.current_watch = None
                 return ret
             except Exception as e:
                 self.log(self.fastp_output_text, f"Erro inesperado: {e}\n")
+                policy.release()
                 return -1
 
         # Loop de execução conforme modo
@@ -677,28 +1389,45 @@ class App(tk.Tk):
             if unknown:
                 self.log(self.fastp_output_text, f"[Aviso] Arquivo(s) com nome não reconhecido para PE: {len(unknown)}. Serão ignorados no modo PE.\n")
 
+            self._log_batch_eta([predict("fastp", [r1, r2]) for r1, r2, _ in pairs])
             for r1, r2, key in pairs:
                 if self.stop_requested:
                     break
                 cmd, outs = run_pe(r1, r2, key)
-                ret = run_and_stream(cmd)
+                shards = self._shard_plan([r1, r2])
+                if shards:
+                    ret = self._fastp_sharded([r1, r2], outs, key, shards, max_runtime, idle_timeout)
+                else:
+                    ret = run_and_stream(cmd, f"[{key}] ", {"tool": "fastp", "sample": key, "inputs": [r1, r2],
+                                                            "json": _abs(f"{key}_fastp_report.json")})
                 if ret == 0 and not self.stop_requested:
                     self.log(self.fastp_output_text, "Concluído.\n")
                     if not self.only_report.get():
                         processed_files.extend(outs)
+                        if kraken:
+                            self._kraken_screen(key, outs, run_and_stream)
                 elif ret != 0 and not self.stop_requested:
                     self.log(self.fastp_output_text, "Erro ao processar par.\n")
 
         else:  # SE
+            self._log_batch_eta([predict("fastp", [f]) for f in files])
             for file in files:
                 if self.stop_requested:
                     break
                 cmd, outs = run_se(file)
-                ret = run_and_stream(cmd)
+                key = Path(outs[0]).name[:-len("_cleaned.fastq.gz")]
+                shards = self._shard_plan([file])
+                if shards:
+                    ret = self._fastp_sharded([file], outs, key, shards, max_runtime, idle_timeout)
+                else:
+                    ret = run_and_stream(cmd, f"[{os.path.basename(file)}] ", {"tool": "fastp", "sample": key, "inputs": [file],
+                                                                              "json": _abs(f"{key}_fastp_report.json")})
                 if ret == 0 and not self.stop_requested:
                     self.log(self.fastp_output_text, "Concluído.\n")
                     if not self.only_report.get():
                         processed_files.extend(outs)
+                        if kraken:
+                            self._kraken_screen(key, outs, run_and_stream)
                 elif ret != 0 and not self.stop_requested:
                     self.log(self.fastp_output_text, "Erro ao processar arquivo.\n")
 
@@ -713,16 +1442,618 @@ class App(tk.Tk):
         #         self._ui(self.fastp_file_listbox.insert, 'end', f)
         self.update_reports_list()
 
+    # ===============================
+    # Pré-visualização dos FASTQ brutos
+    # ===============================
+    def preview_files(self):
+        if np is None:
+            messagebox.showerror("Pré-visualização", "numpy não está disponível no ambiente.")
+            return
+        files = list(self.fastp_file_listbox.get(0, tk.END))
+        if not files:
+            messagebox.showinfo("Pré-visualização", "Nenhum arquivo na lista.")
+            return
+        n = max(1000, int(self.preview_reads.get() or PREVIEW_READS))
+        tree = self.preview_tree
+        tree.delete(*tree.get_children())
+        for f in files:
+            iid = tree.insert("", "end", text=os.path.basename(f), values=("…",) * 7 + ("na fila",))
+            fut = self.preview_pool.submit(_fastq_preview, f, n)
+            fut.add_done_callback(lambda fu, iid=iid: self._ui(self._preview_show, iid, fu))
+
+    def _preview_show(self, iid, fut):
+        if not self.preview_tree.exists(iid):
+            return
+        try:
+            r = fut.result()
+        except Exception as e:
+            self.preview_tree.item(iid, values=("—",) * 7 + (f"erro: {e}",))
+            return
+        if not r["reads"]:
+            self.preview_tree.item(iid, values=("0",) + ("—",) * 6 + (r["status"],))
+            return
+        est = _fmt_count(r["est_bases"]) + ("" if r["complete"] else " ~")
+        status = r["status"] if r["status"] != "ok" else ("ok (completo)" if r["complete"] else "ok (parcial)")
+        self.preview_tree.item(iid, values=(
+            r["reads"], f"{r['len_min']}/{r['len_mean']}/{r['len_max']}", r["encoding"],
+            r["mean_q"], r["q30"], r["gc"], est, status))
+
+    # ===============================
+    # Verificação de integridade (gzip + pares)
+    # ===============================
+    def verify_files_thread(self):
+        files = list(self.fastp_file_listbox.get(0, tk.END))
+        if not files:
+            messagebox.showinfo("Integridade", "Nenhum arquivo na lista.")
+            return
+        mode = (self.seq_mode.get() or "PE").upper()
+        threading.Thread(target=self._integrity_precheck, args=(files, mode), daemon=True).start()
+
+    def _integrity_precheck(self, files, mode) -> set:
+        """Valida CRC/trailer gzip (pool de processos, veredictos em cache) e contagens R1/R2. Retorna os ruins."""
+        pairs = [(r1, r2) for r1, r2, _ in self._detect_pairs(files)[0]] if mode == "PE" else []
+        self.log(self.fastp_output_text, f"[Integridade] Verificando {len(files)} arquivo(s)…\n")
+
+        def on_result(path, v, cached):
+            tag = " (cache)" if cached else ""
+            if v["ok"]:
+                self.log(self.fastp_output_text, f"[Integridade] OK{tag}: {os.path.basename(path)} ({v['records']} registros)\n")
+            else:
+                self.log(self.fastp_output_text, f"[Integridade] ERRO{tag}: {path}: {v['error']}\n")
+        res = verify_inputs(files, pairs, on_result=on_result)
+        bad = {p for p, v in res.items() if not v["ok"]}
+        for r1, r2 in pairs:
+            if r1 in bad and res[r1]["error"].startswith("R1/R2"):
+                self.log(self.fastp_output_text, f"[Integridade] ERRO: {os.path.basename(r1)} / {os.path.basename(r2)}: {res[r1]['error']}\n")
+        self.log(self.fastp_output_text, f"[Integridade] {len(files) - len(bad)} ok, {len(bad)} com problema.\n")
+        return bad
+
+    # ===============================
+    # Triagem Kraken2
+    # ===============================
+    def _kraken_prepare(self) -> bool:
+        """Valida banco/ferramenta e, se pedido e couber, pré-aquece o banco no page cache. False = etapa desligada."""
+        if not self.kraken_enabled.get():
+            return False
+        if self.only_report.get():
+            self.log(self.fastp_output_text, "[Kraken2] Ignorado: modo 'Somente relatório' não gera FASTQ limpo.\n")
+            return False
+        db = self.kraken_db.get().strip()
+        if not _kraken_db_ok(db):
+            self.log(self.fastp_output_text, f"[Kraken2] Banco inválido (faltam {', '.join(KRAKEN_DB_FILES)}): {db or '—'}\n")
+            return False
+        if not self.tool_exists("kraken2"):
+            self.log(self.fastp_output_text, "[Kraken2] 'kraken2' não encontrado no ambiente; etapa desligada.\n")
+            return False
+        KRAKEN_DIR.mkdir(parents=True, exist_ok=True)
+        self.log(self.fastp_output_text, f"[Kraken2] Banco {db} (memory-mapped, compartilhado pelo lote).\n")
+        if self.kraken_preload.get():
+            why = _kraken_preload_check(db)
+            if why:
+                self.log(self.fastp_output_text, f"[Kraken2] Pré-carregamento ignorado: {why}.\n")
+            else:
+                threading.Thread(target=_warm_kraken_db, args=(db,), daemon=True).start()
+                self.log(self.fastp_output_text, "[Kraken2] Pré-carregando o banco no page cache.\n")
+        return True
+
+    def _kraken_screen(self, key, outs, run_and_stream):
+        """Classifica uma subamostra do FASTQ limpo e registra o resumo ao lado das métricas do fastp."""
+        n = max(1000, int(self.kraken_reads.get() or 0))
+        subs = [str(KRAKEN_DIR / f".{key}_sub_{i + 1}.fastq") for i in range(len(outs))]
+        report = KRAKEN_DIR / f"{key}_kraken2_report.txt"
+        try:
+            got = _head_fastq(outs, subs, n)
+            parts = ["kraken2", "--db", self.kraken_db.get().strip(), "--memory-mapping",
+                     "--threads", str(self.threads.get()),
+                     "--confidence", str(self.kraken_confidence.get()),
+                     "--report", str(report), "--output", "/dev/null"]
+            if len(subs) == 2:
+                parts.append("--paired")
+            parts += subs
+            cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
+            self.log(self.fastp_output_text, f"[Kraken2] {key}: {got} leitura(s) na subamostra.\n")
+            ret = run_and_stream(cmd, f"[{key}] [kraken2] ", {"tool": "kraken2", "sample": key, "inputs": subs})
+        except OSError as e:
+            self.log(self.fastp_output_text, f"[Kraken2] {key}: erro ao subamostrar: {e}\n")
+            return
+        finally:
+            for p in subs:
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+        if ret != 0 or not report.exists():
+            if not self.stop_requested:
+                self.log(self.fastp_output_text, f"[Kraken2] {key}: falhou (código {ret}).\n")
+            return
+        row = {"sample": key, "screened_reads": got}
+        row.update(_fastp_metrics(_abs(f"{key}_fastp_report.json")))
+        row.update(_parse_kraken_report(report, self.kraken_target.get()))
+        _append_kraken_summary(row)
+        self.log(self.fastp_output_text,
+                 f"[{key}] fastp: {row.get('reads_after_fastp', '?')} leituras, Q30 {row.get('q30_after_fastp', '?')}% | "
+                 f"Kraken2: {row['target']} {row['target_pct']:.2f}% (classificadas {row['classified_pct']}%)"
+                 f"{' | contaminantes: ' + row['top_contaminants'] if row['top_contaminants'] else ''}\n")
+
+    # ===============================
+    # fastp em shards (amostra muito grande)
+    # ===============================
+    def _shard_plan(self, inputs) -> int:
+        """Nº de shards para a amostra (0 = fastp único)."""
+        try:
+            n, min_gb = int(self.shard_count.get()), float(self.shard_min_gb.get())
+        except (tk.TclError, ValueError):
+            return 0
+        if n < 2 or sum(os.path.getsize(p) for p in inputs if os.path.exists(p)) < min_gb * 1e9:
+            return 0
+        if not hasattr(os, "mkfifo"):
+            self.log(self.fastp_output_text, "[Shards] Indisponível neste sistema (sem FIFO): fastp único.\n")
+            return 0
+        if self.split_files.get() or self.split_by_lines.get():
+            self.log(self.fastp_output_text, "[Shards] Ignorado: split de saída (-s/-S) ativo.\n")
+            return 0
+        return n
+
+    def _shard_adapters(self, base, inputs, work, pe, tag):
+        """
+        --stdin desliga a auto-detecção de adaptadores: detecta nas primeiras leituras (fastp
+        normal, só JSON) e devolve a linha de comando com -a/--adapter_sequence_r2 explícitos.
+        """
+        if "-A" in base:
+            return base
+        a = base[base.index("-a") + 1] if "-a" in base else "auto"
+        if a == "auto":
+            base = _set_fastp_option(base, "-a", None)
+        if not ((not pe and a == "auto") or (pe and "--detect_adapter_for_pe" in base)):
+            return base
+        heads = [str(work / f"adapters_R{i + 1}.fastq") for i in range(len(inputs))]
+        jsn = work / "adapters.json"
+        parts = [str(jsn) if p == "{json}" else str(work / "adapters.html") if p == "{html}" else p for p in base]
+        parts += ["-i", heads[0]] + (["-I", heads[1]] if pe else [])
+        try:
+            _head_fastq(inputs, heads, SHARD_ADAPTER_READS)
+            subprocess.run(self.activate_env_command(" ".join(shlex.quote(p) for p in parts)), shell=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with open(jsn) as fh:
+                cut = json.load(fh).get("adapter_cutting", {})
+        except (OSError, ValueError):
+            cut = {}
+        finally:
+            for h in heads:
+                if os.path.exists(h):
+                    os.remove(h)
+        found = []
+        for opt, field in (("-a", "read1_adapter_sequence"), ("--adapter_sequence_r2", "read2_adapter_sequence")):
+            seq = str(cut.get(field) or "")
+            if len(seq) >= 6 and set(seq) <= set("ACGTN"):
+                base = _set_fastp_option(base, opt, seq)
+                found.append(f"{'R1' if opt == '-a' else 'R2'}={seq}")
+        if found:
+            base = _set_fastp_option(base, "--detect_adapter_for_pe", False)
+        self.log(self.fastp_output_text, tag + (f"adaptadores detectados nas primeiras {SHARD_ADAPTER_READS:,} leituras: "
+                                                + ", ".join(found) if found else
+                                                "nenhum adaptador detectado (PE ainda corta por sobreposição)") + "\n")
+        return base
+
+    def _fastp_sharded(self, inputs, outs, key, n, max_runtime, idle_timeout) -> int:
+        """
+        Roda a amostra em n fastp --stdin alimentados por FIFOs (ver "fastp em shards");
+        saídas e relatórios nos mesmos caminhos do fastp único. Retorna 0 se tudo deu certo.
+        """
+        log = self.fastp_output_text
+        pe = len(inputs) == 2
+        only_report = self.only_report.get()
+        report_html, report_json = _abs(f"{key}_fastp_report.html"), _abs(f"{key}_fastp_report.json")
+        tag = f"[{key}] [shards] "
+        if self.dont_overwrite.get() and not only_report and any(os.path.exists(o) for o in outs):
+            self.log(log, f"{tag}saída já existe (--dont_overwrite): amostra pulada.\n")
+            return 1
+        per = max(1, int(self.threads.get()) // n)
+        work = OUT_DIR / f"{key}_shards"
+        shards = []
+        try:
+            shutil.rmtree(work, ignore_errors=True)
+            work.mkdir(parents=True)
+            self.log(log, f"{tag}{n} processos fastp com -w {per} (entrada fatiada em blocos de registros).\n")
+            base = _set_fastp_option(self._build_common_fastp_parts("{html}", "{json}"), "-w", per)
+            base = self._shard_adapters(base, inputs, work, pe, tag)
+            base += ["--stdin"] + (["--interleaved_in"] if pe else [])
+            for k in range(1, n + 1):
+                stem = work / f"shard{k:02d}"
+                parts = [f"{stem}.json" if p == "{json}" else f"{stem}.html" if p == "{html}" else p for p in base]
+                sh_outs = [] if only_report else [f"{stem}_R{i + 1}.fastq.gz" for i in range(len(outs))]
+                if sh_outs:
+                    parts += ["-o", sh_outs[0]] + (["-O", sh_outs[1]] if pe else []) + ["--failed_out", "/dev/null"]
+                fifo = f"{stem}.fifo"
+                os.mkfifo(fifo)
+                shards.append({"k": k, "stem": stem, "outs": sh_outs, "fifo": fifo, "proc": None, "timer": None,
+                               "cmd": self.activate_env_command(" ".join(shlex.quote(p) for p in parts) + " < " + shlex.quote(fifo)),
+                               "prefix": f"[{key}] [shard {k}/{n}] "})
+                shards[-1]["policy"] = exec_policy("fastp", per)
+        except OSError as e:   # disco cheio, sem permissão, FS sem suporte a FIFO...
+            self.log(log, f"{tag}ERRO ao preparar os shards em {work}: {e}\n")
+            for sh in shards:
+                if "policy" in sh:
+                    sh["policy"].release()
+                try:
+                    os.remove(sh["fifo"])
+                except OSError:
+                    pass
+            return 1
+        self.log(log, f"{tag}{shards[0]['cmd']}\n")
+
+        timer = RunTimer()
+        abort = threading.Event()
+        errors = []
+        for sh in shards:
+            pol = sh["policy"]
+            try:
+                sh["timer"] = RunTimer()
+                proc = sh["proc"] = subprocess.Popen(pol.wrap(sh["cmd"]), shell=True, stdout=subprocess.PIPE,
+                                                     stderr=subprocess.STDOUT, start_new_session=True)
+            except OSError as e:
+                errors.append(f"shard {sh['k']}: {e}")
+                abort.set()
+                break
+            pol.started(proc)
+            w = sh["watch"] = watchdog().watch(proc, max_runtime, idle_timeout,
+                                               on_event=lambda t, p=sh["prefix"]: self.log(log, p + t))
+            self.shard_watches.add(w)
+            sh["eof"] = output_mux().register(proc.stdout, sh["prefix"], lambda text, w=w: (w.touch(), self.log(log, text)))
+        started = [sh for sh in shards if sh["proc"]]
+        self.log(log, f"{tag}[política] {' | '.join(dict.fromkeys(sh['policy'].summary() for sh in shards))}\n")
+
+        # Escritores: um por shard, todos consumindo a mesma fila (shard livre pega o próximo bloco)
+        work_q = Queue(maxsize=SHARD_QUEUE * n)
+
+        def feed(sh):
+            fd = None
+            while fd is None and not abort.is_set() and not proc_exited(sh["proc"]):
+                try:
+                    fd = os.open(sh["fifo"], os.O_WRONLY | os.O_NONBLOCK)
+                except OSError as e:
+                    if e.errno != errno.ENXIO:   # ENXIO: o fastp ainda não abriu o FIFO
+                        errors.append(f"shard {sh['k']}: {e}")
+                        abort.set()
+                        break
+                    time.sleep(0.1)
+            out = None
+            if fd is not None:
+                os.set_blocking(fd, True)
+                out = os.fdopen(fd, "wb")
+            elif not abort.is_set():
+                errors.append(f"shard {sh['k']}: o fastp terminou antes de ler a entrada")
+                abort.set()
+            while True:
+                block = work_q.get()
+                if block is None:
+                    break
+                if out is None:
+                    continue
+                try:
+                    out.write(block)
+                    sh["watch"].touch()
+                except OSError as e:   # fastp morreu (EPIPE)
+                    errors.append(f"shard {sh['k']}: {e.strerror or e}")
+                    abort.set()
+                    try:
+                        out.close()
+                    except OSError:
+                        pass
+                    out = None
+            if out is not None:
+                try:
+                    out.close()   # EOF para o fastp
+                except OSError:
+                    pass
+
+        writers = [threading.Thread(target=feed, args=(sh,), name=f"shard-{sh['k']}", daemon=True) for sh in started]
+        for t in writers:
+            t.start()
+        blocks = 0
+        gen = _shard_blocks(inputs, abort)
+        try:
+            for block in gen:
+                while not abort.is_set():
+                    if self.stop_requested:
+                        abort.set()
+                        break
+                    try:
+                        work_q.put(block, timeout=0.5)
+                        blocks += 1
+                        break
+                    except Full:
+                        pass
+                if abort.is_set():
+                    break
+        except Exception as e:   # gzip corrompido, registro truncado, R1/R2 com nº de registros diferente
+            errors.append(str(e))
+            abort.set()
+        finally:
+            gen.close()
+            if abort.is_set():
+                # shards que receberam EOF parcial não podem terminar como "ok"
+                for sh in started:
+                    watchdog().cancel(sh["watch"], "stopped" if self.stop_requested else "failed")
+            for _ in writers:
+                work_q.put(None)
+        for t in writers:
+            t.join()
+
+        rets = []
+        for sh in shards:
+            if sh["proc"] is not None:
+                while not sh["eof"].wait(0.5):
+                    if sh["watch"].reason and not sh["watch"].alive():
+                        break
+                sh["watch"].settle()
+                rets.append(sh["timer"].finish(sh["proc"]))
+                self.shard_watches.discard(sh["watch"])
+            else:
+                rets.append(-1)
+            sh["policy"].release()
+            os.remove(sh["fifo"])
+        reason = "stopped" if self.stop_requested else next((sh["watch"].reason for sh in started if sh["watch"].reason), None)
+        ok = not errors and not abort.is_set() and all(r == 0 for r in rets)
+
+        if ok:
+            try:
+                reports = []
+                for sh in shards:
+                    with open(f"{sh['stem']}.json") as fh:
+                        reports.append(json.load(fh))
+                merged = _merge_fastp_reports(reports)
+                with open(report_json, "w") as fh:
+                    json.dump(merged, fh, indent=2)
+                with open(report_html, "w") as fh:
+                    fh.write(_shard_report_html(merged, key, [f"{sh['stem']}.html" for sh in shards]))
+                for i, dest in enumerate(outs if not only_report else []):
+                    _concat_files([sh["outs"][i] for sh in shards], dest)
+            except (OSError, ValueError, KeyError) as e:
+                errors.append(f"combinação dos shards: {e}")
+                ok = False
+
+        # Uma linha no histórico para a amostra toda (CPU somada, pico = maior shard)
+        timer.wall_s = round(time.monotonic() - timer.t0, 2)
+        timer.cpu_s = round(sum(sh["timer"].cpu_s or 0 for sh in started), 2)
+        timer.peak_rss_mb = max((sh["timer"].peak_rss_mb or 0 for sh in started), default=None) or None
+        timer.returncode = 0 if ok else next((r for r in rets if r), 1)
+        self._ledger_run({"tool": "fastp", "sample": key, "inputs": inputs, "json": report_json},
+                         f"{shards[0]['cmd']}  # x{n} shards", timer, reason,
+                         " | ".join(dict.fromkeys(sh["policy"].summary() for sh in shards)), shards=n)
+        if self.stop_requested:
+            self.log(log, "[Interrompido pelo usuário]\n")
+        else:
+            for e in errors:
+                self.log(log, f"{tag}ERRO: {e}\n")
+        if ok:
+            self.log(log, f"{tag}concluído em {fmt_duration(timer.wall_s)} ({blocks} blocos); saídas concatenadas "
+                          f"e relatório somado em {report_json} (por shard: {work}).\n")
+        return timer.returncode
+
+    def _log_batch_eta(self, preds):
+        known = [p for p in preds if p]
+        if not known:
+            return
+        total = sum(p["wall_s"] for p in known)
+        msg = f"[Previsão] fastp do lote: ~{fmt_duration(total)} (término ~{time.strftime('%H:%M', time.localtime(time.time() + total))})"
+        if len(known) < len(preds):
+            msg += f"; {len(preds) - len(known)} amostra(s) sem histórico"
+        self.log(self.fastp_output_text, msg + ".\n")
+
+    def _ledger_run(self, info, cmd, timer, reason, policy=None, shards=0):
+        """Grava uma execução (fastp/kraken2) no histórico compartilhado nb_runs.sqlite (policy = resumo)."""
+        bases = _fastp_metrics(info["json"]).get("bases_before_fastp") if info.get("json") and timer.returncode == 0 else None
+        params = {"threads": self.threads.get(), "only_report": self.only_report.get()}
+        if shards:
+            params["shards"] = shards
+        ledger_record(
+            app="pre-process", tool=info["tool"], sample=info["sample"], argv=cmd, params=params,
+            input_bytes=sum(os.path.getsize(p) for p in info["inputs"] if os.path.exists(p)),
+            input_bases=bases, threads=int(self.threads.get()),
+            status="ok" if timer.returncode == 0 else (reason or "failed"),
+            policy=policy, **timer.row())
+
+    # ===============================
+    # Varredura de parâmetros (subamostra)
+    # ===============================
+    def open_sweep_window(self):
+        files = list(self.fastp_file_listbox.get(0, tk.END))
+        sel = [files[i] for i in self.fastp_file_listbox.curselection()]
+        if not files:
+            messagebox.showinfo("Varredura", "Nenhum arquivo na lista.")
+            return
+        win = tk.Toplevel(self)
+        win.title("Varredura de parâmetros do fastp")
+        win.geometry("1200x640")
+        top = ttk.Frame(win)
+        top.pack(fill="x", padx=8, pady=6)
+        top.columnconfigure(1, weight=1)
+        ttk.Label(top, text="Grade (opção: valores)").grid(row=0, column=0, sticky="nw")
+        grid_txt = tk.Text(top, height=5, width=50)
+        grid_txt.insert("1.0", "-q: 15, 20, 25\n-l: 30, 50\n-r: on, off\n")
+        grid_txt.grid(row=0, column=1, rowspan=4, sticky="ew", padx=4)
+        v_reads = tk.IntVar(value=200000)
+        v_jobs = tk.IntVar(value=max(1, (os.cpu_count() or 2) // 2))
+        v_threads = tk.IntVar(value=2)
+        for r, (label, var) in enumerate((("Leituras/pares por amostra", v_reads),
+                                          ("Execuções em paralelo", v_jobs), ("Threads por execução (-w)", v_threads))):
+            ttk.Label(top, text=label).grid(row=r, column=2, sticky="w", padx=4)
+            ttk.Entry(top, textvariable=var, width=9).grid(row=r, column=3, sticky="w")
+        status = tk.StringVar(value=f"{len(sel) or len(files)} arquivo(s) ({'selecionados' if sel else 'toda a lista'}).")
+        ttk.Label(top, textvariable=status).grid(row=3, column=2, columnspan=2, sticky="w", padx=4)
+
+        cols = ["samples"] + SWEEP_FIELDS
+        heads = ["Amostras", "% leituras", "% bases", "%Q30", "GC%", "Compr. médio", "% baixa qual.",
+                 "% curtas", "% N", "% c/ adaptador", "% duplicação"]
+        fr = ttk.Frame(win)
+        fr.pack(fill="both", expand=True, padx=8, pady=6)
+        tv = ttk.Treeview(fr, columns=cols)
+        tv.heading("#0", text="Combinação / amostra")
+        tv.column("#0", width=280)
+        for c, h in zip(cols, heads):
+            tv.heading(c, text=h, command=lambda c=c: self._sweep_sort(tv, c))
+            tv.column(c, width=85, anchor="center")
+        sb = ttk.Scrollbar(fr, orient="vertical", command=tv.yview)
+        tv.configure(yscrollcommand=sb.set)
+        tv.pack(side="left", fill="both", expand=True)
+        sb.pack(side="right", fill="y")
+
+        def start():
+            if self.sweep_running:
+                messagebox.showwarning("Varredura", "Já existe uma varredura em execução.", parent=win)
+                return
+            try:
+                grid = _parse_sweep_grid(grid_txt.get("1.0", "end"))
+                n, jobs, threads = int(v_reads.get()), int(v_jobs.get()), int(v_threads.get())
+            except (ValueError, tk.TclError) as e:
+                messagebox.showerror("Varredura", str(e), parent=win)
+                return
+            if not grid:
+                messagebox.showerror("Varredura", "Grade vazia.", parent=win)
+                return
+            if self.only_report.get():
+                messagebox.showerror("Varredura", "Desmarque 'Somente relatório': os filtros ficam desligados.", parent=win)
+                return
+            n_combos = 1
+            for _, vals in grid:
+                n_combos *= len(vals)
+            if n_combos > SWEEP_MAX_COMBOS:
+                messagebox.showerror("Varredura", f"{n_combos} combinações (máx. {SWEEP_MAX_COMBOS}).", parent=win)
+                return
+            tv.delete(*tv.get_children())
+            self.sweep_running, self.sweep_stop = True, False
+            args = (sel or files, grid, max(1000, n), max(1, jobs), max(1, threads), tv, status)
+            threading.Thread(target=self._run_sweep, args=args, daemon=True).start()
+
+        btns = ttk.Frame(top)
+        btns.grid(row=4, column=1, sticky="w", pady=(6, 0))
+        ttk.Button(btns, text="Rodar varredura", command=start).pack(side="left")
+        ttk.Button(btns, text="Parar", command=self.stop_sweep).pack(side="left", padx=6)
+
+    def stop_sweep(self):
+        self.sweep_stop = True
+        for w in list(self.sweep_watches):
+            watchdog().cancel(w, "stopped")
+
+    def _run_sweep(self, files, grid, n_reads, jobs, threads, tv, status):
+        try:
+            self._sweep(files, grid, n_reads, jobs, threads, tv, status)
+        except Exception as e:
+            self._ui(status.set, f"Erro: {e}")
+            self.log(self.fastp_output_text, f"[Varredura] Erro inesperado: {e}\n")
+        finally:
+            self.sweep_running = False
+
+    def _sweep(self, files, grid, n_reads, jobs, threads, tv, status):
+        mode = (self.seq_mode.get() or "PE").upper()
+        if mode == "PE":
+            samples = [(key, [r1, r2]) for r1, r2, key in self._detect_pairs(files)[0]]
+        else:
+            samples = [(re.sub(r"\.(fastq|fq)(\.gz)?$", "", os.path.basename(f), flags=re.IGNORECASE), [f]) for f in files]
+        if not samples:
+            self._ui(status.set, "Nenhuma amostra (no modo PE, selecione R1 e R2).")
+            return
+        run_dir = SWEEP_DIR / time.strftime("sweep_%Y%m%d_%H%M%S")
+        sub_dir = run_dir / "subsample"
+        sub_dir.mkdir(parents=True, exist_ok=True)
+
+        # 1) Mesma subamostra para todas as combinações (primeiras N leituras/pares)
+        self._ui(status.set, f"Subamostrando {len(samples)} amostra(s) ({n_reads} leituras)…")
+        subs = {key: [str(sub_dir / f"{key}_{i + 1}.fastq") for i in range(len(srcs))] for key, srcs in samples}
+        with ThreadPoolExecutor(max_workers=min(jobs, len(samples))) as ex:
+            got = {key: k for (key, _), k in zip(samples, ex.map(lambda ks: _head_fastq(ks[1], subs[ks[0]], n_reads), samples))}
+
+        # 2) Linha de comando base = parâmetros da tela, sem saídas/split, -w da varredura
+        base = self._build_common_fastp_parts("{html}", "{json}")
+        for opt in ("-s", "-S", "-d"):
+            base = _set_fastp_option(base, opt, None)
+        base = _set_fastp_option(base, "-w", threads)
+        combos = [tuple(zip([o for o, _ in grid], vals)) for vals in itertools.product(*[v for _, v in grid])]
+        tasks = [(ci, key) for ci in range(len(combos)) for key, _ in samples]
+        self.log(self.fastp_output_text,
+                 f"[Varredura] {len(combos)} combinação(ões) × {len(samples)} amostra(s) = {len(tasks)} execuções "
+                 f"({jobs} em paralelo, -w {threads}) em {run_dir}\n")
+
+        def run_one(task):
+            ci, key = task
+            if self.sweep_stop:
+                return task, None, "parado"
+            parts = base
+            for opt, val in combos[ci]:
+                parts = _set_fastp_option(parts, opt, val)
+            stem = run_dir / f"c{ci + 1:03d}_{key}"
+            parts = [str(stem) + ".json" if p == "{json}" else str(stem) + ".html" if p == "{html}" else p for p in parts]
+            parts += ["-i", subs[key][0]] + (["-I", subs[key][1]] if len(subs[key]) == 2 else [])
+            cmd = self.activate_env_command(" ".join(shlex.quote(p) for p in parts))
+            policy = exec_policy("fastp", threads)
+            with open(str(stem) + ".log", "wb") as log:
+                try:
+                    proc = subprocess.Popen(policy.wrap(cmd), shell=True, stdout=log, stderr=subprocess.STDOUT,
+                                            start_new_session=True)
+                    w = watchdog().watch(proc)
+                    self.sweep_watches.add(w)
+                    try:
+                        ret = proc.wait()
+                    finally:
+                        self.sweep_watches.discard(w)
+                finally:
+                    policy.release()
+            if ret != 0:
+                return task, None, "parado" if w.reason else f"código {ret} (ver {stem.name}.log)"
+            try:
+                return task, _sweep_metrics(str(stem) + ".json"), ""
+            except (OSError, ValueError, KeyError) as e:
+                return task, None, f"JSON inválido: {e}"
+
+        # 3) Execuções em paralelo; a tabela é preenchida conforme terminam
+        results, done = {}, 0
+        with ThreadPoolExecutor(max_workers=jobs) as ex:
+            for fut in as_completed([ex.submit(run_one, t) for t in tasks]):
+                (ci, key), m, err = fut.result()
+                done += 1
+                if err and err != "parado":
+                    self.log(self.fastp_output_text, f"[Varredura] {_sweep_label(combos[ci])} [{key}]: {err}\n")
+                if m:
+                    results.setdefault(ci, {})[key] = m
+                self._ui(status.set, f"{done}/{len(tasks)} execuções concluídas…")
+
+        # 4) Tabela: média por combinação (linhas filhas = amostras) + TSV
+        table = run_dir / "sweep_metrics.tsv"
+        with open(table, "w", newline="") as fh:
+            wr = csv.writer(fh, delimiter="\t")
+            wr.writerow(["combination", "sample", "subsample_reads"] + SWEEP_FIELDS)
+            for ci, per in sorted(results.items()):
+                for key, m in per.items():
+                    wr.writerow([_sweep_label(combos[ci]), key, got[key]] + [m[f] for f in SWEEP_FIELDS])
+        self._ui(self._sweep_show, tv, combos, results)
+        shutil.rmtree(sub_dir, ignore_errors=True)
+        msg = f"{'Interrompida' if self.sweep_stop else 'Concluída'}: {sum(map(len, results.values()))}/{len(tasks)} ok; tabela em {table}"
+        self._ui(status.set, msg)
+        self.log(self.fastp_output_text, f"[Varredura] {msg}\n")
+
+    def _sweep_show(self, tv, combos, results):
+        if not tv.winfo_exists():
+            return
+        for ci, per in sorted(results.items()):
+            avg = {f: round(sum(m[f] for m in per.values()) / len(per), 2) for f in SWEEP_FIELDS}
+            iid = tv.insert("", "end", text=_sweep_label(combos[ci]), values=[len(per)] + [avg[f] for f in SWEEP_FIELDS])
+            for key, m in per.items():
+                tv.insert(iid, "end", text=key, values=[""] + [m[f] for f in SWEEP_FIELDS])
+
+    def _sweep_sort(self, tv, col):
+        """Ordena as combinações pela coluna (clique de novo inverte)."""
+        desc = getattr(tv, "_sort", None) == (col, False)
+        rows = [(float(tv.set(i, col) or 0), i) for i in tv.get_children("")]
+        for pos, (_, i) in enumerate(sorted(rows, reverse=desc)):
+            tv.move(i, "", pos)
+        tv._sort = (col, desc)
+
     def stop_fastp(self):
         self.stop_requested = True
-        if self.current_proc and self.current_proc.poll() is None:
-            try:
-                if hasattr(os, "setsid"):
-                    os.killpg(os.getpgid(self.current_proc.pid), signal.SIGTERM)
-                else:
-                    self.current_proc.terminate()
-            except Exception:
-                pass
+        watchdog().cancel(self.current_watch, "stopped")
+        for w in list(self.shard_watches):
+            watchdog().cancel(w, "stopped")
 
     def run_multiqc_thread(self):
         def target():
@@ -749,8 +2080,13 @@ class App(tk.Tk):
         cmd = self.activate_env_command(
             f"multiqc -f -o {shlex.quote(str(outdir))} {shlex.quote(str(outdir))}"
         )
-        self.log(self.fastp_output_text, f"[MultiQC] Executando em: {outdir}\n")
-        proc = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        policy = exec_policy("multiqc")
+        self.log(self.fastp_output_text, f"[MultiQC] Executando em: {outdir} [política] {policy.summary()}\n")
+        try:
+            proc = subprocess.run(policy.wrap(cmd), shell=True, capture_output=True, text=True,
+                                  start_new_session=True)
+        finally:
+            policy.release()
         if proc.stdout: self.log(self.fastp_output_text, proc.stdout)
         if proc.stderr: self.log(self.fastp_output_text, proc.stderr)
         if proc.returncode == 0:
@@ -788,7 +2124,49 @@ class App(tk.Tk):
             "• Cortes por qualidade (-5/-3/-r com -W/-M), trimming global (-f/-t/-b/-F/-T/-B),\n"
             "• Filtros (-q/-u/-n, -l, --length_limit), adapters (-a/--adapter_sequence_r2, --detect_adapter_for_pe),\n"
             "• Correção por overlap (-c), Relatórios HTML/JSON (-h/-j).\n\n"
-            "Modo 'Somente relatório' desativa trims/filtros (-A -Q -L -G) e não grava FASTQ."
+            "Modo 'Somente relatório' desativa trims/filtros (-A -Q -L -G) e não grava FASTQ.\n\n"
+            "Salvar preset p/ pipeline: grava os parâmetros atuais em fastp_output/fastp_pipeline_preset.json;\n"
+            "o modo pipeline do app de montagem (fastp -> montagem -> QC) passa a usá-los.\n\n"
+            "Pré-visualizar: lê só as primeiras N leituras de cada arquivo da lista (vários em paralelo) e\n"
+            "mostra comprimento, codificação de qualidade, Q média, %Q30, GC% e bases totais estimadas\n"
+            "(extrapoladas pelo tamanho do arquivo; '~' = estimativa). Registro incompleto ou gzip corrompido\n"
+            "no trecho lido aparece como TRUNCADO.\n\n"
+            "Verificar integridade (gzip): descomprime cada arquivo por inteiro (vários processos em paralelo),\n"
+            "valida CRC/tamanho de cada membro gzip e compara o nº de registros de R1 e R2. O veredicto fica\n"
+            "em cache (caminho + tamanho + data): cada arquivo é verificado uma vez. Com 'Verificar gzip/pares\n"
+            "antes de rodar', arquivos com problema saem do lote antes do fastp.\n\n"
+            "Histórico de execuções: cada fastp/kraken2 grava em nb_runs.sqlite (compartilhado com o app de\n"
+            "montagem) amostra, comando completo, bytes/bases de entrada, tempo, CPU, pico de memória, código de\n"
+            "saída e host; a aba Tendências mostra Gb/h por ferramenta/host/mês (base para comparar opções).\n"
+            "Previsão: com histórico neste host, o log mostra o tempo previsto do lote e de cada amostra\n"
+            "(regressão pelo tamanho dos arquivos e threads) e avisa quando uma amostra passa muito do previsto.\n\n"
+            "Políticas de execução: por ferramenta (fastp, kraken2, multiqc…) define CPUs ('0-7', 'numa:0' ou\n"
+            "'numa:auto'), nice e ionice ('idle' ou 'be:0-7'), para que jobs simultâneos dos dois apps não\n"
+            "disputem cache/disco nem travem a interface; CPU/memória máximas usam cgroup v2 quando há delegação\n"
+            "(NB_CGROUP_ROOT ou systemd-run --user). Ficam em nb_exec_policies.json; o aplicado aparece no log\n"
+            "([política]) e na coluna Política do histórico.\n\n"
+            "Shards: amostras com entrada acima do limite (GB, R1+R2 comprimidos) rodam em N fastp simultâneos\n"
+            "(-w dividido entre eles). O app lê os FASTQ uma vez em blocos alinhados por registro (pares R1/R2\n"
+            "juntos, intercalados) e reparte por FIFOs (--stdin); as saídas .gz de cada shard são concatenadas\n"
+            "sem recompressão e os JSON/HTML somados no relatório da amostra (os de cada shard ficam em\n"
+            "<amostra>_shards/). A ordem das leituras muda, mas os pares continuam alinhados. Adaptador\n"
+            "automático é detectado antes numa amostra do início e fixado em todos os shards. Não combina com\n"
+            "split de saída (-s/-S).\n\n"
+            "Varredura de parâmetros: grade com uma opção por linha ('-q: 15,20,25', '-l: 30,50', '-r: on,off';\n"
+            "nomes longos também valem). Todas as combinações rodam em paralelo (N execuções com -w pequeno)\n"
+            "sobre as mesmas primeiras N leituras/pares das amostras selecionadas na lista (ou de todas); o resto\n"
+            "dos parâmetros vem da tela. A tabela compara % de leituras/bases mantidas, %Q30, GC, comprimento\n"
+            "médio, motivos de descarte, adaptadores e duplicação (média por combinação; clique na coluna para\n"
+            "ordenar) e fica em fastp_sweep/sweep_<data>/sweep_metrics.tsv com os JSON/logs de cada execução.\n\n"
+            "Kraken2 (opcional): após o fastp de cada amostra, classifica as primeiras N leituras/pares do\n"
+            "FASTQ limpo com --memory-mapping (o banco fica no page cache e é reaproveitado pelo lote todo).\n"
+            "'Pré-carregar banco' (opcional) lê o banco antecipadamente só se ele couber em metade da RAM\n"
+            "disponível; bancos maiores expulsariam do cache os dados dos outros processos da máquina.\n"
+            "Resumo por amostra (reads/Q30 do fastp, % da espécie alvo e principais contaminantes) no log e em\n"
+            "kraken2_output/kraken2_summary.tsv; relatório completo em kraken2_output/<amostra>_kraken2_report.txt.\n\n"
+            "Watchdog: 'Tempo máx./amostra' e 'Sem saída por' (minutos, 0 = desligado) encerram a amostra\n"
+            "que exceder o limite e seguem para a próxima. Parar envia SIGTERM ao fastp na hora e SIGKILL\n"
+            "se ele não sair em 15 s."
         )
         win = tk.Toplevel(self)
         win.title("Ajuda - fastp")
@@ -11,7 +11,7 @@ APT_MIN_PKGS=(curl ca-certificates bzip2 xz-utils)
 CONDA_CHANNELS=(-c conda-forge -c bioconda)
 
 # Inclui setuptools/pip/wheel para evitar hooks que dependem de pkg_resources (ex.: checkm)
-CORE_PKGS=(python=3.11 tk mamba setuptools pip wheel fastp fastqc multiqc)
+CORE_PKGS=(python=3.11 tk numpy mamba setuptools pip wheel fastp fastqc multiqc kraken2)
 ASSEMBLY_PKGS=(spades unicycler quast)
 
 RUN_SPADES_TEST="${RUN_SPADES_TEST:-0}"